@@ -0,0 +1,128 @@
+import hashlib
+import os
+import pathlib
+
+import numpy as np
+
+
+def content_hash(*items):
+    """
+
+    Args:
+        items: ndarray or str or bytes or number, the contents to be hashed in order
+
+    Returns:
+        key: str, hex digest which changes whenever any item, its shape or its dtype changes
+
+    """
+    h = hashlib.sha1()
+    for item in items:
+        if isinstance(item, np.ndarray):
+            item = np.ascontiguousarray(item)
+            h.update('{}{}'.format(item.dtype.str, item.shape).encode())
+            h.update(item.tobytes())
+        elif isinstance(item, bytes):
+            h.update(item)
+        else:
+            h.update(repr(item).encode())
+        h.update(b'|')
+    return h.hexdigest()
+
+
+class DiskCache(object):
+    """
+    a directory of files keyed by content hashes, the least recently used files are removed
+    when the total size exceeds max_bytes. it can be shared by several processes, a file removed
+    by another process is simply a cache miss.
+    """
+
+    def __init__(self, cache_dir, max_bytes=1 << 30, suffix='.npy'):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = sum(self._file_sizes().values())
+
+    def _path(self, key):
+        return self.cache_dir / (key + self.suffix)
+
+    def _file_sizes(self):
+        sizes = {}
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(self.suffix):
+                try:
+                    sizes[entry.path] = entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return sizes
+
+    def _replace(self, tmp_path, path):
+        # an overwritten file no longer counts towards the total size
+        try:
+            old_size = path.stat().st_size
+        except FileNotFoundError:
+            old_size = 0
+        os.replace(tmp_path, path)
+        self.total_bytes += path.stat().st_size - old_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def load_bytes(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # the modification time records the last use
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def save_bytes(self, key, data):
+        path = self._path(key)
+        tmp_path = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        self._replace(tmp_path, path)
+
+    def load_array(self, key):
+        path = self._path(key)
+        try:
+            array = np.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return array
+
+    def save_array(self, key, array):
+        path = self._path(key)
+        tmp_path = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        self._replace(tmp_path, path)
+
+    def evict(self):
+        """remove the least recently used files until the total size is below 90% of max_bytes"""
+        sizes = self._file_sizes()
+        paths = []
+        for path in sizes:
+            try:
+                paths.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                pass
+        paths.sort()
+        self.total_bytes = sum(sizes.values())
+        for _, path in paths:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= sizes[path]
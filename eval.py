@@ -1,7 +1,31 @@
+import json
+
 import numba
 import numpy as np
 
-from rotate_iou import rotate_iou_gpu_eval
+from rotate_iou import rotate_iou_gpu_eval, rotate_iou_cpu_eval_pairs
+from disk_cache import DiskCache, content_hash
+from spatial_index import bev_box_aabbs, grid_candidate_pairs
+
+CLASS_NAMES = ['car', 'pedestrian', 'cyclist', 'van', 'person_sitting', 'truck']
+
+# MIN_HEIGHT = [40, 25, 25]
+# MAX_OCCLUSION = [0, 1, 2]
+# MAX_TRUNCATION = [0.15, 0.3, 0.5]
+
+MIN_DISTANCE = [0, 10, 20, 30, 40, 50, 60, 70]
+MAX_DISTANCE = [10, 20, 30, 40, 50, 60, 70, 80]
+
+# bump it whenever a change of the evaluation changes its results, so that cached results are not reused
+RESULT_CACHE_VERSION = 2
+
+# the status of objects in match records
+MATCH_STATUS = ['tp', 'fn', 'fp', 'ignored', 'dontcare', 'below_threshold']
+MATCH_TP, MATCH_FN, MATCH_FP, MATCH_IGNORED, MATCH_DONTCARE, MATCH_BELOW_THRESHOLD = range(len(MATCH_STATUS))
+# why an object in match records is ignored, a neighbor class or another difficulty bin of the ground truth object,
+# or another class of the detection, the assigned objects share the reason
+IGNORED_REASONS = ['none', 'neighbor_class', 'other_bin', 'other_class']
+IGNORED_NONE, IGNORED_NEIGHBOR_CLASS, IGNORED_OTHER_BIN, IGNORED_OTHER_CLASS = range(len(IGNORED_REASONS))
 
 
 def get_split_parts(num_sample, num_part):
@@ -26,37 +50,62 @@ def get_split_parts(num_sample, num_part):
         return [same_part] * num_part + [remain_num]
 
 
-@numba.jit
+@numba.jit(nopython=True)
 def get_thresholds(scores: np.ndarray, num_gt, num_sample_pt=41):
     """
 
     Args:
-        scores: ndarray of float, [num_tp], scores of true positive detections
+        scores: ndarray of float, [num_tp], scores of true positive detections, not modified
         num_gt: int, the number of valid ground truth objects
         num_sample_pt: int
 
     Returns:
-        thresholds: list of float, sampled scores, the maximum length of which is num_sample_pt
+        thresholds: ndarray of float, sampled scores in descending order, the maximum length of which is num_sample_pt
 
     """
-    scores.sort()
-    scores = scores[::-1]
-    current_recall = 0
-    thresholds = []
-    for i, score in enumerate(scores):
+    scores = np.sort(scores)[::-1]
+    num_score = scores.shape[0]
+    current_recall = 0.0
+    thresholds = np.zeros((num_score, ), dtype=np.float64)
+    num_thresh = 0
+    for i in range(num_score):
         l_recall = (i + 1) / num_gt
-        if i < (len(scores) - 1):
+        if i < (num_score - 1):
             r_recall = (i + 2) / num_gt
         else:
             r_recall = l_recall
-        if r_recall - current_recall < current_recall - l_recall and i < len(scores) - 1:
+        if r_recall - current_recall < current_recall - l_recall and i < num_score - 1:
             continue
-        thresholds.append(score)
+        thresholds[num_thresh] = scores[i]
+        num_thresh += 1
         current_recall += 1 / (num_sample_pt - 1.0)
-    return thresholds
+    return thresholds[:num_thresh]
+
+
+@numba.jit(nopython=True, nogil=True)
+def _image_box_pair_overlap(boxes, n, query_boxes, k, criterion):
+    """the overlap of boxes[n] and query_boxes[k], xyxy format"""
+    iw = (min(boxes[n, 2], query_boxes[k, 2]) -
+          max(boxes[n, 0], query_boxes[k, 0]))
+    if iw > 0:
+        ih = (min(boxes[n, 3], query_boxes[k, 3]) -
+              max(boxes[n, 1], query_boxes[k, 1]))
+        if ih > 0:
+            qbox_area = ((query_boxes[k, 2] - query_boxes[k, 0]) *
+                         (query_boxes[k, 3] - query_boxes[k, 1]))
+            if criterion == -1:
+                ua = (boxes[n, 2] - boxes[n, 0]) * (boxes[n, 3] - boxes[n, 1]) + qbox_area - iw * ih
+            elif criterion == 0:
+                ua = (boxes[n, 2] - boxes[n, 0]) * (boxes[n, 3] - boxes[n, 1])
+            elif criterion == 1:
+                ua = qbox_area
+            else:
+                ua = 1.0
+            return iw * ih / ua
+    return 0.0
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, parallel=True, nogil=True)
 def image_box_overlap(boxes, query_boxes, criterion=-1):
     """
 
@@ -72,28 +121,46 @@ def image_box_overlap(boxes, query_boxes, criterion=-1):
     N = boxes.shape[0]
     K = query_boxes.shape[0]
     overlaps = np.zeros((N, K), dtype=boxes.dtype)
-    for k in range(K):
-        qbox_area = ((query_boxes[k, 2] - query_boxes[k, 0]) *
-                     (query_boxes[k, 3] - query_boxes[k, 1]))
-        for n in range(N):
-            iw = (min(boxes[n, 2], query_boxes[k, 2]) -
-                  max(boxes[n, 0], query_boxes[k, 0]))
-            if iw > 0:
-                ih = (min(boxes[n, 3], query_boxes[k, 3]) -
-                      max(boxes[n, 1], query_boxes[k, 1]))
-                if ih > 0:
-                    if criterion == -1:
-                        ua = (boxes[n, 2] - boxes[n, 0]) * (boxes[n, 3] - boxes[n, 1]) + qbox_area - iw * ih
-                    elif criterion == 0:
-                        ua = (boxes[n, 2] - boxes[n, 0]) * (boxes[n, 3] - boxes[n, 1])
-                    elif criterion == 1:
-                        ua = qbox_area
-                    else:
-                        ua = 1.0
-                    overlaps[n, k] = iw * ih / ua
+    for n in numba.prange(N):
+        for k in range(K):
+            overlaps[n, k] = _image_box_pair_overlap(boxes, n, query_boxes, k, criterion)
     return overlaps
 
 
+@numba.jit(nopython=True, parallel=True, nogil=True)
+def dontcare_overlaps(dt_bboxes, dontcares, dt_offsets, dc_offsets):
+    """
+    the overlaps of the detections with the DontCare regions of every sample over the areas of the detections,
+    computed once for all classes, metrics and thresholds.
+
+    Args:
+        dt_bboxes: ndarray of float, [num_dt, 4], xyxy format
+        dontcares: ndarray of float, [num_dc, 4], xyxy format
+        dt_offsets: ndarray of int, [num_sample + 1]
+        dc_offsets: ndarray of int, [num_sample + 1]
+
+    Returns:
+        overlaps: ndarray of float, [num_dc_overlap], the [dt_num, dc_num] blocks of the samples one after another
+        offsets: ndarray of int, [num_sample + 1], the block of sample i starts at offsets[i]
+
+    """
+    num_sample = dt_offsets.shape[0] - 1
+    offsets = _sample_offsets((dt_offsets[1:] - dt_offsets[:-1]) * (dc_offsets[1:] - dc_offsets[:-1]))
+    overlaps = np.zeros((offsets[-1], ), dtype=dt_bboxes.dtype)
+    for i in numba.prange(num_sample):
+        dc_num = dc_offsets[i + 1] - dc_offsets[i]
+        for n in range(dt_offsets[i], dt_offsets[i + 1]):
+            for k in range(dc_offsets[i], dc_offsets[i + 1]):
+                overlaps[offsets[i] + (n - dt_offsets[i]) * dc_num + k - dc_offsets[i]] = _image_box_pair_overlap(
+                    dt_bboxes, n, dontcares, k, 0)
+    return overlaps, offsets
+
+
+@numba.jit(nopython=True)
+def _dontcare_block(dc_overlaps, start, dt_num, dc_num):
+    return dc_overlaps[start:start + dt_num * dc_num].reshape((dt_num, dc_num))
+
+
 def bev_box_overlap(boxes, qboxes, criterion=-1):
     """
 
@@ -110,12 +177,12 @@ def bev_box_overlap(boxes, qboxes, criterion=-1):
     return riou
 
 
-@numba.jit(nopython=True, parallel=True)
+@numba.jit(nopython=True, parallel=True, nogil=True)
 def d3_box_overlap_kernel(boxes, qboxes, rinc, criterion=-1):
     # only support overlap in the camera coordinates, not the lider coordinates.
     N = boxes.shape[0]
     K = qboxes.shape[0]
-    for i in range(N):
+    for i in numba.prange(N):
         for j in range(K):
             if rinc[i, j] > 0:
                 iw = (min(boxes[i, 1], qboxes[j, 1]) - max(
@@ -138,6 +205,46 @@ def d3_box_overlap_kernel(boxes, qboxes, rinc, criterion=-1):
                     rinc[i, j] = 0.0
 
 
+@numba.jit(nopython=True, parallel=True, nogil=True)
+def image_box_overlap_pairs(boxes, query_boxes, rows, cols, criterion=-1):
+    """
+
+    Args:
+        boxes: ndarray of float, [N, 4], xyxy format
+        query_boxes: ndarray of float, [K, 4], xyxy format
+        rows: ndarray of int, [num_pair], indices of boxes
+        cols: ndarray of int, [num_pair], indices of query_boxes
+        criterion: the calculation type of the union area
+
+    Returns:
+        overlaps: ndarray of float, [num_pair], the same as image_box_overlap(boxes, query_boxes)[rows, cols]
+
+    """
+    num_pair = rows.shape[0]
+    overlaps = np.zeros((num_pair, ), dtype=boxes.dtype)
+    for p in numba.prange(num_pair):
+        overlaps[p] = _image_box_pair_overlap(boxes, rows[p], query_boxes, cols[p], criterion)
+    return overlaps
+
+
+def bev_box_overlap_pairs(boxes, qboxes, rows, cols, criterion=-1):
+    """
+
+    Args:
+        boxes: ndarray of float, [N, 5], centers, dims, angles (clockwise when positive)
+        qboxes: ndarray of float, [K, 5], centers, dims, angles (clockwise when positive)
+        rows: ndarray of int, [num_pair], indices of boxes
+        cols: ndarray of int, [num_pair], indices of qboxes
+        criterion:
+
+    Returns:
+        riou: ndarray of float, [num_pair], the same as bev_box_overlap(boxes, qboxes)[rows, cols]
+
+    """
+    riou = rotate_iou_cpu_eval_pairs(boxes, qboxes, rows, cols, criterion)
+    return riou
+
+
 def d3_box_overlap(boxes, qboxes, criterion=-1):
     """
 
@@ -156,9 +263,57 @@ def d3_box_overlap(boxes, qboxes, criterion=-1):
     return rinc
 
 
+@numba.jit(nopython=True, parallel=True, nogil=True)
+def d3_box_overlap_pairs_kernel(boxes, qboxes, rows, cols, rinc, criterion=-1):
+    # only support overlap in the camera coordinates, not the lider coordinates.
+    for p in numba.prange(rows.shape[0]):
+        i = rows[p]
+        j = cols[p]
+        if rinc[p] > 0:
+            iw = (min(boxes[i, 1], qboxes[j, 1]) - max(
+                boxes[i, 1] - boxes[i, 4], qboxes[j, 1] - qboxes[j, 4]))
+
+            if iw > 0:
+                area1 = boxes[i, 3] * boxes[i, 4] * boxes[i, 5]
+                area2 = qboxes[j, 3] * qboxes[j, 4] * qboxes[j, 5]
+                inc = iw * rinc[p]
+                if criterion == -1:
+                    ua = (area1 + area2 - inc)
+                elif criterion == 0:
+                    ua = area1
+                elif criterion == 1:
+                    ua = area2
+                else:
+                    ua = inc
+                rinc[p] = inc / ua
+            else:
+                rinc[p] = 0.0
+
+
+def d3_box_overlap_pairs(boxes, qboxes, rows, cols, criterion=-1):
+    """
+
+    Args:
+        boxes: ndarray of float, [N, 7], centers, dims, angles
+        qboxes: ndarray of float, [K, 7], centers, dims, angles
+        rows: ndarray of int, [num_pair], indices of boxes
+        cols: ndarray of int, [num_pair], indices of qboxes
+        criterion:
+
+    Returns:
+        rinc: ndarray of float, [num_pair], the same as d3_box_overlap(boxes, qboxes)[rows, cols]
+
+    """
+    rinc = rotate_iou_cpu_eval_pairs(boxes[:, [0, 2, 3, 5, 6]],
+                                     qboxes[:, [0, 2, 3, 5, 6]], rows, cols, 2)
+    d3_box_overlap_pairs_kernel(boxes, qboxes, rows, cols, rinc, criterion)
+    return rinc
+
+
 @numba.jit(nopython=True)
-def compute_statistics_jit(overlaps, gt_datas, dt_datas, ignored_gt, ignored_dt, dc_bboxes,
-                           metric, min_overlap, score_thresh=0.0, compute_fp=False, compute_aos=False):
+def compute_statistics_jit(overlaps, gt_datas, dt_datas, ignored_gt, ignored_dt, dc_overlaps,
+                           metric, min_overlap, score_thresh=0.0, compute_fp=False, compute_aos=False,
+                           gt_matches=None, dt_matches=None):
     """
 
     Args:
@@ -167,12 +322,17 @@ def compute_statistics_jit(overlaps, gt_datas, dt_datas, ignored_gt, ignored_dt,
         dt_datas: ndarray of float, [num_dt, 6], bboxes, alphas, scores
         ignored_gt: ndarray of int, [num_gt], 0: not ignored, 1: ignored, -1: unknown
         ignored_dt: ndarray of int, [num_dt], 0: not ignored, 1: ignored, -1: unknown
-        dc_bboxes: ndarray of float, [num_dc, 4]
+        dc_overlaps: ndarray of float, [num_dt, num_dc], the overlaps of the detections with the DontCare regions
+            over the areas of the detections, from dontcare_overlaps()
         metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
         min_overlap: float
         score_thresh: float
         compute_fp: bool
         compute_aos: bool
+        gt_matches: ndarray of int, [num_gt], output, the detection assigned to each ground truth object,
+            untouched when not assigned, None: not recorded
+        dt_matches: ndarray of int, [num_dt], output, the ground truth object assigned to each detection,
+            -2: in a DontCare region, untouched when not assigned, None: not recorded
 
     Returns:
         tp: int, the number of true positive detections
@@ -187,7 +347,6 @@ def compute_statistics_jit(overlaps, gt_datas, dt_datas, ignored_gt, ignored_dt,
 
     gt_alphas = gt_datas[:, 4]
     dt_alphas = dt_datas[:, 4]
-    dt_bboxes = dt_datas[:, :4]
     dt_scores = dt_datas[:, -1]
 
     assigned_detection = [False] * dt_size
@@ -246,24 +405,30 @@ def compute_statistics_jit(overlaps, gt_datas, dt_datas, ignored_gt, ignored_dt,
                 delta[delta_idx] = gt_alphas[i] - dt_alphas[det_idx]
                 delta_idx += 1
             assigned_detection[det_idx] = True
+        if valid_detection != NO_DETECTION:
+            if gt_matches is not None:
+                gt_matches[i] = det_idx
+            if dt_matches is not None:
+                dt_matches[det_idx] = i
     if compute_fp:
         for i in range(dt_size):
             if not (assigned_detection[i] or ignored_dt[i] == -1 or ignored_dt[i] == 1 or ignored_threshold[i]):
                 fp += 1
         nstuff = 0
         if metric == 0:
-            overlaps_dt_dc = image_box_overlap(dt_bboxes, dc_bboxes, 0)
             for i in range(dt_size):
-                for j in range(dc_bboxes.shape[0]):
+                for j in range(dc_overlaps.shape[1]):
                     if assigned_detection[i]:
                         continue
                     if ignored_dt[i] == -1 or ignored_dt[i] == 1:
                         continue
                     if ignored_threshold[i]:
                         continue
-                    if overlaps_dt_dc[i, j] > min_overlap:
+                    if dc_overlaps[i, j] > min_overlap:
                         assigned_detection[i] = True
                         nstuff += 1
+                        if dt_matches is not None:
+                            dt_matches[i] = -2
         fp -= nstuff
         if compute_aos:
             tmp = np.zeros((fp + delta_idx, ))
@@ -277,25 +442,55 @@ def compute_statistics_jit(overlaps, gt_datas, dt_datas, ignored_gt, ignored_dt,
 
 
 @numba.jit(nopython=True)
-def fused_compute_statistics(overlaps, pr, gt_nums, dt_nums, dc_nums, gt_datas, dt_datas, dontcares,
-                             ignored_gts, ignored_dts, metric, min_overlap, thresholds, compute_aos=False):
+def _record_matches(overlap, gt_data, dt_data, ignored_gt, ignored_dt, dontcare, metric, min_overlap,
+                    thresholds, num_threshold, compute_aos, gt_matches, gt_ious, dt_matches):
+    """
+    the last matching of fused_compute_statistics() for one sample and one min_overlap, which also records the
+    assignments, at 0.0 when there are no thresholds.
+
+    Returns:
+        tp, fp, fn, similarity: the same as compute_statistics_jit()
+
+    """
+    score_thresh = thresholds[num_threshold - 1] if num_threshold > 0 else 0.0
+    tp, fp, fn, similarity, _ = compute_statistics_jit(
+        overlap, gt_data, dt_data, ignored_gt, ignored_dt, dontcare, metric, min_overlap=min_overlap,
+        score_thresh=score_thresh, compute_fp=True, compute_aos=compute_aos, gt_matches=gt_matches,
+        dt_matches=dt_matches)
+    for i in range(gt_matches.shape[0]):
+        if gt_matches[i] >= 0:
+            gt_ious[i] = overlap[i, gt_matches[i]]
+    return tp, fp, fn, similarity
+
+
+@numba.jit(nopython=True)
+def fused_compute_statistics(overlaps, pr, gt_nums, dt_nums, dc_nums, gt_datas, dt_datas, dc_overlaps,
+                             ignored_gts, ignored_dts, metric, min_overlaps, thresholds, num_thresholds,
+                             compute_aos=False, gt_matches=None, gt_ious=None, dt_matches=None):
     """
 
     Args:
         overlaps: ndarray of float, [num_gt_per_part, num_dt_per_part]
-        pr: ndarray of int, [about 41, 4], all zeros
+        pr: ndarray of int, [num_minoverlap, about 41, 4], all zeros
         gt_nums: ndarray of int, [parted_num]
         dt_nums: ndarray of int, [parted_num]
         dc_nums: ndarray of int, [parted_num]
         gt_datas: ndarray of float, [num_gt_per_part, 5], bboxes, alphas
         dt_datas: ndarray of float, [num_dt_per_part, 6], bboxes, alphas, scores
-        dontcares: ndarray of float, [num_dc_per_part, 4]
+        dc_overlaps: ndarray of float, [num_dc_overlap_per_part], from dontcare_overlaps(), a [dt_num, dc_num]
+            block for each sample
         ignored_gts: ndarray of int, [num_gt_per_part], 0: not ignored, 1: ignored, -1: unknown
         ignored_dts: ndarray of int, [num_gt_per_part], 0: not ignored, 1: ignored, -1: unknown
         metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
-        min_overlap: float
-        thresholds: ndarray of float, [about 41], about 41 scores of true positive detections
+        min_overlaps: ndarray of float, [num_minoverlap], all of them are evaluated in this pass
+        thresholds: ndarray of float, [num_minoverlap, about 41], about 41 scores of true positive detections
+        num_thresholds: ndarray of int, [num_minoverlap], the number of valid thresholds of each min_overlap
         compute_aos: bool
+        gt_matches: ndarray of int, [num_minoverlap, num_gt_per_part], output, all -1, the detection in the sample
+            assigned to each ground truth object at the last threshold (0.0 without thresholds), None: not recorded
+        gt_ious: ndarray of float, [num_minoverlap, num_gt_per_part], output, the overlaps of gt_matches
+        dt_matches: ndarray of int, [num_minoverlap, num_dt_per_part], output, all -1, the ground truth object
+            in the sample assigned to each detection, -2: in a DontCare region
 
     Returns:
 
@@ -304,36 +499,433 @@ def fused_compute_statistics(overlaps, pr, gt_nums, dt_nums, dc_nums, gt_datas,
     dt_num = 0
     dc_num = 0
     for i in range(gt_nums.shape[0]):
-        for t, score_thresh in enumerate(thresholds):
-            overlap = overlaps[gt_num:gt_num + gt_nums[i], dt_num:dt_num + dt_nums[i]]
-            gt_data = gt_datas[gt_num:gt_num + gt_nums[i]]
-            dt_data = dt_datas[dt_num:dt_num + dt_nums[i]]
-            ignored_gt = ignored_gts[gt_num:gt_num + gt_nums[i]]
-            ignored_dt = ignored_dts[dt_num:dt_num + dt_nums[i]]
-            dontcare = dontcares[dc_num:dc_num + dc_nums[i]]
-            tp, fp, fn, similarity, _ = compute_statistics_jit(
-                overlap,
-                gt_data,
-                dt_data,
-                ignored_gt,
-                ignored_dt,
-                dontcare,
+        overlap = overlaps[gt_num:gt_num + gt_nums[i], dt_num:dt_num + dt_nums[i]]
+        gt_data = gt_datas[gt_num:gt_num + gt_nums[i]]
+        dt_data = dt_datas[dt_num:dt_num + dt_nums[i]]
+        ignored_gt = ignored_gts[gt_num:gt_num + gt_nums[i]]
+        ignored_dt = ignored_dts[dt_num:dt_num + dt_nums[i]]
+        dontcare = _dontcare_block(dc_overlaps, dc_num, dt_nums[i], dc_nums[i])
+        for k in range(min_overlaps.shape[0]):
+            num_threshold = num_thresholds[k]
+            if gt_matches is not None:
+                # the last threshold is matched below together with recording the assignments
+                num_threshold = max(num_thresholds[k] - 1, 0)
+            for t in range(num_threshold):
+                tp, fp, fn, similarity, _ = compute_statistics_jit(
+                    overlap,
+                    gt_data,
+                    dt_data,
+                    ignored_gt,
+                    ignored_dt,
+                    dontcare,
+                    metric,
+                    min_overlap=min_overlaps[k],
+                    score_thresh=thresholds[k, t],
+                    compute_fp=True,
+                    compute_aos=compute_aos)
+                pr[k, t, 0] += tp
+                pr[k, t, 1] += fp
+                pr[k, t, 2] += fn
+                if similarity != -1:
+                    pr[k, t, 3] += similarity
+            if gt_matches is not None:
+                tp, fp, fn, similarity = _record_matches(
+                    overlap, gt_data, dt_data, ignored_gt, ignored_dt, dontcare, metric, min_overlaps[k],
+                    thresholds[k], num_thresholds[k], compute_aos, gt_matches[k, gt_num:gt_num + gt_nums[i]],
+                    gt_ious[k, gt_num:gt_num + gt_nums[i]], dt_matches[k, dt_num:dt_num + dt_nums[i]])
+                if num_thresholds[k] > 0:
+                    pr[k, num_thresholds[k] - 1, 0] += tp
+                    pr[k, num_thresholds[k] - 1, 1] += fp
+                    pr[k, num_thresholds[k] - 1, 2] += fn
+                    if similarity != -1:
+                        pr[k, num_thresholds[k] - 1, 3] += similarity
+        gt_num += gt_nums[i]
+        dt_num += dt_nums[i]
+        dc_num += dt_nums[i] * dc_nums[i]
+
+
+@numba.jit(nopython=True)
+def _sample_offsets(nums):
+    offsets = np.zeros((nums.shape[0] + 1, ), dtype=np.int64)
+    for i in range(nums.shape[0]):
+        offsets[i + 1] = offsets[i] + nums[i]
+    return offsets
+
+
+@numba.jit(nopython=True)
+def _compact_thresholds(scores, tp_offsets, tp_nums):
+    thresholds = np.zeros((np.sum(tp_nums), ), dtype=np.float64)
+    thresh_idx = 0
+    for i in range(tp_nums.shape[0]):
+        thresholds[thresh_idx:thresh_idx + tp_nums[i]] = scores[tp_offsets[i]:tp_offsets[i] + tp_nums[i]]
+        thresh_idx += tp_nums[i]
+    return thresholds
+
+
+@numba.jit(nopython=True)
+def _compact_overlap_thresholds(scores, tp_offsets, tp_nums):
+    """
+
+    Args:
+        scores: ndarray of float, [num_minoverlap, num_gt_per_part], scores of true positive detections of each sample
+            from tp_offsets
+        tp_offsets: ndarray of int, [parted_num + 1]
+        tp_nums: ndarray of int, [num_minoverlap, parted_num]
+
+    Returns:
+        thresholds: ndarray of float, [num_tp_per_part], sorted by min_overlaps then samples
+        num_tps: ndarray of int, [num_minoverlap]
+
+    """
+    num_tps = np.zeros((tp_nums.shape[0], ), dtype=np.int64)
+    thresholds = np.zeros((np.sum(tp_nums), ), dtype=np.float64)
+    thresh_idx = 0
+    for k in range(tp_nums.shape[0]):
+        num_tps[k] = np.sum(tp_nums[k])
+        thresholds[thresh_idx:thresh_idx + num_tps[k]] = _compact_thresholds(scores[k], tp_offsets, tp_nums[k])
+        thresh_idx += num_tps[k]
+    return thresholds, num_tps
+
+
+@numba.jit(nopython=True, parallel=True)
+def fused_collect_thresholds(overlaps, gt_nums, dt_nums, dc_nums, gt_datas, dt_datas, dc_overlaps,
+                             ignored_gts, ignored_dts, metric, min_overlaps):
+    """
+    the first pass of eval_class for all samples of a part and all min_overlaps in one call, the same as calling
+    compute_statistics_jit() with compute_fp=False for each sample and concatenating the scores of true positive
+    detections.
+
+    Args:
+        overlaps: ndarray of float, [num_gt_per_part, num_dt_per_part]
+        gt_nums: ndarray of int, [parted_num]
+        dt_nums: ndarray of int, [parted_num]
+        dc_nums: ndarray of int, [parted_num]
+        gt_datas: ndarray of float, [num_gt_per_part, 5], bboxes, alphas
+        dt_datas: ndarray of float, [num_dt_per_part, 6], bboxes, alphas, scores
+        dc_overlaps: ndarray of float, [num_dc_overlap_per_part], from dontcare_overlaps(), a [dt_num, dc_num]
+            block for each sample
+        ignored_gts: ndarray of int, [num_gt_per_part], 0: not ignored, 1: ignored, -1: unknown
+        ignored_dts: ndarray of int, [num_gt_per_part], 0: not ignored, 1: ignored, -1: unknown
+        metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
+        min_overlaps: ndarray of float, [num_minoverlap]
+
+    Returns:
+        thresholds: ndarray of float, [num_tp_per_part], scores of true positive detections in the order of
+            min_overlaps then samples
+        num_tps: ndarray of int, [num_minoverlap], the number of true positive detections of each min_overlap
+
+    """
+    gt_offsets = _sample_offsets(gt_nums)
+    dt_offsets = _sample_offsets(dt_nums)
+    dc_offsets = _sample_offsets(dt_nums * dc_nums)
+    # a true positive detection is always assigned to a valid ground truth object
+    tp_nums = np.zeros((min_overlaps.shape[0], gt_nums.shape[0]), dtype=np.int64)
+    scores = np.zeros((min_overlaps.shape[0], gt_offsets[-1]), dtype=np.float64)
+    for i in numba.prange(gt_nums.shape[0]):
+        gt_start, gt_end = gt_offsets[i], gt_offsets[i + 1]
+        dt_start, dt_end = dt_offsets[i], dt_offsets[i + 1]
+        for k in range(min_overlaps.shape[0]):
+            _, _, _, _, thresholds = compute_statistics_jit(
+                overlaps[gt_start:gt_end, dt_start:dt_end],
+                gt_datas[gt_start:gt_end],
+                dt_datas[dt_start:dt_end],
+                ignored_gts[gt_start:gt_end],
+                ignored_dts[dt_start:dt_end],
+                _dontcare_block(dc_overlaps, dc_offsets[i], dt_nums[i], dc_nums[i]),
                 metric,
-                min_overlap=min_overlap,
-                score_thresh=score_thresh,
-                compute_fp=True,
-                compute_aos=compute_aos)
-            pr[t, 0] += tp
-            pr[t, 1] += fp
-            pr[t, 2] += fn
-            if similarity != -1:
-                pr[t, 3] += similarity
+                min_overlap=min_overlaps[k],
+                score_thresh=0.0,
+                compute_fp=False)
+            tp_nums[k, i] = thresholds.shape[0]
+            scores[k, gt_start:gt_start + tp_nums[k, i]] = thresholds
+    return _compact_overlap_thresholds(scores, gt_offsets, tp_nums)
+
+
+@numba.jit(nopython=True)
+def sparse_frame_overlap(rows, cols, vals, pair_start, pair_num, gt_start, dt_start, gt_num, dt_num):
+    """
+    scatter the sparse overlaps of one sample into a dense matrix.
+
+    Args:
+        rows: ndarray of int, [num_pair_per_part], indices of ground truth objects in the part
+        cols: ndarray of int, [num_pair_per_part], indices of detected objects in the part
+        vals: ndarray of float, [num_pair_per_part], overlaps
+        pair_start: int, the index of the first pair of the sample
+        pair_num: int, the number of pairs of the sample
+        gt_start: int, the index of the first ground truth object of the sample in the part
+        dt_start: int, the index of the first detected object of the sample in the part
+        gt_num: int, the number of ground truth objects of the sample
+        dt_num: int, the number of detected objects of the sample
+
+    Returns:
+        overlap: ndarray of float, [num_gt_per_sample, num_dt_per_sample]
+
+    """
+    overlap = np.zeros((gt_num, dt_num), dtype=vals.dtype)
+    for p in range(pair_start, pair_start + pair_num):
+        overlap[rows[p] - gt_start, cols[p] - dt_start] = vals[p]
+    return overlap
+
+
+@numba.jit(nopython=True)
+def dense_to_sparse_overlaps(overlaps, gt_nums, dt_nums):
+    """
+    keep only the nonzero overlaps inside the blocks of the samples of a part, zero overlaps never pass any
+    min_overlap so the statistics do not change.
+
+    Args:
+        overlaps: ndarray of float, [num_gt_per_part, num_dt_per_part]
+        gt_nums: ndarray of int, [parted_num]
+        dt_nums: ndarray of int, [parted_num]
+
+    Returns:
+        pair_nums: ndarray of int, [parted_num], the number of nonzero pairs per sample
+        rows: ndarray of int32, [num_pair_per_part], indices of ground truth objects, sorted by rows then cols
+        cols: ndarray of int32, [num_pair_per_part], indices of detected objects
+        vals: ndarray of float, [num_pair_per_part], overlaps, the same dtype as overlaps
+
+    """
+    gt_offsets = _sample_offsets(gt_nums)
+    dt_offsets = _sample_offsets(dt_nums)
+    pair_nums = np.zeros((gt_nums.shape[0], ), dtype=np.int64)
+    for n in range(gt_nums.shape[0]):
+        for i in range(gt_offsets[n], gt_offsets[n + 1]):
+            for j in range(dt_offsets[n], dt_offsets[n + 1]):
+                if overlaps[i, j] != 0:
+                    pair_nums[n] += 1
+    num_pair = np.sum(pair_nums)
+    # indices inside a part always fit in int32
+    rows = np.zeros((num_pair, ), dtype=np.int32)
+    cols = np.zeros((num_pair, ), dtype=np.int32)
+    vals = np.zeros((num_pair, ), dtype=overlaps.dtype)
+    p = 0
+    for n in range(gt_nums.shape[0]):
+        for i in range(gt_offsets[n], gt_offsets[n + 1]):
+            for j in range(dt_offsets[n], dt_offsets[n + 1]):
+                if overlaps[i, j] != 0:
+                    rows[p] = i
+                    cols[p] = j
+                    vals[p] = overlaps[i, j]
+                    p += 1
+    return pair_nums, rows, cols, vals
+
+
+@numba.jit(nopython=True)
+def fused_compute_statistics_sparse(pair_nums, rows, cols, vals, pr, gt_nums, dt_nums, dc_nums, gt_datas, dt_datas,
+                                    dc_overlaps, ignored_gts, ignored_dts, metric, min_overlaps, thresholds,
+                                    num_thresholds, compute_aos=False, gt_matches=None, gt_ious=None,
+                                    dt_matches=None):
+    """
+    the same as fused_compute_statistics, but the overlaps of the part are in the sparse (COO) format.
+
+    Args:
+        pair_nums: ndarray of int, [parted_num], the number of overlap pairs per sample
+        rows: ndarray of int, [num_pair_per_part], indices of ground truth objects, sorted by rows then cols
+        cols: ndarray of int, [num_pair_per_part], indices of detected objects
+        vals: ndarray of float, [num_pair_per_part], overlaps
+        others: the same as fused_compute_statistics
+
+    Returns:
+
+    """
+    gt_num = 0
+    dt_num = 0
+    dc_num = 0
+    pair_num = 0
+    for i in range(gt_nums.shape[0]):
+        overlap = sparse_frame_overlap(rows, cols, vals, pair_num, pair_nums[i], gt_num, dt_num,
+                                       gt_nums[i], dt_nums[i])
+        gt_data = gt_datas[gt_num:gt_num + gt_nums[i]]
+        dt_data = dt_datas[dt_num:dt_num + dt_nums[i]]
+        ignored_gt = ignored_gts[gt_num:gt_num + gt_nums[i]]
+        ignored_dt = ignored_dts[dt_num:dt_num + dt_nums[i]]
+        dontcare = _dontcare_block(dc_overlaps, dc_num, dt_nums[i], dc_nums[i])
+        for k in range(min_overlaps.shape[0]):
+            num_threshold = num_thresholds[k]
+            if gt_matches is not None:
+                # the last threshold is matched below together with recording the assignments
+                num_threshold = max(num_thresholds[k] - 1, 0)
+            for t in range(num_threshold):
+                tp, fp, fn, similarity, _ = compute_statistics_jit(
+                    overlap,
+                    gt_data,
+                    dt_data,
+                    ignored_gt,
+                    ignored_dt,
+                    dontcare,
+                    metric,
+                    min_overlap=min_overlaps[k],
+                    score_thresh=thresholds[k, t],
+                    compute_fp=True,
+                    compute_aos=compute_aos)
+                pr[k, t, 0] += tp
+                pr[k, t, 1] += fp
+                pr[k, t, 2] += fn
+                if similarity != -1:
+                    pr[k, t, 3] += similarity
+            if gt_matches is not None:
+                tp, fp, fn, similarity = _record_matches(
+                    overlap, gt_data, dt_data, ignored_gt, ignored_dt, dontcare, metric, min_overlaps[k],
+                    thresholds[k], num_thresholds[k], compute_aos, gt_matches[k, gt_num:gt_num + gt_nums[i]],
+                    gt_ious[k, gt_num:gt_num + gt_nums[i]], dt_matches[k, dt_num:dt_num + dt_nums[i]])
+                if num_thresholds[k] > 0:
+                    pr[k, num_thresholds[k] - 1, 0] += tp
+                    pr[k, num_thresholds[k] - 1, 1] += fp
+                    pr[k, num_thresholds[k] - 1, 2] += fn
+                    if similarity != -1:
+                        pr[k, num_thresholds[k] - 1, 3] += similarity
         gt_num += gt_nums[i]
         dt_num += dt_nums[i]
-        dc_num += dc_nums[i]
+        dc_num += dt_nums[i] * dc_nums[i]
+        pair_num += pair_nums[i]
+
+
+@numba.jit(nopython=True, parallel=True)
+def fused_collect_thresholds_sparse(pair_nums, rows, cols, vals, gt_nums, dt_nums, dc_nums, gt_datas, dt_datas,
+                                    dc_overlaps, ignored_gts, ignored_dts, metric, min_overlaps):
+    """
+    the same as fused_collect_thresholds, but the overlaps of the part are in the sparse (COO) format.
+
+    Args:
+        pair_nums: ndarray of int, [parted_num], the number of overlap pairs per sample
+        rows: ndarray of int, [num_pair_per_part], indices of ground truth objects, sorted by rows then cols
+        cols: ndarray of int, [num_pair_per_part], indices of detected objects
+        vals: ndarray of float, [num_pair_per_part], overlaps
+        others: the same as fused_collect_thresholds
+
+    Returns:
+        the same as fused_collect_thresholds
+
+    """
+    gt_offsets = _sample_offsets(gt_nums)
+    dt_offsets = _sample_offsets(dt_nums)
+    dc_offsets = _sample_offsets(dt_nums * dc_nums)
+    pair_offsets = _sample_offsets(pair_nums)
+    tp_nums = np.zeros((min_overlaps.shape[0], gt_nums.shape[0]), dtype=np.int64)
+    scores = np.zeros((min_overlaps.shape[0], gt_offsets[-1]), dtype=np.float64)
+    for i in numba.prange(gt_nums.shape[0]):
+        gt_start, gt_end = gt_offsets[i], gt_offsets[i + 1]
+        dt_start, dt_end = dt_offsets[i], dt_offsets[i + 1]
+        overlap = sparse_frame_overlap(rows, cols, vals, pair_offsets[i], pair_nums[i], gt_start, dt_start,
+                                       gt_nums[i], dt_nums[i])
+        for k in range(min_overlaps.shape[0]):
+            _, _, _, _, thresholds = compute_statistics_jit(
+                overlap,
+                gt_datas[gt_start:gt_end],
+                dt_datas[dt_start:dt_end],
+                ignored_gts[gt_start:gt_end],
+                ignored_dts[dt_start:dt_end],
+                _dontcare_block(dc_overlaps, dc_offsets[i], dt_nums[i], dc_nums[i]),
+                metric,
+                min_overlap=min_overlaps[k],
+                score_thresh=0.0,
+                compute_fp=False)
+            tp_nums[k, i] = thresholds.shape[0]
+            scores[k, gt_start:gt_start + tp_nums[k, i]] = thresholds
+    return _compact_overlap_thresholds(scores, gt_offsets, tp_nums)
+
+
+def _get_part_boxes(annos_part, metric):
+    """
+
+    Args:
+        annos_part: list of dict, must from get_label_annos() in kitti_common.py
+        metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
+
+    Returns:
+        boxes: ndarray of float, [N, 4] bboxes for bbox, [N, 5] for bev, [N, 7] for 3d
+
+    """
+    if metric == 0:
+        boxes = np.concatenate([a["bbox"] for a in annos_part], 0)
+    elif metric == 1:
+        loc = np.concatenate([a["location"][:, [0, 2]] for a in annos_part], 0)
+        dims = np.concatenate([a["dimensions"][:, [0, 2]] for a in annos_part], 0)
+        rots = np.concatenate([a["rotation_y"] for a in annos_part], 0)
+        boxes = np.concatenate(
+            [loc, dims, rots[..., np.newaxis]], axis=1)
+    elif metric == 2:
+        loc = np.concatenate([a["location"] for a in annos_part], 0)
+        dims = np.concatenate([a["dimensions"] for a in annos_part], 0)
+        rots = np.concatenate([a["rotation_y"] for a in annos_part], 0)
+        boxes = np.concatenate(
+            [loc, dims, rots[..., np.newaxis]], axis=1)
+    else:
+        raise ValueError("unknown metric")
+    return boxes
+
+
+def _box_overlap(gt_boxes, dt_boxes, metric):
+    """
+
+    Args:
+        gt_boxes: ndarray of float, [N, 4] or [N, 5] or [N, 7], from _get_part_boxes()
+        dt_boxes: ndarray of float, [K, 4] or [K, 5] or [K, 7], from _get_part_boxes()
+        metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
+
+    Returns:
+        overlaps: ndarray of float, [N, K], float64 for bbox, float32 as calculated by the rotated iou kernel
+            for bev and 3d, which the statistics kernels take without a lossless but twice as large upcast
+
+    """
+    if metric == 0:
+        return image_box_overlap(gt_boxes, dt_boxes)
+    elif metric == 1:
+        return bev_box_overlap(gt_boxes, dt_boxes)
+    else:
+        return d3_box_overlap(gt_boxes, dt_boxes)
 
 
-def calculate_iou_partly(gt_annos, dt_annos, metric, num_part=50):
+def _cached_box_overlap(gt_boxes, dt_boxes, gt_nums, dt_nums, metric, overlap_cache):
+    """
+    the same as _box_overlap() for the samples of a part, but the overlaps of each sample are looked up
+    in overlap_cache by the content hash of its boxes, and only the missing samples are calculated.
+    overlaps between different samples are never used and are left zeros.
+
+    Args:
+        gt_boxes: ndarray of float, [num_gt_per_part, 4] or [num_gt_per_part, 5] or [num_gt_per_part, 7]
+        dt_boxes: ndarray of float, [num_dt_per_part, 4] or [num_dt_per_part, 5] or [num_dt_per_part, 7]
+        gt_nums: ndarray of int, [parted_num]
+        dt_nums: ndarray of int, [parted_num]
+        metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
+        overlap_cache: DiskCache
+
+    Returns:
+        overlaps: ndarray of float, [num_gt_per_part, num_dt_per_part]
+
+    """
+    gt_offsets = np.concatenate([[0], np.cumsum(gt_nums)]).astype(np.int64)
+    dt_offsets = np.concatenate([[0], np.cumsum(dt_nums)]).astype(np.int64)
+    overlaps = np.zeros((gt_offsets[-1], dt_offsets[-1]), dtype=np.float64 if metric == 0 else np.float32)
+    keys, missing = {}, []
+    for i in range(len(gt_nums)):
+        if gt_nums[i] == 0 or dt_nums[i] == 0:
+            continue
+        gt_slice = slice(gt_offsets[i], gt_offsets[i + 1])
+        dt_slice = slice(dt_offsets[i], dt_offsets[i + 1])
+        keys[i] = content_hash('overlap', metric, gt_boxes[gt_slice], dt_boxes[dt_slice])
+        overlap = overlap_cache.load_array(keys[i])
+        if overlap is None:
+            missing.append(i)
+        else:
+            overlaps[gt_slice, dt_slice] = overlap
+    if len(missing) == 0:
+        return overlaps
+
+    gt_indices = np.concatenate([np.arange(gt_offsets[i], gt_offsets[i + 1]) for i in missing])
+    dt_indices = np.concatenate([np.arange(dt_offsets[i], dt_offsets[i + 1]) for i in missing])
+    overlaps_missing = _box_overlap(gt_boxes[gt_indices], dt_boxes[dt_indices], metric)
+    gt_num_idx, dt_num_idx = 0, 0
+    for i in missing:
+        overlap = overlaps_missing[gt_num_idx:gt_num_idx + gt_nums[i], dt_num_idx:dt_num_idx + dt_nums[i]]
+        overlaps[gt_offsets[i]:gt_offsets[i + 1], dt_offsets[i]:dt_offsets[i + 1]] = overlap
+        overlap_cache.save_array(keys[i], overlap)
+        gt_num_idx += gt_nums[i]
+        dt_num_idx += dt_nums[i]
+    return overlaps
+
+
+def calculate_iou_partly(gt_annos, dt_annos, metric, num_part=50, overlap_cache=None):
     """
     this function can calculate iou in bbox, bev and 3d, determined by the parameter 'metric',
     and must be used in the camera coordinates.
@@ -343,6 +935,7 @@ def calculate_iou_partly(gt_annos, dt_annos, metric, num_part=50):
         dt_annos: list of dict, must from get_label_annos() in kitti_common.py
         metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
         num_part: int, a parameter for fast calculate algorithm
+        overlap_cache: DiskCache, persistent overlaps of each sample keyed by the content hash of its boxes, None: no cache
 
     Returns:
         overlaps: list of ndarray of float, [[num_gt_per_sample, num_dt_per_sample], ...], the length is num_sample
@@ -363,36 +956,16 @@ def calculate_iou_partly(gt_annos, dt_annos, metric, num_part=50):
     for parted_num in split_parts:
         gt_annos_part = gt_annos[example_idx:example_idx + parted_num]
         dt_annos_part = dt_annos[example_idx:example_idx + parted_num]
-        if metric == 0:
-            gt_boxes = np.concatenate([a["bbox"] for a in gt_annos_part], 0)  # [N, 4]
-            dt_boxes = np.concatenate([a["bbox"] for a in dt_annos_part], 0)  # [K, 4]
-            overlap_part = image_box_overlap(gt_boxes, dt_boxes)  # [N, K]
-        elif metric == 1:
-            loc = np.concatenate([a["location"][:, [0, 2]] for a in gt_annos_part], 0)
-            dims = np.concatenate([a["dimensions"][:, [0, 2]] for a in gt_annos_part], 0)
-            rots = np.concatenate([a["rotation_y"] for a in gt_annos_part], 0)
-            gt_boxes = np.concatenate(
-                [loc, dims, rots[..., np.newaxis]], axis=1)
-            loc = np.concatenate([a["location"][:, [0, 2]] for a in dt_annos_part], 0)
-            dims = np.concatenate([a["dimensions"][:, [0, 2]] for a in dt_annos_part], 0)
-            rots = np.concatenate([a["rotation_y"] for a in dt_annos_part], 0)
-            dt_boxes = np.concatenate(
-                [loc, dims, rots[..., np.newaxis]], axis=1)
-            overlap_part = bev_box_overlap(gt_boxes, dt_boxes).astype(np.float64)  # [N, K]
-        elif metric == 2:
-            loc = np.concatenate([a["location"] for a in gt_annos_part], 0)
-            dims = np.concatenate([a["dimensions"] for a in gt_annos_part], 0)
-            rots = np.concatenate([a["rotation_y"] for a in gt_annos_part], 0)
-            gt_boxes = np.concatenate(
-                [loc, dims, rots[..., np.newaxis]], axis=1)
-            loc = np.concatenate([a["location"] for a in dt_annos_part], 0)
-            dims = np.concatenate([a["dimensions"] for a in dt_annos_part], 0)
-            rots = np.concatenate([a["rotation_y"] for a in dt_annos_part], 0)
-            dt_boxes = np.concatenate(
-                [loc, dims, rots[..., np.newaxis]], axis=1)
-            overlap_part = d3_box_overlap(gt_boxes, dt_boxes).astype(np.float64)  # [N, K]
+        gt_boxes = _get_part_boxes(gt_annos_part, metric)  # [N, 4] or [N, 5] or [N, 7]
+        dt_boxes = _get_part_boxes(dt_annos_part, metric)  # [K, 4] or [K, 5] or [K, 7]
+        if overlap_cache is None:
+            overlap_part = _box_overlap(gt_boxes, dt_boxes, metric)  # [N, K]
         else:
-            raise ValueError("unknown metric")
+            overlap_part = _cached_box_overlap(
+                gt_boxes, dt_boxes,
+                total_gt_num[example_idx:example_idx + parted_num],
+                total_dt_num[example_idx:example_idx + parted_num],
+                metric, overlap_cache)  # [N, K]
         parted_overlaps.append(overlap_part)
         example_idx += parted_num
     overlaps = []
@@ -413,6 +986,113 @@ def calculate_iou_partly(gt_annos, dt_annos, metric, num_part=50):
     return overlaps, parted_overlaps, total_gt_num, total_dt_num
 
 
+def calculate_iou_compact(gt_annos, dt_annos, metric, num_part=50, overlap_cache=None):
+    """
+    the same as calculate_iou_partly, but only the nonzero overlaps inside the samples are kept in the sparse format,
+    in float32 for bev and 3d, the dense matrix of only one part exists at a time. the statistics kernels still
+    scatter the pairs of one sample at a time back into a dense block, see sparse_frame_overlap(), so only the
+    overlaps kept between the two passes over the parts shrink, not the matching work.
+
+    Args:
+        gt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        dt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
+        num_part: int, a parameter for fast calculate algorithm
+        overlap_cache: DiskCache, persistent overlaps of each sample keyed by the content hash of its boxes, None: no cache
+
+    Returns:
+        parted_pairs: list of tuple, the overlaps of each part in the coordinate format,
+            pair_nums: ndarray of int64, [parted_num], the number of nonzero pairs per sample
+            rows: ndarray of int32, [num_pair_per_part], indices of ground truth objects in the part, sorted by
+                samples, then rows, then cols
+            cols: ndarray of int32, [num_pair_per_part], indices of detected objects in the part
+            vals: ndarray of float, [num_pair_per_part], nonzero overlaps, float64 for bbox and float32 for bev and 3d
+        total_gt_num: ndarray of int, [num_example], the number of ground truth objects
+        total_dt_num: ndarray of int, [num_example], the number of detected objects
+
+    """
+    assert len(gt_annos) == len(dt_annos)
+    num_example = len(gt_annos)
+    split_parts = get_split_parts(num_example, num_part)
+
+    total_gt_num = np.stack([len(a["name"]) for a in gt_annos], 0)  # [num_example]
+    total_dt_num = np.stack([len(a["name"]) for a in dt_annos], 0)  # [num_example]
+    parted_pairs = []
+    example_idx = 0
+
+    for parted_num in split_parts:
+        gt_boxes = _get_part_boxes(gt_annos[example_idx:example_idx + parted_num], metric)
+        dt_boxes = _get_part_boxes(dt_annos[example_idx:example_idx + parted_num], metric)
+        gt_nums = total_gt_num[example_idx:example_idx + parted_num]
+        dt_nums = total_dt_num[example_idx:example_idx + parted_num]
+        if overlap_cache is None:
+            overlap_part = _box_overlap(gt_boxes, dt_boxes, metric)  # [N, K]
+        else:
+            overlap_part = _cached_box_overlap(gt_boxes, dt_boxes, gt_nums, dt_nums, metric, overlap_cache)
+        parted_pairs.append(dense_to_sparse_overlaps(overlap_part, gt_nums, dt_nums))
+        example_idx += parted_num
+
+    return parted_pairs, total_gt_num, total_dt_num
+
+
+def calculate_iou_sparse(gt_annos, dt_annos, metric, num_part=50, cell_size=0.0):
+    """
+    the same as calculate_iou_partly, but only the candidate pairs from a uniform grid index over the box footprints
+    (image boxes for bbox, bev boxes for bev and 3d) are calculated, and the overlaps are kept in the sparse format.
+
+    Args:
+        gt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        dt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
+        num_part: int, a parameter for fast calculate algorithm
+        cell_size: float, the side length of grid cells, <= 0: decided by the mean box size per sample
+
+    Returns:
+        parted_pairs: list of tuple, (pair_nums, rows, cols, vals), COO overlaps of each part, the length is num_part
+            pair_nums: ndarray of int, [parted_num], the number of pairs per sample
+            rows: ndarray of int, [num_pair_per_part], indices of ground truth objects in the part
+            cols: ndarray of int, [num_pair_per_part], indices of detected objects in the part
+            vals: ndarray of float, [num_pair_per_part], overlaps
+        total_gt_num: ndarray of int, [num_example], the number of ground truth objects
+        total_dt_num: ndarray of int, [num_example], the number of detected objects
+
+    """
+    assert len(gt_annos) == len(dt_annos)
+    num_example = len(gt_annos)
+    split_parts = get_split_parts(num_example, num_part)
+
+    total_gt_num = np.stack([len(a["name"]) for a in gt_annos], 0)  # [num_example]
+    total_dt_num = np.stack([len(a["name"]) for a in dt_annos], 0)  # [num_example]
+    parted_pairs = []
+    example_idx = 0
+
+    for parted_num in split_parts:
+        gt_boxes = _get_part_boxes(gt_annos[example_idx:example_idx + parted_num], metric)
+        dt_boxes = _get_part_boxes(dt_annos[example_idx:example_idx + parted_num], metric)
+        if metric == 0:
+            gt_aabbs, dt_aabbs = gt_boxes, dt_boxes
+        elif metric == 1:
+            gt_aabbs, dt_aabbs = bev_box_aabbs(gt_boxes), bev_box_aabbs(dt_boxes)
+        else:
+            gt_aabbs = bev_box_aabbs(gt_boxes[:, [0, 2, 3, 5, 6]])
+            dt_aabbs = bev_box_aabbs(dt_boxes[:, [0, 2, 3, 5, 6]])
+        pair_nums, rows, cols = grid_candidate_pairs(
+            gt_aabbs, dt_aabbs,
+            total_gt_num[example_idx:example_idx + parted_num],
+            total_dt_num[example_idx:example_idx + parted_num],
+            cell_size)
+        if metric == 0:
+            vals = image_box_overlap_pairs(gt_boxes, dt_boxes, rows, cols)  # [num_pair]
+        elif metric == 1:
+            vals = bev_box_overlap_pairs(gt_boxes, dt_boxes, rows, cols)  # [num_pair]
+        else:
+            vals = d3_box_overlap_pairs(gt_boxes, dt_boxes, rows, cols)  # [num_pair]
+        parted_pairs.append((pair_nums, rows, cols, vals))
+        example_idx += parted_num
+
+    return parted_pairs, total_gt_num, total_dt_num
+
+
 def clean_data(gt_anno, dt_anno, current_class, difficulty):
     """
 
@@ -429,15 +1109,6 @@ def clean_data(gt_anno, dt_anno, current_class, difficulty):
         dc_bboxes: list of ndarray of float, [[4], ...], DontCare bboxes in annotations
 
     """
-    CLASS_NAMES = ['car', 'pedestrian', 'cyclist', 'van', 'person_sitting', 'truck']
-
-    # MIN_HEIGHT = [40, 25, 25]
-    # MAX_OCCLUSION = [0, 1, 2]
-    # MAX_TRUNCATION = [0.15, 0.3, 0.5]
-
-    MIN_DISTANCE = [0, 10, 20, 30, 40, 50, 60, 70]
-    MAX_DISTANCE = [10, 20, 30, 40, 50, 60, 70, 80]
-
     dc_bboxes, ignored_gt, ignored_dt = [], [], []
     current_cls_name = CLASS_NAMES[current_class].lower()
     num_gt = len(gt_anno["name"])
@@ -503,61 +1174,117 @@ def clean_data(gt_anno, dt_anno, current_class, difficulty):
     return num_valid_gt, ignored_gt, ignored_dt, dc_bboxes
 
 
-def _prepare_data(gt_annos, dt_annos, current_class, difficulty):
+def _get_distance_bins(annos):
     """
 
+    Args:
+        annos: list of dict, must from get_label_annos() in kitti_common.py
+
+    Returns:
+        bins: ndarray of int, [num_object], the distance bin of each object in all samples, -1: out of all bins
+
+    """
+    loc = np.concatenate([a["location"].reshape(-1, 3) for a in annos], 0)
+    distance = (loc[:, 0] ** 2 + loc[:, 2] ** 2) ** 0.5
+    bins = np.full((loc.shape[0], ), -1, dtype=np.int64)
+    for l in range(len(MAX_DISTANCE)):
+        bins[(bins == -1) & (distance >= MIN_DISTANCE[l]) & (distance < MAX_DISTANCE[l])] = l
+    return bins
+
+
+def prepare_data(gt_annos, dt_annos, current_classes, difficultys):
+    """
+    the same as clean_data for all samples, classes and difficulties at once, the results do not depend on the metric
+    and the overlaps, so that they can be shared by all calls of eval_class().
+
     Args:
         gt_annos: list of dict, must from get_label_annos() in kitti_common.py
         dt_annos: list of dict, must from get_label_annos() in kitti_common.py
-        current_class: int, 0: car, 1: pedestrian, 2: cyclist
-        difficulty: int, the evaluation difficulty, 0: easy, 1: normal, 2: hard
-
-    Returns:
-        gt_datas_list: list of ndarray of float, [[num_gt_per_sample, 5], ...], bboxes, alphas
-        dt_datas_list: list of ndarray of float, [[num_dt_per_sample, 6], ...], bboxes, alphas, scores
-        ignored_gts: list of ndarray of int, [[num_gt_per_sample], ...], 0: not ignored, 1: ignored, -1: unknown
-        ignored_dts: list of ndarray of int, [[num_dt_per_sample], ...], 0: not ignored, 1: ignored, -1: unknown
-        dontcares: list of ndarray of float, [[num_dc, 4], ...]
-        total_dc_num: ndarray of int, [num_sample], each of which is the number of DontCare bboxes per sample
-        total_num_valid_gt: int, the number of valid ground truth objects in all samples
-
-    """
-    gt_datas_list = []
-    dt_datas_list = []
-    total_dc_num = []
-    ignored_gts, ignored_dts, dontcares = [], [], []
-    total_num_valid_gt = 0
-    for i in range(len(gt_annos)):
-        # num_valid_gt: int, the number of valid ground truth objects per sample
-        # ignored_gt: list of int, the length is num_gt, 0: not ignored, 1: ignored, -1: unknown
-        # ignored_dt: list of int, the length is num_dt, 0: not ignored, 1: ignored, -1: unknown
-        # dc_bboxes: list of ndarray of float, [[4], ...], DontCare bboxes in annotations
-        rets = clean_data(gt_annos[i], dt_annos[i], current_class, difficulty)
-        num_valid_gt, ignored_gt, ignored_dt, dc_bboxes = rets
-
-        ignored_gts.append(np.array(ignored_gt, dtype=np.int64))
-        ignored_dts.append(np.array(ignored_dt, dtype=np.int64))
-        if len(dc_bboxes) == 0:
-            dc_bboxes = np.zeros((0, 4)).astype(np.float64)
-        else:
-            dc_bboxes = np.stack(dc_bboxes, 0).astype(np.float64)
-        total_dc_num.append(dc_bboxes.shape[0])
-        dontcares.append(dc_bboxes)
-        total_num_valid_gt += num_valid_gt
-        gt_datas = np.concatenate([
-            gt_annos[i]["bbox"], gt_annos[i]["alpha"][..., np.newaxis]
-        ], 1)
-        dt_datas = np.concatenate([
-            dt_annos[i]["bbox"], dt_annos[i]["alpha"][..., np.newaxis], dt_annos[i]["score"][..., np.newaxis]
-        ], 1)
-        gt_datas_list.append(gt_datas)
-        dt_datas_list.append(dt_datas)
-    total_dc_num = np.stack(total_dc_num, axis=0)
-    return gt_datas_list, dt_datas_list, ignored_gts, ignored_dts, dontcares, total_dc_num, total_num_valid_gt
+        current_classes: list of int, 0: car, 1: pedestrian, 2: cyclist
+        difficultys: list of int, the evaluation difficulty, i.e. the distance bin
+
+    Returns:
+        prepared: dict,
+            'gt_datas': ndarray of float, [num_gt, 5], bboxes, alphas of all samples
+            'dt_datas': ndarray of float, [num_dt, 6], bboxes, alphas, scores of all samples
+            'dontcares': ndarray of float, [num_dc, 4], DontCare bboxes of all samples
+            'gt_offsets': ndarray of int, [num_sample + 1], objects of sample i are gt_datas[gt_offsets[i]:gt_offsets[i + 1]]
+            'dt_offsets': ndarray of int, [num_sample + 1]
+            'dc_offsets': ndarray of int, [num_sample + 1]
+            'dc_overlaps': ndarray of float, [num_dc_overlap], from dontcare_overlaps()
+            'dc_overlap_offsets': ndarray of int, [num_sample + 1]
+            'ignored_gts': dict, (class, difficulty) -> ndarray of int, [num_gt], 0: not ignored, 1: ignored, -1: unknown
+            'ignored_dts': dict, class -> ndarray of int, [num_dt], 0: not ignored, 1: ignored, -1: unknown
+            'num_valid_gts': dict, (class, difficulty) -> int, the number of valid ground truth objects in all samples
+            'neighbor_gts': dict, class -> ndarray of bool, [num_gt], the ground truth objects of a neighbor class
+            'gt_bins': ndarray of int, [num_gt], the distance bin of each ground truth object, -1: out of all bins
+
+    """
+    assert len(gt_annos) == len(dt_annos)
+    gt_offsets = np.cumsum([0] + [len(a["name"]) for a in gt_annos])
+    dt_offsets = np.cumsum([0] + [len(a["name"]) for a in dt_annos])
+    gt_names = np.concatenate([np.asarray(a["name"], dtype=str) for a in gt_annos], 0)
+    dt_names = np.concatenate([np.asarray(a["name"], dtype=str) for a in dt_annos], 0)
+    gt_bboxes = np.concatenate([a["bbox"] for a in gt_annos], 0)
+    gt_datas = np.concatenate([
+        gt_bboxes, np.concatenate([a["alpha"] for a in gt_annos], 0)[..., np.newaxis]
+    ], 1)
+    dt_datas = np.concatenate([
+        np.concatenate([a["bbox"] for a in dt_annos], 0),
+        np.concatenate([a["alpha"] for a in dt_annos], 0)[..., np.newaxis],
+        np.concatenate([a["score"] for a in dt_annos], 0)[..., np.newaxis]
+    ], 1)
+
+    is_dontcare = gt_names == "DontCare"
+    dontcares = gt_bboxes[is_dontcare].astype(np.float64)
+    dc_offsets = np.concatenate([[0], np.cumsum(is_dontcare)])[gt_offsets]
+    dc_overlaps, dc_overlap_offsets = dontcare_overlaps(
+        np.ascontiguousarray(dt_datas[:, :4]), dontcares, dt_offsets, dc_offsets)
+
+    gt_names = np.char.lower(gt_names)
+    dt_names = np.char.lower(dt_names)
+    gt_bins = _get_distance_bins(gt_annos)
+
+    ignored_gts, ignored_dts, num_valid_gts, neighbor_gts = {}, {}, {}, {}
+    for current_class in current_classes:
+        current_cls_name = CLASS_NAMES[current_class].lower()
+        valid_class = np.full((gt_names.shape[0], ), -1, dtype=np.int64)
+        valid_class[gt_names == current_cls_name] = 1
+        if current_cls_name == "Pedestrian".lower():
+            valid_class[gt_names == "Person_sitting".lower()] = 0
+        elif current_cls_name == "Car".lower():
+            valid_class[gt_names == "Van".lower()] = 0
+        neighbor_gts[current_class] = valid_class == 0
+        for difficulty in difficultys:
+            ignore = gt_bins != difficulty
+            ignored_gt = np.full((gt_names.shape[0], ), -1, dtype=np.int64)
+            ignored_gt[(valid_class == 0) | ((valid_class == 1) & ignore)] = 1
+            ignored_gt[(valid_class == 1) & ~ignore] = 0
+            ignored_gts[(current_class, difficulty)] = ignored_gt
+            num_valid_gts[(current_class, difficulty)] = int(np.sum(ignored_gt == 0))
+        ignored_dts[current_class] = np.where(dt_names == current_cls_name, 0, -1).astype(np.int64)
+
+    prepared = {
+        "gt_datas": gt_datas,
+        "dt_datas": dt_datas,
+        "dontcares": dontcares,
+        "gt_offsets": gt_offsets,
+        "dt_offsets": dt_offsets,
+        "dc_offsets": dc_offsets,
+        "dc_overlaps": dc_overlaps,
+        "dc_overlap_offsets": dc_overlap_offsets,
+        "ignored_gts": ignored_gts,
+        "ignored_dts": ignored_dts,
+        "num_valid_gts": num_valid_gts,
+        "neighbor_gts": neighbor_gts,
+        "gt_bins": gt_bins,
+    }
+    return prepared
 
 
 def eval_class(gt_annos, dt_annos, current_classes, difficultys, metric, min_overlaps,
-               compute_aos=False, num_part=100):
+               compute_aos=False, num_part=100, sparse_overlap=False, prepared=None, overlap_cache=None,
+               record_matches=False, compact_overlap=False):
     """
 
     Args:
@@ -569,122 +1296,328 @@ def eval_class(gt_annos, dt_annos, current_classes, difficultys, metric, min_ove
         min_overlaps: ndarray of float, [num_minoverlap, num_metric, num_class]
         compute_aos: bool
         num_part: int, a parameter for fast calculate algorithm
+        sparse_overlap: bool, whether to calculate overlaps only for candidate pairs from a grid index
+        prepared: dict, from prepare_data() with the same classes and difficulties, None: prepare it here
+        overlap_cache: DiskCache, persistent overlaps of each sample, None: no cache, unused with sparse_overlap
+        record_matches: bool, whether to record the assignment of every object during the last threshold
+        compact_overlap: bool, whether to keep only the nonzero overlaps of the samples, see calculate_iou_compact()
 
     Returns:
         ret: dict,
             'recall': ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
             'precision': ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
             'orientation': ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
+            'match_records': dict, from _get_match_records(), only when record_matches
 
     """
     assert len(gt_annos) == len(dt_annos)
     num_example = len(gt_annos)
     split_parts = get_split_parts(num_example, num_part)
 
-    # overlaps: list of ndarray of float, [[num_gt_per_sample, num_dt_per_sample], ...], the length is num_sample
     # parted_overlaps: list of ndarray of float, [[num_gt_per_part, num_dt_per_part], ...], the length is num_part
     # total_gt_num: ndarray of int, [num_example]
     # total_dt_num: ndarray of int, [num_example]
-    rets = calculate_iou_partly(gt_annos, dt_annos, metric, num_part)
-    overlaps, parted_overlaps, total_gt_num, total_dt_num = rets
+    if sparse_overlap:
+        # parted_pairs: list of tuple, (pair_nums, rows, cols, vals), COO overlaps of each part
+        parted_pairs, total_gt_num, total_dt_num = calculate_iou_sparse(gt_annos, dt_annos, metric, num_part)
+    elif compact_overlap:
+        parted_pairs, total_gt_num, total_dt_num = calculate_iou_compact(gt_annos, dt_annos, metric, num_part,
+                                                                         overlap_cache)
+    else:
+        rets = calculate_iou_partly(gt_annos, dt_annos, metric, num_part, overlap_cache)
+        _, parted_overlaps, total_gt_num, total_dt_num = rets
 
     N_SAMPLE_PTS = 41
     num_minoverlap = len(min_overlaps)
     num_class = len(current_classes)
     num_difficulty = len(difficultys)
 
-    precision = np.zeros([num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS])
-    recall = np.zeros([num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS])
-    aos = np.zeros([num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS])
+    match_records = []
+    # pr: ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS, 4], tp, fp, fn, similarity
+    pr = np.zeros([num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS, 4])
+    num_thresholds = np.zeros([num_class, num_difficulty, num_minoverlap], dtype=np.int64)
+
+    # gt_datas: ndarray of float, [num_gt, 5], bboxes, alphas
+    # dt_datas: ndarray of float, [num_dt, 6], bboxes, alphas, scores
+    # dc_overlaps: ndarray of float, [num_dc_overlap], the overlaps of the detections with the DontCare regions
+    # gt_offsets, dt_offsets, dc_offsets: ndarray of int, [num_sample + 1], the first object of each sample
+    if prepared is None:
+        prepared = prepare_data(gt_annos, dt_annos, current_classes, difficultys)
+    gt_datas = prepared["gt_datas"]
+    dt_datas = prepared["dt_datas"]
+    dc_overlaps = prepared["dc_overlaps"]
+    gt_offsets = prepared["gt_offsets"]
+    dt_offsets = prepared["dt_offsets"]
+    dc_offsets = prepared["dc_offsets"]
+    dc_overlap_offsets = prepared["dc_overlap_offsets"]
+    total_dc_num = np.diff(dc_offsets)  # [num_sample]
 
     for m, current_class in enumerate(current_classes):
+        # ignored_dts: ndarray of int, [num_dt], 0: not ignored, 1: ignored, -1: unknown
+        ignored_dts = prepared["ignored_dts"][current_class]
+        # neighbor_gts: ndarray of bool, [num_gt], the ignored ground truth objects of a neighbor class
+        neighbor_gts = prepared["neighbor_gts"][current_class]
         for l, difficulty in enumerate(difficultys):
-            # gt_datas_list: list of ndarray of float, [[num_gt_per_sample, 5], ...], bboxes, alphas
-            # dt_datas_list: list of ndarray of float, [[num_dt_per_sample, 6], ...], bboxes, alphas, scores
-            # ignored_gts: list of ndarray of int, [[num_gt_per_sample], ...], 0: not ignored, 1: ignored, -1: unknown
-            # ignored_dts: list of ndarray of int, [[num_dt_per_sample], ...], 0: not ignored, 1: ignored, -1: unknown
-            # dontcares: list of ndarray of float, [[num_dc, 4], ...]
-            # total_dc_num: ndarray of int, [num_sample], each of which is the number of DontCare bboxes per sample
+            # ignored_gts: ndarray of int, [num_gt], 0: not ignored, 1: ignored, -1: unknown
             # total_num_valid_gt: int, the number of valid ground truth objects in all samples
-            rets = _prepare_data(gt_annos, dt_annos, current_class, difficulty)
-            gt_datas_list, dt_datas_list, ignored_gts, ignored_dts, dontcares, total_dc_num, total_num_valid_gt = rets
+            ignored_gts = prepared["ignored_gts"][(current_class, difficulty)]
+            total_num_valid_gt = prepared["num_valid_gts"][(current_class, difficulty)]
 
             if metric == 0:
                 print('Valid ground truth objects of Class {:d} in Difficulty {:d}: {:d}'.format(
                     current_class, difficulty, total_num_valid_gt))
 
-            for k, min_overlap in enumerate(min_overlaps[:, metric, m]):
-                all_thresholds = []
-                for i in range(len(gt_annos)):
-                    # tp: int, the number of true positive detections
-                    # fp: int, the number of false positive detections
-                    # fn: int, the number of false negative detections
-                    # similarity: float
-                    # thresholds: ndarray of float, [num_tp], scores of true positive detections
-                    rets = compute_statistics_jit(
-                        overlaps[i],  # [num_gt_per_sample, num_dt_per_sample]
-                        gt_datas_list[i],  # [num_gt_per_sample, 5]
-                        dt_datas_list[i],  # [num_dt_per_sample, 6]
-                        ignored_gts[i],  # [num_gt_per_sample]
-                        ignored_dts[i],  # [num_dt_per_sample]
-                        dontcares[i],  # [num_dc, 4]
-                        metric,  # int
-                        min_overlap=min_overlap,  # float
-                        score_thresh=0.0,  # float
-                        compute_fp=False,  # bool
-                    )
-                    tp, fp, fn, similarity, thresholds = rets
-                    all_thresholds += thresholds.tolist()
-                all_thresholds = np.array(all_thresholds)
-
-                # thresholds: list of float, sampled scores, the maximum length of which is 41
-                thresholds = get_thresholds(all_thresholds, total_num_valid_gt)
-                thresholds = np.array(thresholds)
-
-                # pr: ndarray of float, [about 41, 4], tp, fp, fn, similarity
-                pr = np.zeros([len(thresholds), 4])
-                idx = 0
-                for j, parted_num in enumerate(split_parts):
-                    gt_datas_part = np.concatenate(gt_datas_list[idx:idx + parted_num], 0)
-                    dt_datas_part = np.concatenate(dt_datas_list[idx:idx + parted_num], 0)
-                    dc_datas_part = np.concatenate(dontcares[idx:idx + parted_num], 0)
-                    ignored_gts_part = np.concatenate(ignored_gts[idx:idx + parted_num], 0)
-                    ignored_dts_part = np.concatenate(ignored_dts[idx:idx + parted_num], 0)
-                    fused_compute_statistics(
-                        parted_overlaps[j],  # [num_gt_per_part, num_dt_per_part]
-                        pr,  # [about 41, 4]
-                        total_gt_num[idx:idx + parted_num],  # [parted_num]
-                        total_dt_num[idx:idx + parted_num],  # [parted_num]
-                        total_dc_num[idx:idx + parted_num],  # [parted_num]
-                        gt_datas_part,  # [num_gt_per_part, 5]
-                        dt_datas_part,  # [num_dt_per_part, 6]
-                        dc_datas_part,  # [num_dc_per_part, 4]
-                        ignored_gts_part,  # [num_gt_per_part]
-                        ignored_dts_part,  # [num_dt_per_part]
-                        metric,  # int
-                        min_overlap=min_overlap,  # float
-                        thresholds=thresholds,  # [about 41]
-                        compute_aos=compute_aos,  # bool
-                    )
-                    idx += parted_num
-                for i in range(len(thresholds)):
-                    recall[m, l, k, i] = pr[i, 0] / (pr[i, 0] + pr[i, 2])
-                    precision[m, l, k, i] = pr[i, 0] / (pr[i, 0] + pr[i, 1])
-                    if compute_aos:
-                        aos[m, l, k, i] = pr[i, 3] / (pr[i, 0] + pr[i, 1])
-                for i in range(len(thresholds)):
-                    recall[m, l, k, i] = np.max(recall[m, l, k, i:], axis=-1)
-                    precision[m, l, k, i] = np.max(precision[m, l, k, i:], axis=-1)
-                    if compute_aos:
-                        aos[m, l, k, i] = np.max(aos[m, l, k, i:], axis=-1)
+            # all min_overlaps of the class are evaluated in the same passes over the samples
+            class_min_overlaps = np.ascontiguousarray(min_overlaps[:, metric, m], dtype=np.float64)
+            all_thresholds = [[] for _ in range(num_minoverlap)]
+            idx = 0
+            for j, parted_num in enumerate(split_parts):
+                gt_slice = slice(gt_offsets[idx], gt_offsets[idx + parted_num])
+                dt_slice = slice(dt_offsets[idx], dt_offsets[idx + parted_num])
+                dc_slice = slice(dc_overlap_offsets[idx], dc_overlap_offsets[idx + parted_num])
+                if sparse_overlap or compact_overlap:
+                    # pair_nums, rows, cols, vals
+                    collect_thresholds, overlap_part = fused_collect_thresholds_sparse, parted_pairs[j]
+                else:
+                    # [num_gt_per_part, num_dt_per_part]
+                    collect_thresholds, overlap_part = fused_collect_thresholds, (parted_overlaps[j], )
+                # thresholds: ndarray of float, [num_tp_per_part], scores of true positive detections
+                # num_tps: ndarray of int, [num_minoverlap], the number of them of each min_overlap
+                thresholds, num_tps = collect_thresholds(
+                    *overlap_part,
+                    total_gt_num[idx:idx + parted_num],  # [parted_num]
+                    total_dt_num[idx:idx + parted_num],  # [parted_num]
+                    total_dc_num[idx:idx + parted_num],  # [parted_num]
+                    gt_datas[gt_slice],  # [num_gt_per_part, 5]
+                    dt_datas[dt_slice],  # [num_dt_per_part, 6]
+                    dc_overlaps[dc_slice],  # [num_dc_overlap_per_part]
+                    ignored_gts[gt_slice],  # [num_gt_per_part]
+                    ignored_dts[dt_slice],  # [num_dt_per_part]
+                    metric,  # int
+                    class_min_overlaps,  # [num_minoverlap]
+                )
+                for k, thresholds_k in enumerate(np.split(thresholds, np.cumsum(num_tps)[:-1])):
+                    all_thresholds[k].append(thresholds_k)
+                idx += parted_num
+
+            # thresholds: ndarray of float, [num_minoverlap, N_SAMPLE_PTS], sampled scores of each min_overlap
+            thresholds = np.zeros([num_minoverlap, N_SAMPLE_PTS])
+            for k in range(num_minoverlap):
+                thresholds_k = get_thresholds(np.concatenate(all_thresholds[k], 0), total_num_valid_gt)
+                num_thresholds[m, l, k] = len(thresholds_k)
+                thresholds[k, :len(thresholds_k)] = thresholds_k
+
+            idx = 0
+            for j, parted_num in enumerate(split_parts):
+                gt_slice = slice(gt_offsets[idx], gt_offsets[idx + parted_num])
+                dt_slice = slice(dt_offsets[idx], dt_offsets[idx + parted_num])
+                dc_slice = slice(dc_overlap_offsets[idx], dc_overlap_offsets[idx + parted_num])
+                match_outputs = {}
+                if record_matches:
+                    match_outputs = {
+                        "gt_matches": np.full((num_minoverlap, gt_slice.stop - gt_slice.start), -1, dtype=np.int64),
+                        "gt_ious": np.zeros((num_minoverlap, gt_slice.stop - gt_slice.start), dtype=np.float64),
+                        "dt_matches": np.full((num_minoverlap, dt_slice.stop - dt_slice.start), -1, dtype=np.int64),
+                    }
+                if sparse_overlap or compact_overlap:
+                    # pair_nums, rows, cols, vals
+                    fused_statistics, overlap_part = fused_compute_statistics_sparse, parted_pairs[j]
+                else:
+                    # [num_gt_per_part, num_dt_per_part]
+                    fused_statistics, overlap_part = fused_compute_statistics, (parted_overlaps[j], )
+                fused_statistics(
+                    *overlap_part,
+                    pr[m, l],  # [num_minoverlap, N_SAMPLE_PTS, 4], only the first about 41 rows are used
+                    total_gt_num[idx:idx + parted_num],  # [parted_num]
+                    total_dt_num[idx:idx + parted_num],  # [parted_num]
+                    total_dc_num[idx:idx + parted_num],  # [parted_num]
+                    gt_datas[gt_slice],  # [num_gt_per_part, 5]
+                    dt_datas[dt_slice],  # [num_dt_per_part, 6]
+                    dc_overlaps[dc_slice],  # [num_dc_overlap_per_part]
+                    ignored_gts[gt_slice],  # [num_gt_per_part]
+                    ignored_dts[dt_slice],  # [num_dt_per_part]
+                    metric,  # int
+                    min_overlaps=class_min_overlaps,  # [num_minoverlap]
+                    thresholds=thresholds,  # [num_minoverlap, N_SAMPLE_PTS]
+                    num_thresholds=num_thresholds[m, l],  # [num_minoverlap]
+                    compute_aos=compute_aos,  # bool
+                    **match_outputs,  # [num_minoverlap, num_gt_per_part] or [num_minoverlap, num_dt_per_part]
+                )
+                if record_matches:
+                    match_records.append(_get_match_records(
+                        prepared, idx, parted_num, ignored_gts, ignored_dts, neighbor_gts, thresholds,
+                        num_thresholds[m, l], metric, m, l, **match_outputs))
+                idx += parted_num
+
+    # recall, precision, aos: ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
+    recall, precision, aos = compute_pr_curves(pr, num_thresholds, compute_aos)
     ret_dict = {
         "recall": recall,
         "precision": precision,
         "orientation": aos,
     }
+    if record_matches:
+        ret_dict["match_records"] = concat_match_records(match_records)
     return ret_dict
 
 
+def _get_match_records(prepared, idx, parted_num, ignored_gts, ignored_dts, neighbor_gts, thresholds, num_thresholds,
+                       metric, m, l, gt_matches, gt_ious, dt_matches):
+    """
+    turn the assignments recorded by fused_compute_statistics() for the samples of a part into match records.
+
+    Args:
+        prepared: dict, from prepare_data()
+        idx: int, the first sample of the part
+        parted_num: int, the number of samples of the part
+        ignored_gts: ndarray of int, [num_gt], 0: not ignored, 1: ignored, -1: unknown
+        ignored_dts: ndarray of int, [num_dt], 0: not ignored, 1: ignored, -1: unknown
+        neighbor_gts: ndarray of bool, [num_gt], the ground truth objects of a neighbor class
+        thresholds: ndarray of float, [num_minoverlap, N_SAMPLE_PTS]
+        num_thresholds: ndarray of int, [num_minoverlap]
+        metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
+        m: int, the index of the class
+        l: int, the index of the difficulty
+        gt_matches: ndarray of int, [num_minoverlap, num_gt_per_part], the detections in the samples, -1: none
+        gt_ious: ndarray of float, [num_minoverlap, num_gt_per_part]
+        dt_matches: ndarray of int, [num_minoverlap, num_dt_per_part], the ground truth objects in the samples,
+            -1: none, -2: DontCare
+
+    Returns:
+        records: dict, column name -> ndarray, one row per ground truth object or detection of the class
+            and per min_overlap
+            'frame': int, the index of the sample
+            'object': int, the index of the object in the sample
+            'is_dt': bool, whether the object is a detection
+            'matched': int, the index of the assigned object of the other kind in the sample, -1: none
+            'iou': float, the overlap with the assigned object
+            'score': float, the score of the detection, nan: not assigned
+            'status': int, the index of MATCH_STATUS
+            'reason': int, the index of IGNORED_REASONS, why an object with the status 'ignored' is ignored
+            'bin': int, the distance bin of the ground truth object, -1: none
+            'metric', 'class', 'difficulty', 'overlap': int, the indices of the evaluation
+
+    """
+    gt_offsets, dt_offsets, gt_bins = prepared["gt_offsets"], prepared["dt_offsets"], prepared["gt_bins"]
+    gt_start, dt_start = gt_offsets[idx], dt_offsets[idx]
+    gt_frames = np.repeat(np.arange(idx, idx + parted_num), np.diff(gt_offsets[idx:idx + parted_num + 1]))
+    dt_frames = np.repeat(np.arange(idx, idx + parted_num), np.diff(dt_offsets[idx:idx + parted_num + 1]))
+    # indices in the part
+    gt_ignored = ignored_gts[gt_start:gt_offsets[idx + parted_num]]
+    dt_ignored = ignored_dts[dt_start:dt_offsets[idx + parted_num]]
+    gt_bins = gt_bins[gt_start:gt_offsets[idx + parted_num]]
+    gt_reasons = np.where(gt_ignored != 1, IGNORED_NONE,
+                          np.where(neighbor_gts[gt_start:gt_offsets[idx + parted_num]], IGNORED_NEIGHBOR_CLASS,
+                                   IGNORED_OTHER_BIN)).astype(np.int8)
+    dt_scores = prepared["dt_datas"][dt_start:dt_offsets[idx + parted_num], -1]
+    gt_mask, dt_mask = gt_ignored != -1, dt_ignored != -1
+
+    columns = {key: [] for key in ["frame", "object", "is_dt", "matched", "iou", "score", "status", "reason", "bin",
+                                   "overlap"]}
+    for k in range(gt_matches.shape[0]):
+        gt_matched = gt_matches[k]
+        gt_assigned = gt_matched >= 0
+        # the assigned detection in the part
+        gt_dt = np.where(gt_assigned, gt_matched + dt_offsets[gt_frames] - dt_start, 0)
+        gt_status = np.full(gt_matched.shape, MATCH_FN, dtype=np.int8)
+        gt_status[gt_assigned] = np.where(dt_ignored[gt_dt[gt_assigned]] == 0, MATCH_TP, MATCH_IGNORED)
+        gt_status[gt_ignored == 1] = MATCH_IGNORED
+        gt_reason = np.where(gt_status == MATCH_IGNORED, IGNORED_OTHER_CLASS, IGNORED_NONE).astype(np.int8)
+        gt_reason[gt_ignored == 1] = gt_reasons[gt_ignored == 1]
+
+        dt_matched = dt_matches[k]
+        dt_assigned = dt_matched >= 0
+        # the assigned ground truth object in the part
+        dt_gt = np.where(dt_assigned, dt_matched + gt_offsets[dt_frames] - gt_start, 0)
+        record_thresh = thresholds[k, num_thresholds[k] - 1] if num_thresholds[k] > 0 else 0.0
+        dt_status = np.where(dt_scores < record_thresh, MATCH_BELOW_THRESHOLD, MATCH_FP).astype(np.int8)
+        dt_status[dt_assigned] = np.where(gt_ignored[dt_gt[dt_assigned]] == 0, MATCH_TP, MATCH_IGNORED)
+        dt_status[dt_matched == -2] = MATCH_DONTCARE
+        dt_status[dt_ignored == 1] = MATCH_IGNORED
+        dt_reason = np.where(dt_assigned, gt_reasons[dt_gt], IGNORED_NONE).astype(np.int8)
+        dt_reason[dt_ignored == 1] = IGNORED_OTHER_CLASS
+
+        columns["frame"] += [gt_frames[gt_mask], dt_frames[dt_mask]]
+        columns["object"] += [(np.arange(gt_start, gt_offsets[idx + parted_num]) - gt_offsets[gt_frames])[gt_mask],
+                              (np.arange(dt_start, dt_offsets[idx + parted_num]) - dt_offsets[dt_frames])[dt_mask]]
+        columns["is_dt"] += [np.zeros(np.sum(gt_mask), dtype=bool), np.ones(np.sum(dt_mask), dtype=bool)]
+        columns["matched"] += [gt_matched[gt_mask], np.where(dt_assigned, dt_matched, -1)[dt_mask]]
+        columns["iou"] += [gt_ious[k][gt_mask], np.where(dt_assigned, gt_ious[k][dt_gt], 0.0)[dt_mask]]
+        columns["score"] += [np.where(gt_assigned, dt_scores[gt_dt], np.nan)[gt_mask], dt_scores[dt_mask]]
+        columns["status"] += [gt_status[gt_mask], dt_status[dt_mask]]
+        columns["reason"] += [gt_reason[gt_mask], dt_reason[dt_mask]]
+        columns["bin"] += [gt_bins[gt_mask], np.where(dt_assigned, gt_bins[dt_gt], -1)[dt_mask]]
+        columns["overlap"] += [np.full(np.sum(gt_mask) + np.sum(dt_mask), k)]
+
+    dtypes = {"frame": np.int32, "object": np.int32, "is_dt": bool, "matched": np.int32, "iou": np.float32,
+              "score": np.float32, "status": np.int8, "reason": np.int8, "bin": np.int8, "overlap": np.int8}
+    records = {key: np.concatenate(values).astype(dtypes[key]) for key, values in columns.items()}
+    num_record = records["frame"].shape[0]
+    records["metric"] = np.full(num_record, metric, dtype=np.int8)
+    records["class"] = np.full(num_record, m, dtype=np.int8)
+    records["difficulty"] = np.full(num_record, l, dtype=np.int8)
+    return records
+
+
+def concat_match_records(records_list):
+    """
+
+    Args:
+        records_list: list of dict, from _get_match_records()
+
+    Returns:
+        records: dict, column name -> ndarray
+
+    """
+    return {key: np.concatenate([records[key] for records in records_list]) for key in records_list[0]}
+
+
+def save_match_records(path, records, current_classes, difficultys, min_overlaps):
+    """
+    save match records as a compressed npz file with one array per column, together with the tables to decode the
+    indices of classes, difficulties, min_overlaps, status and ignored reasons.
+
+    the records are the matching at the lowest sampled score threshold of each class, difficulty and min_overlap,
+    i.e. the last point of the precision recall curve. detections below it are 'below_threshold' and ground truth
+    objects only found by them are 'fn', so that the 'tp' and 'fn' records of an evaluation add up to its valid
+    ground truth objects.
+    """
+    np.savez_compressed(path, current_classes=np.asarray(current_classes), difficultys=np.asarray(difficultys),
+                        min_overlaps=min_overlaps, status_names=np.array(MATCH_STATUS),
+                        reason_names=np.array(IGNORED_REASONS), **records)
+
+
+def compute_pr_curves(pr, num_thresholds, compute_aos=False):
+    """
+    turn the statistics at the sampled thresholds into interpolated curves, all evaluations at once.
+
+    Args:
+        pr: ndarray of float, [..., N_SAMPLE_PTS, 4], tp, fp, fn, similarity, zeros after the last threshold
+        num_thresholds: ndarray of int, [...], the number of sampled thresholds of each evaluation
+        compute_aos: bool
+
+    Returns:
+        recall: ndarray of float, [..., N_SAMPLE_PTS]
+        precision: ndarray of float, [..., N_SAMPLE_PTS]
+        aos: ndarray of float, [..., N_SAMPLE_PTS]
+
+    """
+    tp, fp, fn, similarity = pr[..., 0], pr[..., 1], pr[..., 2], pr[..., 3]
+    valid = np.arange(pr.shape[-2]) < np.asarray(num_thresholds)[..., np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recall = np.where(valid, tp / (tp + fn), 0.0)
+        precision = np.where(valid, tp / (tp + fp), 0.0)
+        if compute_aos:
+            aos = np.where(valid, similarity / (tp + fp), 0.0)
+        else:
+            aos = np.zeros_like(precision)
+    # the maximum of each suffix, i.e. the interpolated value at each recall position
+    recall = np.maximum.accumulate(recall[..., ::-1], axis=-1)[..., ::-1]
+    precision = np.maximum.accumulate(precision[..., ::-1], axis=-1)[..., ::-1]
+    aos = np.maximum.accumulate(aos[..., ::-1], axis=-1)[..., ::-1]
+    return recall, precision, aos
+
+
 def get_mAP(prec):
     sums = 0
     for i in range(0, prec.shape[-1], 4):
@@ -699,7 +1632,9 @@ def get_mAP_R40(prec):
     return sums / 40 * 100
 
 
-def do_eval(gt_annos, dt_annos, current_classes, difficultys, min_overlaps, compute_aos=False):
+def do_eval(gt_annos, dt_annos, current_classes, difficultys, min_overlaps, compute_aos=False,
+            sparse_overlap=False, overlap_cache=None, match_records=None, compact_overlap=False,
+            metrics=(0, 1, 2), ap_types=('AP', 'AP_R40')):
     """
 
     Args:
@@ -708,57 +1643,65 @@ def do_eval(gt_annos, dt_annos, current_classes, difficultys, min_overlaps, comp
         current_classes: list of int, 0: car, 1: pedestrian, 2: cyclist
         difficultys: list of int, the evaluation difficulty, 0: easy, 1: normal, 2: hard
         min_overlaps: ndarray of float, [num_minoverlap, num_metric, num_class]
-        compute_aos: bool
+        compute_aos: bool, only with the metric bbox
+        sparse_overlap: bool, whether to calculate overlaps only for candidate pairs from a grid index
+        overlap_cache: DiskCache, persistent overlaps of each sample, None: no cache
+        match_records: list, the match records of each metric are appended to it, None: not recorded
+        compact_overlap: bool, whether to keep only the nonzero overlaps of the samples
+        metrics: tuple of int, the evaluation types to run, 0: bbox, 1: bev, 2: 3d
+        ap_types: tuple of str, 'AP': 11 recall positions, 'AP_R40': 40 recall positions
 
     Returns:
-        mAP result: ndarray of float, [num_class, num_difficulty, num_minoverlap]
+        mAP result: ndarray of float, [num_class, num_difficulty, num_minoverlap], None: not evaluated
 
     """
-    # ret['recall']: ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
-    # ret['precision']: ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
-    # ret['orientation']: ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
-    ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, 0, min_overlaps, compute_aos)
-    mAP_bbox = get_mAP(ret["precision"])
-    mAP_bbox_R40 = get_mAP_R40(ret["precision"])
-
-    mAP_aos = None
-    mAP_aos_R40 = None
-    if compute_aos:
-        mAP_aos = get_mAP(ret["orientation"])
-        mAP_aos_R40 = get_mAP_R40(ret["orientation"])
-
-    ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, 1, min_overlaps)
-    mAP_bev = get_mAP(ret["precision"])
-    mAP_bev_R40 = get_mAP_R40(ret["precision"])
-
-    ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, 2, min_overlaps)
-    mAP_3d = get_mAP(ret["precision"])
-    mAP_3d_R40 = get_mAP_R40(ret["precision"])
-
-    return mAP_bbox, mAP_bev, mAP_3d, mAP_aos, mAP_bbox_R40, mAP_bev_R40, mAP_3d_R40, mAP_aos_R40
-
-
-def get_official_eval_result(gt_annos, dt_annos, current_classes):
+    # the ignored masks and the packed data do not depend on the metric
+    prepared = prepare_data(gt_annos, dt_annos, current_classes, difficultys)
+
+    # mAPs[ap_type][metric], the aos is the last metric
+    mAPs = {'AP': [None] * 4, 'AP_R40': [None] * 4}
+    get_ap = {'AP': get_mAP, 'AP_R40': get_mAP_R40}
+    for metric in metrics:
+        # ret['recall']: ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
+        # ret['precision']: ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
+        # ret['orientation']: ndarray of float, [num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS]
+        ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, metric, min_overlaps,
+                         compute_aos and metric == 0, sparse_overlap=sparse_overlap, prepared=prepared,
+                         overlap_cache=overlap_cache, record_matches=match_records is not None,
+                         compact_overlap=compact_overlap)
+        if match_records is not None:
+            match_records.append(ret["match_records"])
+        for ap_type in ap_types:
+            mAPs[ap_type][metric] = get_ap[ap_type](ret["precision"])
+            if compute_aos and metric == 0:
+                mAPs[ap_type][3] = get_ap[ap_type](ret["orientation"])
+
+    return tuple(mAPs['AP']) + tuple(mAPs['AP_R40'])
+
+
+METRIC_NAMES = ['bbox', 'bev', '3d']
+
+CLASS_TO_NAME = {
+    0: 'Car',
+    1: 'Pedestrian',
+    2: 'Cyclist',
+    3: 'Van',
+    4: 'Person_sitting',
+    5: 'Truck'
+}
+
+
+def get_class_ints(current_classes):
     """
 
     Args:
-        gt_annos: list of dict, must from get_label_annos() in kitti_common.py
-        dt_annos: list of dict, must from get_label_annos() in kitti_common.py
         current_classes: int or list of int or list of str, desired classes
 
     Returns:
-        result: str
+        current_classes: list of int
 
     """
-    class_to_name = {
-        0: 'Car',
-        1: 'Pedestrian',
-        2: 'Cyclist',
-        3: 'Van',
-        4: 'Person_sitting',
-        5: 'Truck'
-    }
-    name_to_class = {v: n for n, v in class_to_name.items()}
+    name_to_class = {v: n for n, v in CLASS_TO_NAME.items()}
     if not isinstance(current_classes, (list, tuple)):
         current_classes = [current_classes]
     current_classes_int = []
@@ -767,8 +1710,34 @@ def get_official_eval_result(gt_annos, dt_annos, current_classes):
             current_classes_int.append(name_to_class[curcls])
         else:
             current_classes_int.append(curcls)
-    current_classes = current_classes_int
+    return current_classes_int
+
+
+def get_metric_ints(metrics):
+    """
+
+    Args:
+        metrics: int or str or list of them, 0 or 'bbox', 1 or 'bev', 2 or '3d'
+
+    Returns:
+        metrics: list of int, sorted
+
+    """
+    if not isinstance(metrics, (list, tuple)):
+        metrics = [metrics]
+    return sorted({METRIC_NAMES.index(metric) if isinstance(metric, str) else metric for metric in metrics})
+
+
+def get_official_min_overlaps(current_classes):
+    """
+
+    Args:
+        current_classes: list of int
+
+    Returns:
+        min_overlaps: ndarray of float, [num_minoverlap, num_metric, num_class]
 
+    """
     overlap_0_7 = np.array([[0.7, 0.5, 0.5, 0.7, 0.5, 0.7],  # metric 0: bbox
                             [0.7, 0.5, 0.5, 0.7, 0.5, 0.7],  # metric 1: bev
                             [0.7, 0.5, 0.5, 0.7, 0.5, 0.7],  # metric 2: 3d
@@ -779,64 +1748,475 @@ def get_official_eval_result(gt_annos, dt_annos, current_classes):
                             ])
     # min_overlaps: ndarray of float, [num_minoverlap, num_metric, num_class]
     min_overlaps = np.stack([overlap_0_7, overlap_0_5], axis=0)
-    min_overlaps = min_overlaps[:, :, current_classes]
+    return min_overlaps[:, :, current_classes]
 
-    difficultys = [0, 1, 2, 3, 4, 5, 6, 7]
-    num_difficulty = len(difficultys)
 
-    result = ''
-    # check whether alpha is valid
+def check_alpha_valid(dt_annos):
+    """
+
+    Args:
+        dt_annos: list of dict, must from get_label_annos() in kitti_common.py
+
+    Returns:
+        compute_aos: bool, whether the alphas of the first non-empty sample are given
+
+    """
     compute_aos = False
     for anno in dt_annos:
         if anno['alpha'].shape[0] != 0:
             if anno['alpha'][0] != -10:
                 compute_aos = True
             break
+    return compute_aos
 
-    # mAP result: ndarray of float, [num_class, num_difficulty, num_minoverlap]
-    mAPbbox, mAPbev, mAP3d, mAPaos, mAPbbox_R40, mAPbev_R40, mAP3d_R40, mAPaos_R40 = do_eval(
-        gt_annos, dt_annos, current_classes, difficultys, min_overlaps, compute_aos)
 
+def prune_detections(dt_annos, current_classes, min_score=-1, top_k=-1):
+    """
+    drop the detections before the overlaps are computed. the detections of the classes which are not evaluated
+    are never matched, so dropping them does not change any result. min_score and top_k may change the results,
+    since the lowest sampled threshold is the lowest score of true positive detections, the safe cut derived from
+    the overlaps is prune_unmatchable_detections().
+
+    Args:
+        dt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        current_classes: list of int
+        min_score: float, drop the detections scoring lower, <= 0: not used
+        top_k: int, keep at most so many detections of each class in each sample, the highest scoring ones,
+            < 0: not used
+
+    Returns:
+        dt_annos: list of dict, the kept detections in their original order
+        kept: list of ndarray of int, the indices of the kept detections in each sample
+        num_dropped: dict, 'class', 'min_score', 'top_k' -> int, the number of detections dropped by each rule
+
+    """
+    class_names = [CLASS_NAMES[current_class] for current_class in current_classes]
+    num_dropped = {'class': 0, 'min_score': 0, 'top_k': 0}
+    pruned_annos, kept = [], []
+    for anno in dt_annos:
+        names = np.char.lower(np.asarray(anno['name'], dtype=str))
+        keep = np.isin(names, class_names)
+        num_dropped['class'] += int(np.sum(~keep))
+        if min_score > 0:
+            low = keep & (anno['score'] < min_score)
+            num_dropped['min_score'] += int(np.sum(low))
+            keep &= ~low
+        if top_k >= 0:
+            for name in np.unique(names[keep]):
+                indices = np.flatnonzero(keep & (names == name))
+                if indices.shape[0] > top_k:
+                    order = np.argsort(-anno['score'][indices], kind='stable')
+                    keep[indices[order[top_k:]]] = False
+                    num_dropped['top_k'] += indices.shape[0] - top_k
+        indices = np.flatnonzero(keep)
+        kept.append(indices)
+        pruned_annos.append({key: value[indices] for key, value in anno.items()})
+    return pruned_annos, kept, num_dropped
+
+
+def _bound_geometry(annos):
+    """
+    the geometry of all boxes in annos for max_overlap_bounds(), without the rotated corners.
+
+    Args:
+        annos: list of dict, must from get_label_annos() in kitti_common.py
+
+    Returns:
+        geometry: dict, N is the number of boxes in all samples
+            'offsets': ndarray of int, [num_sample + 1], boxes of sample i are [offsets[i]:offsets[i + 1]]
+            'bbox': ndarray of float, [N, 4], xyxy format
+            'bev_boxes': ndarray of float, [N, 5], centers, dims, angles of the footprints in x-z
+            'bev_aabbs': ndarray of float, [N, 4], xyxy format, from bev_box_aabbs()
+            'heights': ndarray of float, [N, 2], the top and the bottom in y
+            'volumes': ndarray of float, [N]
+
+    """
+    loc = np.concatenate([a["location"] for a in annos] + [np.zeros((0, 3))], 0)
+    dims = np.concatenate([a["dimensions"] for a in annos] + [np.zeros((0, 3))], 0)
+    rots = np.concatenate([a["rotation_y"] for a in annos] + [np.zeros((0, ))], 0)
+    bev_boxes = np.concatenate([loc[:, [0, 2]], dims[:, [0, 2]], rots[:, np.newaxis]], axis=1)
+    return {
+        'offsets': np.cumsum([0] + [len(a["name"]) for a in annos]),
+        'bbox': np.concatenate([a["bbox"] for a in annos] + [np.zeros((0, 4))], 0),
+        'bev_boxes': bev_boxes,
+        'bev_aabbs': bev_box_aabbs(bev_boxes),
+        'heights': np.stack([loc[:, 1] - dims[:, 1], loc[:, 1]], axis=1),
+        'volumes': dims[:, 0] * dims[:, 1] * dims[:, 2],
+    }
+
+
+@numba.jit(nopython=True, parallel=True, nogil=True)
+def max_overlap_bounds(gt_bboxes, gt_aabbs, gt_areas, gt_heights, gt_volumes, dt_bboxes, dt_aabbs, dt_areas,
+                       dt_heights, dt_volumes, gt_offsets, dt_offsets):
+    """
+    upper bounds of the overlaps of every detection with the ground truth objects of its sample, without the rotated
+    overlaps. the bev intersection is at most the intersection of the axis aligned extents, and at most either area.
+
+    Args:
+        gt_bboxes: ndarray of float, [num_gt, 4], xyxy format
+        gt_aabbs: ndarray of float, [num_gt, 4], the axis aligned extents of the bev boxes, from bev_box_aabbs()
+        gt_areas: ndarray of float, [num_gt], the bev areas
+        gt_heights: ndarray of float, [num_gt, 2], the top and the bottom in y
+        gt_volumes: ndarray of float, [num_gt]
+        dt_*: the same as gt_*, [num_dt, ...]
+        gt_offsets: ndarray of int, [num_sample + 1]
+        dt_offsets: ndarray of int, [num_sample + 1]
+
+    Returns:
+        bounds: ndarray of float, [num_dt, 3], the maximum overlap of each detection in bbox, and upper bounds of it
+            in bev and 3d
+
+    """
+    bounds = np.zeros((dt_bboxes.shape[0], 3), dtype=np.float64)
+    for n in numba.prange(gt_offsets.shape[0] - 1):
+        for k in range(dt_offsets[n], dt_offsets[n + 1]):
+            for i in range(gt_offsets[n], gt_offsets[n + 1]):
+                bounds[k, 0] = max(bounds[k, 0], _image_box_pair_overlap(gt_bboxes, i, dt_bboxes, k, -1))
+                iw = min(gt_aabbs[i, 2], dt_aabbs[k, 2]) - max(gt_aabbs[i, 0], dt_aabbs[k, 0])
+                ih = min(gt_aabbs[i, 3], dt_aabbs[k, 3]) - max(gt_aabbs[i, 1], dt_aabbs[k, 1])
+                if iw <= 0 or ih <= 0:
+                    continue
+                inter = min(iw * ih, gt_areas[i], dt_areas[k])
+                bounds[k, 1] = max(bounds[k, 1], inter / (gt_areas[i] + dt_areas[k] - inter))
+                iy = min(gt_heights[i, 1], dt_heights[k, 1]) - max(gt_heights[i, 0], dt_heights[k, 0])
+                if iy > 0:
+                    inter = inter * iy
+                    bounds[k, 2] = max(bounds[k, 2], inter / (gt_volumes[i] + dt_volumes[k] - inter))
+    return bounds
+
+
+def prune_unmatchable_detections(gt_annos, dt_annos, current_classes, min_overlaps, metrics):
+    """
+    drop the detections which never change any result, derived from the evaluation itself. a detection without an
+    overlap above min_overlap to any ground truth object of its sample is never assigned, so it is at most a false
+    positive at the thresholds not above its score. the thresholds are sampled from the scores of true positive
+    detections, which all overlap some ground truth object, so such a detection scoring lower than every detection
+    of its class which may be matched is never counted at all.
+
+    Args:
+        gt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        dt_annos: list of dict, from prune_detections()
+        current_classes: list of int
+        min_overlaps: ndarray of float, [num_minoverlap, num_metric, num_class]
+        metrics: list of int, the evaluation types, 0: bbox, 1: bev, 2: 3d
+
+    Returns:
+        dt_annos: list of dict, the kept detections in their original order
+        kept: list of ndarray of int, the indices of the kept detections in each sample
+        num_dropped: int, the number of dropped detections
+
+    """
+    gt_geometry = _bound_geometry(gt_annos)
+    dt_geometry = _bound_geometry(dt_annos)
+    gt_areas = gt_geometry['bev_boxes'][:, 2] * gt_geometry['bev_boxes'][:, 3]
+    dt_areas = dt_geometry['bev_boxes'][:, 2] * dt_geometry['bev_boxes'][:, 3]
+    bounds = max_overlap_bounds(gt_geometry['bbox'], gt_geometry['bev_aabbs'], gt_areas, gt_geometry['heights'],
+                                gt_geometry['volumes'], dt_geometry['bbox'], dt_geometry['bev_aabbs'], dt_areas,
+                                dt_geometry['heights'], dt_geometry['volumes'], gt_geometry['offsets'],
+                                dt_geometry['offsets'])
+
+    dt_names = np.char.lower(np.concatenate([np.asarray(a['name'], dtype=str) for a in dt_annos] +
+                                            [np.zeros((0, ), dtype=str)]))
+    dt_scores = np.concatenate([a['score'] for a in dt_annos] + [np.zeros((0, ))])
+    droppable = np.zeros((dt_names.shape[0], ), dtype=bool)
+    for m, current_class in enumerate(current_classes):
+        is_class = dt_names == CLASS_NAMES[current_class]
+        # a margin for the float32 rotated overlaps
+        matchable = np.zeros((dt_names.shape[0], ), dtype=bool)
+        for metric in metrics:
+            matchable |= bounds[:, metric] > np.min(min_overlaps[:, metric, m]) - 0.01
+        match_scores = dt_scores[is_class & matchable]
+        lowest_score = np.min(match_scores) if match_scores.shape[0] > 0 else np.inf
+        droppable |= is_class & ~matchable & (dt_scores < lowest_score)
+
+    pruned_annos, kept = [], []
+    offsets = dt_geometry['offsets']
+    for i, anno in enumerate(dt_annos):
+        indices = np.flatnonzero(~droppable[offsets[i]:offsets[i + 1]])
+        kept.append(indices)
+        pruned_annos.append({key: value[indices] for key, value in anno.items()})
+    return pruned_annos, kept, int(np.sum(droppable))
+
+
+def unprune_match_records(records, kept):
+    """
+
+    Args:
+        records: dict, from concat_match_records() of the detections from prune_detections()
+        kept: list of ndarray of int, from prune_detections()
+
+    Returns:
+        records: dict, the indices of the detections are the ones before pruning
+
+    """
+    offsets = np.cumsum([0] + [indices.shape[0] for indices in kept])
+    kept_flat = np.concatenate(kept + [np.zeros((0, ), dtype=np.int64)]).astype(np.int32)
+    records = dict(records)
+    is_dt, frame = records['is_dt'], records['frame']
+    # the detections themselves, and the detections assigned to the ground truth objects
+    records['object'] = np.where(is_dt, kept_flat[offsets[frame] + np.where(is_dt, records['object'], 0)],
+                                 records['object'])
+    gt_assigned = ~is_dt & (records['matched'] >= 0)
+    records['matched'] = np.where(gt_assigned, kept_flat[offsets[frame] + np.where(gt_assigned, records['matched'], 0)],
+                                  records['matched'])
+    return records
+
+
+def annos_content_hash(annos):
+    """
+
+    Args:
+        annos: list of dict, must from get_label_annos() in kitti_common.py
+
+    Returns:
+        key: str, hex digest of all fields of all samples
+
+    """
+    items = []
+    for anno in annos:
+        for key in sorted(anno):
+            items += [key, np.asarray(anno[key])]
+    return content_hash(len(annos), *items)
+
+
+def format_official_result(current_classes, min_overlaps, mAPs, compute_aos):
+    """
+
+    Args:
+        current_classes: list of int
+        min_overlaps: ndarray of float, [num_minoverlap, num_metric, num_class]
+        mAPs: tuple, the results of do_eval(), the metrics and AP types which are None are left out
+        compute_aos: bool
+
+    Returns:
+        result: str
+
+    """
+    mAPbbox, mAPbev, mAP3d, mAPaos, mAPbbox_R40, mAPbev_R40, mAP3d_R40, mAPaos_R40 = mAPs
+    ap_types = [('AP', [mAPbbox, mAPbev, mAP3d, mAPaos]),
+                ('AP_R40', [mAPbbox_R40, mAPbev_R40, mAP3d_R40, mAPaos_R40])]
+    labels = ['bbox ({:.2f}): ', 'bev  ({:.2f}): ', '3d   ({:.2f}): ', 'aos        : ']
+
+    result = ''
     for j, curcls in enumerate(current_classes):
         for i in range(min_overlaps.shape[0]):
-            result += f'{class_to_name[curcls]} AP:\n'
-            result += f'bbox ({min_overlaps[i, 0, j]:.2f}): '
-            for l in range(num_difficulty):
-                result += f'{mAPbbox[j, l, i]:.4f}'
-                result += ', ' if l < num_difficulty - 1 else '\n'
-            result += f'bev  ({min_overlaps[i, 1, j]:.2f}): '
-            for l in range(num_difficulty):
-                result += f'{mAPbev[j, l, i]:.4f}'
-                result += ', ' if l < num_difficulty - 1 else '\n'
-            result += f'3d   ({min_overlaps[i, 2, j]:.2f}): '
-            for l in range(num_difficulty):
-                result += f'{mAP3d[j, l, i]:.4f}'
-                result += ', ' if l < num_difficulty - 1 else '\n'
+            for ap_type, metric_mAPs in ap_types:
+                if all(mAP is None for mAP in metric_mAPs):
+                    continue
+                result += f'{CLASS_TO_NAME[curcls]} {ap_type}:\n'
+                for metric, mAP in enumerate(metric_mAPs):
+                    if mAP is None or (metric == 3 and not compute_aos):
+                        continue
+                    result += labels[metric].format(min_overlaps[i, min(metric, 2), j])
+                    result += ', '.join(f'{ap:.4f}' for ap in mAP[j, :, i]) + '\n'
 
-            if compute_aos:
-                result += f'aos        : '
-                for l in range(num_difficulty):
-                    result += f'{mAPaos[j, l, i]:.4f}'
-                    result += ', ' if l < num_difficulty - 1 else '\n'
-
-            result += f'{class_to_name[curcls]} AP_R40:\n'
-            result += f'bbox ({min_overlaps[i, 0, j]:.2f}): '
-            for l in range(num_difficulty):
-                result += f'{mAPbbox_R40[j, l, i]:.4f}'
-                result += ', ' if l < num_difficulty - 1 else '\n'
-            result += f'bev  ({min_overlaps[i, 1, j]:.2f}): '
-            for l in range(num_difficulty):
-                result += f'{mAPbev_R40[j, l, i]:.4f}'
-                result += ', ' if l < num_difficulty - 1 else '\n'
-            result += f'3d   ({min_overlaps[i, 2, j]:.2f}): '
-            for l in range(num_difficulty):
-                result += f'{mAP3d_R40[j, l, i]:.4f}'
-                result += ', ' if l < num_difficulty - 1 else '\n'
+    return result
+
+
+def official_result_dict(current_classes, min_overlaps, mAPs, compute_aos):
+    """
+    the same numbers as format_official_result(), but structured for json files.
+
+    Args:
+        current_classes: list of int
+        min_overlaps: ndarray of float, [num_minoverlap, num_metric, num_class]
+        mAPs: tuple, the results of do_eval(), the metrics and AP types which are None are left out
+        compute_aos: bool
+
+    Returns:
+        ret_dict: dict, class name -> list of dict per min_overlap setting,
+            'min_overlaps': dict, metric name -> float
+            'AP': dict, metric name -> list of float, [num_difficulty]
+            'AP_R40': dict, metric name -> list of float, [num_difficulty]
+
+    """
+    mAPbbox, mAPbev, mAP3d, mAPaos, mAPbbox_R40, mAPbev_R40, mAP3d_R40, mAPaos_R40 = mAPs
+    ap_types = [('AP', [mAPbbox, mAPbev, mAP3d, mAPaos]),
+                ('AP_R40', [mAPbbox_R40, mAPbev_R40, mAP3d_R40, mAPaos_R40])]
+    metric_names = METRIC_NAMES + ['aos']
+    ret_dict = {}
+    for j, curcls in enumerate(current_classes):
+        settings = []
+        for i in range(min_overlaps.shape[0]):
+            setting = {'min_overlaps': {name: float(min_overlaps[i, k, j]) for k, name in enumerate(metric_names[:3])
+                                        if ap_types[0][1][k] is not None or ap_types[1][1][k] is not None}}
+            for ap_type, metric_mAPs in ap_types:
+                if all(mAP is None for mAP in metric_mAPs):
+                    continue
+                setting[ap_type] = {metric_names[metric]: mAP[j, :, i].tolist()
+                                    for metric, mAP in enumerate(metric_mAPs)
+                                    if mAP is not None and (metric < 3 or compute_aos)}
+            settings.append(setting)
+        ret_dict[CLASS_TO_NAME[curcls]] = settings
+    return ret_dict
+
+
+def get_official_eval_result(gt_annos, dt_annos, current_classes, sparse_overlap=False,
+                             overlap_cache_dir=None, overlap_cache_size=4096, return_dict=False,
+                             match_records_file=None, compact_overlap=False, metrics=(0, 1, 2), difficultys=None,
+                             overlap_sets=None, ap_types=('AP', 'AP_R40', 'aos'), result_cache_dir=None,
+                             result_cache_size=256, min_score=-1, top_k=-1):
+    """
+
+    Args:
+        gt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        dt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        current_classes: int or list of int or list of str, desired classes
+        sparse_overlap: bool, whether to calculate overlaps only for candidate pairs from a grid index,
+            faster for crowded samples, e.g. detections without nms
+        overlap_cache_dir: str, the directory to keep the overlaps of each sample across runs, None: no cache
+        overlap_cache_size: int, the maximum size of overlap_cache_dir in MB, least recently used ones are removed
+        return_dict: bool, whether to return the structured results too
+        match_records_file: str, an npz file to save the match records of every object, see _get_match_records(),
+            None: not recorded
+        compact_overlap: bool, whether to keep only the nonzero overlaps of the samples, in float32 for bev and 3d
+        metrics: int or str or list of them, the evaluation types to run, 0 or 'bbox', 1 or 'bev', 2 or '3d',
+            the rotated overlaps are not computed without bev and 3d
+        difficultys: int or list of int, the distance bins to evaluate, None: all of them
+        overlap_sets: int or list of int, the rows of get_official_min_overlaps() to evaluate,
+            0: the strict one, e.g. 0.7 for cars, 1: the loose one, None: both
+        ap_types: str or list of str, 'AP': 11 recall positions, 'AP_R40': 40 recall positions,
+            'aos': the orientation similarity too at the same recall positions, only with bbox and valid alphas,
+            a ValueError is raised when it is given without 'AP' or 'AP_R40'
+        result_cache_dir: str, the directory to keep the results of the evaluations, keyed by the contents of the
+            annotations and the configuration, so that evaluating the same inputs again only loads them,
+            None: no cache, it is not used when match_records_file is given
+        result_cache_size: int, the maximum size of result_cache_dir in MB, least recently used ones are removed
+        min_score: float, drop the detections scoring lower before the evaluation, <= 0: not used
+        top_k: int, keep at most so many detections of each class in each sample, < 0: not used,
+            the detections of the classes which are not evaluated are always dropped, see prune_detections(), and
+            so are the ones which are never counted, see prune_unmatchable_detections(), unless match_records_file
+            is given
+
+    Returns:
+        result: str
+        ret_dict: dict, from official_result_dict(), with 'num_dropped': dict, 'class', 'min_score', 'top_k',
+            'unmatchable' -> int, the numbers of dropped detections, only when return_dict
+
+    """
+    current_classes = get_class_ints(current_classes)
+    metrics = get_metric_ints(metrics)
+    ap_types = [ap_types] if isinstance(ap_types, str) else list(ap_types)
+    for ap_type in ap_types:
+        if ap_type not in ('AP', 'AP_R40', 'aos'):
+            raise ValueError('unknown AP type {!r}'.format(ap_type))
+    if 'aos' in ap_types and 'AP' not in ap_types and 'AP_R40' not in ap_types:
+        raise ValueError("the AP type 'aos' needs 'AP' or 'AP_R40' for its recall positions")
+    # min_overlaps: ndarray of float, [num_minoverlap, num_metric, num_class]
+    min_overlaps = get_official_min_overlaps(current_classes)
+    if overlap_sets is not None:
+        min_overlaps = min_overlaps[np.atleast_1d(overlap_sets)]
+    if difficultys is None:
+        difficultys = [0, 1, 2, 3, 4, 5, 6, 7]
+    difficultys = [int(difficulty) for difficulty in np.atleast_1d(difficultys)]
+
+    # check whether alpha is valid
+    compute_aos = 'aos' in ap_types and 0 in metrics and check_alpha_valid(dt_annos)
+
+    result_cache = None
+    if result_cache_dir is not None and match_records_file is None:
+        result_cache = DiskCache(result_cache_dir, result_cache_size * 1024 * 1024, suffix='.json')
+        # every option which may change the results or the dropped counts is a part of the key, e.g. the rotated
+        # overlaps of sparse_overlap are float64 instead of float32, so a pair at min_overlap may be matched by one
+        # of them only
+        result_key = content_hash(RESULT_CACHE_VERSION, annos_content_hash(gt_annos), annos_content_hash(dt_annos),
+                                  current_classes, min_overlaps, difficultys, metrics, ap_types, compute_aos,
+                                  bool(sparse_overlap), bool(compact_overlap), float(min_score), int(top_k))
+        data = result_cache.load_bytes(result_key)
+        if data is not None:
+            cached = json.loads(data)
+            if return_dict:
+                return cached['result'], cached['results']
+            return cached['result']
+
+    dt_annos, kept, num_dropped = prune_detections(dt_annos, current_classes, min_score, top_k)
+    num_dropped['unmatchable'] = 0
+    if match_records_file is None:
+        # every detection has a match record otherwise
+        dt_annos, unmatchable_kept, num_dropped['unmatchable'] = prune_unmatchable_detections(
+            gt_annos, dt_annos, current_classes, min_overlaps, metrics)
+        kept = [indices[unmatchable_indices] for indices, unmatchable_indices in zip(kept, unmatchable_kept)]
+
+    overlap_cache = None
+    if overlap_cache_dir is not None:
+        overlap_cache = DiskCache(overlap_cache_dir, overlap_cache_size * 1024 * 1024)
+
+    # mAP result: ndarray of float, [num_class, num_difficulty, num_minoverlap]
+    match_records = None if match_records_file is None else []
+    mAPs = do_eval(gt_annos, dt_annos, current_classes, difficultys, min_overlaps, compute_aos, sparse_overlap,
+                   overlap_cache, match_records, compact_overlap, metrics,
+                   [ap_type for ap_type in ap_types if ap_type != 'aos'])
+    if match_records_file is not None:
+        save_match_records(match_records_file, unprune_match_records(concat_match_records(match_records), kept),
+                           current_classes, difficultys, min_overlaps)
+    result = format_official_result(current_classes, min_overlaps, mAPs, compute_aos)
+    ret_dict = official_result_dict(current_classes, min_overlaps, mAPs, compute_aos)
+    ret_dict['num_dropped'] = num_dropped
+    if result_cache is not None:
+        result_cache.save_bytes(result_key, json.dumps({'result': result, 'results': ret_dict}).encode())
+    if return_dict:
+        return result, ret_dict
+    return result
 
-            if compute_aos:
-                result += f'aos        : '
-                for l in range(num_difficulty):
-                    result += f'{mAPaos_R40[j, l, i]:.4f}'
-                    result += ', ' if l < num_difficulty - 1 else '\n'
 
+def get_coco_eval_result(gt_annos, dt_annos, current_classes, metrics=(1, 2), iou_thresholds=None,
+                         sparse_overlap=False, return_dict=False):
+    """
+    AP averaged over the IoU thresholds 0.5:0.05:0.95 in the way of COCO, the overlaps and the prepared data are
+    computed once, and all thresholds of a class are evaluated in the same passes over the samples.
+
+    Args:
+        gt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        dt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        current_classes: int or list of int or list of str, desired classes
+        metrics: tuple of int, the evaluation types, 0: bbox, 1: bev, 2: 3d
+        iou_thresholds: list of float, None: 0.5:0.05:0.95
+        sparse_overlap: bool, whether to calculate overlaps only for candidate pairs from a grid index
+        return_dict: bool, whether to return the structured results too
+
+    Returns:
+        result: str, AP_R40 of each threshold and their mean
+        ret_dict: dict, class name -> metric name -> dict, only when return_dict
+            'iou_thresholds': list of float, [num_threshold]
+            'AP', 'AP_R40': list of list of float, [num_threshold, num_difficulty]
+            'mAP', 'mAP_R40': list of float, [num_difficulty], the means over the thresholds
+
+    """
+    current_classes = get_class_ints(current_classes)
+    if iou_thresholds is None:
+        iou_thresholds = np.linspace(0.5, 0.95, 10)
+    iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+    difficultys = [0, 1, 2, 3, 4, 5, 6, 7]
+    # min_overlaps: ndarray of float, [num_threshold, num_metric, num_class], the same for all metrics and classes
+    min_overlaps = np.tile(iou_thresholds[:, np.newaxis, np.newaxis], [1, 3, len(current_classes)])
+    prepared = prepare_data(gt_annos, dt_annos, current_classes, difficultys)
+
+    ret_dict = {CLASS_TO_NAME[curcls]: {} for curcls in current_classes}
+    result = ''
+    for metric in metrics:
+        ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, metric, min_overlaps,
+                         sparse_overlap=sparse_overlap, prepared=prepared)
+        # [num_class, num_difficulty, num_threshold]
+        mAP, mAP_R40 = get_mAP(ret["precision"]), get_mAP_R40(ret["precision"])
+        for j, curcls in enumerate(current_classes):
+            ret_dict[CLASS_TO_NAME[curcls]][METRIC_NAMES[metric]] = {
+                'iou_thresholds': iou_thresholds.tolist(),
+                'AP': mAP[j].T.tolist(),
+                'AP_R40': mAP_R40[j].T.tolist(),
+                'mAP': mAP[j].mean(axis=-1).tolist(),
+                'mAP_R40': mAP_R40[j].mean(axis=-1).tolist(),
+            }
+
+    for curcls in current_classes:
+        result += f'{CLASS_TO_NAME[curcls]} AP_R40@[{iou_thresholds[0]:.2f}:{iou_thresholds[-1]:.2f}]:\n'
+        for metric in metrics:
+            metric_dict = ret_dict[CLASS_TO_NAME[curcls]][METRIC_NAMES[metric]]
+            for i, iou_threshold in enumerate(iou_thresholds):
+                result += f'{METRIC_NAMES[metric]:4s} ({iou_threshold:.2f}): '
+                result += ', '.join(f'{ap:.4f}' for ap in metric_dict['AP_R40'][i]) + '\n'
+            result += f'{METRIC_NAMES[metric]:4s} (mean): '
+            result += ', '.join(f'{ap:.4f}' for ap in metric_dict['mAP_R40']) + '\n'
+
+    if return_dict:
+        return result, ret_dict
     return result
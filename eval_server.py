@@ -0,0 +1,289 @@
+import fire
+import itertools
+import json
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numba
+import numpy as np
+
+import kitti_common as kitti
+from eval import get_official_eval_result
+
+# the options of a request which are passed to get_official_eval_result()
+EVAL_OPTIONS = ['sparse_overlap', 'metrics', 'difficultys', 'overlap_sets', 'ap_types', 'min_score', 'top_k']
+
+# the kernels of one job run at a time, the default threading layer of numba must not be entered by several threads
+# at once, and the rotated overlaps share the GPU anyway
+_kernel_lock = threading.Lock()
+
+# the shapes of the array fields of annotations, the others are 1-d
+ANNO_SHAPES = {
+    'bbox': (-1, 4),
+    'dimensions': (-1, 3),
+    'location': (-1, 3),
+}
+
+
+def annos_to_json(annos):
+    """
+
+    Args:
+        annos: list of dict, must from get_label_annos() in kitti_common.py
+
+    Returns:
+        annos: list of dict, the arrays are lists
+
+    """
+    return [{key: np.asarray(value).tolist() for key, value in anno.items()} for anno in annos]
+
+
+def annos_from_json(annos):
+    """
+
+    Args:
+        annos: list of dict, from annos_to_json()
+
+    Returns:
+        annos: list of dict, the same as get_label_annos() in kitti_common.py
+
+    """
+    results = []
+    for anno in annos:
+        result = {}
+        for key, value in anno.items():
+            if key == 'name':
+                result[key] = np.array(value, dtype=str)
+            elif key == 'occluded':
+                result[key] = np.array(value, dtype=np.int64)
+            else:
+                result[key] = np.array(value, dtype=np.float64).reshape(ANNO_SHAPES.get(key, (-1, )))
+        results.append(result)
+    return results
+
+
+class EvalService(object):
+    """
+    a job queue running evaluations on a pool of worker threads in one process, so that all jobs share the parsed
+    ground truth of each split and the compiled kernels. the workers parse their files at the same time, but their
+    kernels run one job at a time. the job records are replaced as a whole under the lock and never changed
+    afterwards, so that they are read safely by the request handlers.
+    """
+
+    def __init__(self, num_workers=2, max_finished_jobs=1000, num_threads=None):
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self.max_finished_jobs = max_finished_jobs
+        # the threads of the parallel kernels, set in each worker since the setting of numba is per thread
+        self.num_threads = num_threads
+        self.jobs = {}
+        self.job_ids = itertools.count()
+        self.gt_annos = {}
+        # one lock per split, so that parsing a split only blocks the jobs of the same split
+        self.gt_locks = {}
+        self.lock = threading.Lock()
+
+    def get_gt_annos(self, label_path, label_split_file):
+        with open(label_split_file, 'r') as f:
+            image_ids = [int(line) for line in f.readlines()]
+        key = (os.path.abspath(label_path), tuple(image_ids))
+        with self.lock:
+            gt_lock = self.gt_locks.setdefault(key, threading.Lock())
+        with gt_lock:
+            if key not in self.gt_annos:
+                self.gt_annos[key] = kitti.get_label_annos(label_path, image_ids)
+            return self.gt_annos[key]
+
+    def submit(self, request):
+        """
+
+        Args:
+            request: dict,
+                'label_path': str, the ground truth folder
+                'label_split_file': str, the image ids to evaluate
+                'result_path': str, the result folder, or
+                'dt_annos': list of dict, from annos_to_json()
+                'current_classes', 'score_thresh': the same as evaluate()
+                'sparse_overlap', 'metrics', 'difficultys', 'overlap_sets', 'ap_types', 'min_score', 'top_k':
+                    optional, the same as get_official_eval_result() in eval.py
+
+        Returns:
+            job_id: int
+
+        """
+        with self.lock:
+            job_id = next(self.job_ids)
+            self.jobs[job_id] = {'status': 'queued', 'submit_time': time.time()}
+            finished = [i for i, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+            for i in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self.jobs[i]
+        self.executor.submit(self._run, job_id, request)
+        return job_id
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id] = dict(self.jobs[job_id], **fields)
+
+    def _run(self, job_id, request):
+        self._update(job_id, status='running')
+        job = {}
+        try:
+            gt_annos = self.get_gt_annos(request['label_path'], request['label_split_file'])
+            if 'dt_annos' in request:
+                dt_annos = annos_from_json(request['dt_annos'])
+            else:
+                dt_annos = kitti.get_label_annos(request['result_path'])
+            score_thresh = request.get('score_thresh', -1)
+            if score_thresh > 0:
+                dt_annos = kitti.filter_annos_low_score(dt_annos, score_thresh)
+            with _kernel_lock:
+                if self.num_threads is not None:
+                    numba.set_num_threads(self.num_threads)
+                job['result'], job['results'] = get_official_eval_result(
+                    gt_annos, dt_annos, request.get('current_classes', 0), return_dict=True,
+                    **{key: request[key] for key in EVAL_OPTIONS if key in request})
+            job['status'] = 'done'
+        except Exception as e:
+            job['error'] = repr(e)
+            job['status'] = 'failed'
+        job['finish_time'] = time.time()
+        self._update(job_id, **job)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else dict(job)
+
+
+class EvalRequestHandler(BaseHTTPRequestHandler):
+    """POST /jobs with a json request submits a job, GET /jobs/<job_id> returns its status and results"""
+    service = None
+
+    def _send_json(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            return self._send_json(404, {'error': 'unknown path'})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        except ValueError as e:
+            return self._send_json(400, {'error': repr(e)})
+        self._send_json(200, {'job_id': self.service.submit(request)})
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'jobs' or not parts[1].isdigit():
+            return self._send_json(404, {'error': 'unknown path'})
+        job = self.service.get(int(parts[1]))
+        if job is None:
+            return self._send_json(404, {'error': 'unknown job'})
+        self._send_json(200, job)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host='127.0.0.1', port=8765, num_workers=2, num_threads=None):
+    """
+    run the evaluation service until interrupted, only on localhost by default since there is no authentication.
+
+    Args:
+        host: str
+        port: int
+        num_workers: int, the number of jobs parsing their files at the same time, the kernels run one job at a time
+        num_threads: int, the threads of the parallel kernels, None: all of numba.config.NUMBA_NUM_THREADS
+
+    """
+    handler = type('Handler', (EvalRequestHandler, ), {'service': EvalService(num_workers, num_threads=num_threads)})
+    server = ThreadingHTTPServer((host, port), handler)
+    print('Serving evaluations on http://{}:{:d}'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+class EvalClient(object):
+    """a thin client of serve(), the jobs run in the server process"""
+
+    def __init__(self, host='127.0.0.1', port=8765, poll_interval=0.5):
+        self.url = 'http://{}:{:d}/jobs'.format(host, port)
+        self.poll_interval = poll_interval
+
+    def submit(self, **request):
+        data = json.dumps(request).encode()
+        http_request = urllib.request.Request(self.url, data=data, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(http_request) as response:
+            return json.loads(response.read())['job_id']
+
+    def status(self, job_id):
+        with urllib.request.urlopen('{}/{:d}'.format(self.url, job_id)) as response:
+            return json.loads(response.read())
+
+    def wait(self, job_id, timeout=None):
+        start_time = time.time()
+        while True:
+            job = self.status(job_id)
+            if job['status'] in ('done', 'failed'):
+                return job
+            if timeout is not None and time.time() - start_time > timeout:
+                raise TimeoutError('job {:d} is still {}'.format(job_id, job['status']))
+            time.sleep(self.poll_interval)
+
+    def get_official_eval_result(self, dt_annos, current_classes, label_path='kitti/training/label_2',
+                                 label_split_file='kitti/training/ImageSets/val.txt', sparse_overlap=False,
+                                 return_dict=False, metrics=(0, 1, 2), difficultys=None, overlap_sets=None,
+                                 ap_types=('AP', 'AP_R40', 'aos'), min_score=-1, top_k=-1):
+        """
+        the same as get_official_eval_result() in eval.py, but the ground truth is given by its files and parsed once
+        by the server.
+
+        Args:
+            dt_annos: list of dict, must from get_label_annos() in kitti_common.py, or str, the result folder
+            current_classes: int or list of int or list of str, desired classes
+            label_path: str, the ground truth folder seen by the server
+            label_split_file: str, the image ids seen by the server
+            sparse_overlap: bool
+            return_dict: bool, whether to return the structured results too
+            metrics, difficultys, overlap_sets, ap_types, min_score, top_k: the same as get_official_eval_result()
+
+        Returns:
+            result: str
+            ret_dict: dict, only when return_dict
+
+        """
+        request = {
+            'label_path': os.path.abspath(label_path),
+            'label_split_file': os.path.abspath(label_split_file),
+            'current_classes': current_classes,
+            'sparse_overlap': sparse_overlap,
+            'metrics': metrics,
+            'difficultys': difficultys,
+            'overlap_sets': overlap_sets,
+            'ap_types': ap_types,
+            'min_score': min_score,
+            'top_k': top_k,
+        }
+        if isinstance(dt_annos, str):
+            request['result_path'] = os.path.abspath(dt_annos)
+        else:
+            request['dt_annos'] = annos_to_json(dt_annos)
+        job = self.wait(self.submit(**request))
+        if job['status'] == 'failed':
+            raise RuntimeError(job['error'])
+        if return_dict:
+            return job['result'], job['results']
+        return job['result']
+
+
+if __name__ == '__main__':
+    fire.Fire()
@@ -1,8 +1,23 @@
 import fire
+import collections
 import datetime
+import json
+import os
+import pathlib
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numba
+import numpy as np
 
 import kitti_common as kitti
-from eval import get_official_eval_result
+from disk_cache import content_hash
+from eval import get_official_eval_result, get_coco_eval_result, get_class_ints, get_official_min_overlaps, format_official_result
+from frame_stats import (compute_frame_statistics, select_frame_statistics, concat_frame_statistics,
+                         merge_frame_statistics, get_frame_statistics_mAP, save_frame_statistics,
+                         load_frame_statistics, get_frame_strata, stratified_frame_order, bootstrap_mAP_errors,
+                         CONFIG_KEYS)
 
 
 def _read_imageset_file(path):
@@ -11,17 +26,198 @@ def _read_imageset_file(path):
     return [int(line) for line in lines]
 
 
+def _set_num_threads(num_threads):
+    # the threads of the parallel kernels called by this thread, at most numba.config.NUMBA_NUM_THREADS, None: all
+    if num_threads is not None:
+        numba.set_num_threads(num_threads)
+
+
 def evaluate(result_path,
              label_path='kitti/training/label_2',
              label_split_file='kitti/training/ImageSets/val.txt',
              current_classes=0,
-             score_thresh=-1):
+             score_thresh=-1,
+             sparse_overlap=False,
+             overlap_cache_dir=None,
+             overlap_cache_size=4096,
+             match_records_file=None,
+             compact_overlap=False,
+             metrics=(0, 1, 2),
+             difficultys=None,
+             overlap_sets=None,
+             ap_types=('AP', 'AP_R40', 'aos'),
+             result_cache_dir=None,
+             result_cache_size=256,
+             num_threads=None,
+             top_k=-1):
+    _set_num_threads(num_threads)
+    dt_annos = kitti.get_label_annos(result_path)
+    val_image_ids = _read_imageset_file(label_split_file)
+    gt_annos = kitti.get_label_annos(label_path, val_image_ids)
+    ap_result_str, ret_dict = get_official_eval_result(gt_annos, dt_annos, current_classes, sparse_overlap,
+                                                       overlap_cache_dir, overlap_cache_size, return_dict=True,
+                                                       match_records_file=match_records_file,
+                                                       compact_overlap=compact_overlap, metrics=metrics,
+                                                       difficultys=difficultys, overlap_sets=overlap_sets,
+                                                       ap_types=ap_types, result_cache_dir=result_cache_dir,
+                                                       result_cache_size=result_cache_size,
+                                                       min_score=score_thresh, top_k=top_k)
+    num_dropped = ret_dict['num_dropped']
+    if sum(num_dropped.values()) > 0:
+        print('Dropped detections: {:d} of other classes, {:d} below min_score, {:d} beyond top_k, '
+              '{:d} never counted'.format(num_dropped['class'], num_dropped['min_score'], num_dropped['top_k'],
+                                          num_dropped['unmatchable']))
+    print(ap_result_str)
+
+    log_file = 'results/log_eval_%s.txt' % datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    with open(log_file, 'a') as f:
+        f.write(ap_result_str)
+
+
+def evaluate_coco(result_path,
+                  label_path='kitti/training/label_2',
+                  label_split_file='kitti/training/ImageSets/val.txt',
+                  current_classes=0,
+                  score_thresh=-1,
+                  metrics=(1, 2),
+                  sparse_overlap=False,
+                  num_threads=None):
+    _set_num_threads(num_threads)
     dt_annos = kitti.get_label_annos(result_path)
     if score_thresh > 0:
         dt_annos = kitti.filter_annos_low_score(dt_annos, score_thresh)
     val_image_ids = _read_imageset_file(label_split_file)
     gt_annos = kitti.get_label_annos(label_path, val_image_ids)
-    ap_result_str = get_official_eval_result(gt_annos, dt_annos, current_classes)
+    ap_result_str = get_coco_eval_result(gt_annos, dt_annos, current_classes, metrics,
+                                         sparse_overlap=sparse_overlap)
+    print(ap_result_str)
+
+    log_file = 'results/log_eval_coco_%s.txt' % datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    with open(log_file, 'a') as f:
+        f.write(ap_result_str)
+
+
+def _get_result_ids(result_path):
+    # the same samples as kitti.get_label_annos(result_path)
+    prog = re.compile(r'^\d{6}.txt$')
+    return sorted(int(p.stem) for p in pathlib.Path(result_path).glob('*.txt') if prog.match(p.name))
+
+
+def evaluate_incremental(result_path,
+                         label_path='kitti/training/label_2',
+                         label_split_file='kitti/training/ImageSets/val.txt',
+                         current_classes=0,
+                         score_thresh=-1,
+                         sparse_overlap=False,
+                         state_dir=None,
+                         num_threads=None):
+    """
+    the same as evaluate(), but the statistics of every sample are kept in state_dir together with the hash of its
+    label and result files, and only the samples whose files changed since the last run are parsed, overlapped and
+    matched again. the statistics of all samples are then merged to the same AP tables. the default state_dir is
+    keyed by the result, label and split paths.
+    """
+    _set_num_threads(num_threads)
+    if state_dir is None:
+        state_dir = os.path.join('results', 'incremental',
+                                 content_hash(os.path.abspath(result_path), os.path.abspath(label_path),
+                                              os.path.abspath(label_split_file))[:16])
+    os.makedirs(state_dir, exist_ok=True)
+    state_file = os.path.join(state_dir, 'frame_stats.npz')
+
+    current_classes = get_class_ints(current_classes)
+    min_overlaps = get_official_min_overlaps(current_classes)
+    difficultys = [0, 1, 2, 3, 4, 5, 6, 7]
+
+    val_image_ids = _read_imageset_file(label_split_file)
+    result_ids = _get_result_ids(result_path)
+    assert len(val_image_ids) == len(result_ids)
+    gt_paths = [os.path.join(label_path, kitti.get_image_index_str(idx) + '.txt') for idx in val_image_ids]
+    dt_paths = [os.path.join(result_path, kitti.get_image_index_str(idx) + '.txt') for idx in result_ids]
+    frame_keys = []
+    for gt_path, dt_path in zip(gt_paths, dt_paths):
+        with open(gt_path, 'rb') as f_gt, open(dt_path, 'rb') as f_dt:
+            # the overlaps of sparse_overlap are computed in another precision, so it is a part of the key
+            frame_keys.append(content_hash(f_gt.read(), f_dt.read(), score_thresh, bool(sparse_overlap)))
+
+    old_stats = None
+    if os.path.exists(state_file):
+        old_stats = load_frame_statistics(state_file)
+        config = [current_classes, difficultys, min_overlaps, [0, 1, 2]]
+        if not all(np.array_equal(old_stats[key], value) for key, value in zip(CONFIG_KEYS, config)):
+            old_stats = None
+    old_frames = {} if old_stats is None else {key: i for i, key in enumerate(old_stats['frame_keys'])}
+
+    changed = [i for i, key in enumerate(frame_keys) if key not in old_frames]
+    print('Reused samples: {:d}, re-evaluated samples: {:d}'.format(len(frame_keys) - len(changed), len(changed)))
+    # positions: the index of each sample in the concatenated old and new statistics
+    stats_list = [] if old_stats is None else [old_stats]
+    positions = [old_frames.get(key, -1) for key in frame_keys]
+    if len(changed) > 0:
+        dt_annos = [kitti.get_label_anno(dt_paths[i]) for i in changed]
+        if score_thresh > 0:
+            dt_annos = kitti.filter_annos_low_score(dt_annos, score_thresh)
+        gt_annos = [kitti.get_label_anno(gt_paths[i]) for i in changed]
+        new_stats = compute_frame_statistics(gt_annos, dt_annos, current_classes, difficultys, min_overlaps,
+                                             sparse_overlap=sparse_overlap,
+                                             image_ids=[val_image_ids[i] for i in changed])
+        new_stats['frame_keys'] = np.array([frame_keys[i] for i in changed])
+        num_old = 0 if old_stats is None else len(old_stats['frame_keys'])
+        for j, i in enumerate(changed):
+            positions[i] = num_old + j
+        stats_list.append(new_stats)
+    stats = select_frame_statistics(concat_frame_statistics(stats_list), positions)
+    save_frame_statistics(state_file, stats)
+
+    mAPs, compute_aos = get_frame_statistics_mAP(stats)
+    ap_result_str = format_official_result(current_classes, min_overlaps, mAPs, compute_aos)
+    print(ap_result_str)
+
+    log_file = 'results/log_eval_%s.txt' % datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    with open(log_file, 'a') as f:
+        f.write(ap_result_str)
+
+
+def evaluate_shard(result_path,
+                   shard_file,
+                   label_path='kitti/training/label_2',
+                   label_split_file='kitti/training/ImageSets/val.txt',
+                   shard_index=0,
+                   num_shards=1,
+                   current_classes=0,
+                   score_thresh=-1,
+                   sparse_overlap=False,
+                   num_threads=None):
+    """
+    match the samples shard_index, shard_index + num_shards, ... of the split and save their statistics to shard_file,
+    merge_shards() of all shard files gives the same APs as evaluate() of the whole split.
+    """
+    _set_num_threads(num_threads)
+    current_classes = get_class_ints(current_classes)
+    min_overlaps = get_official_min_overlaps(current_classes)
+    difficultys = [0, 1, 2, 3, 4, 5, 6, 7]
+
+    val_image_ids = _read_imageset_file(label_split_file)
+    result_ids = _get_result_ids(result_path)
+    assert len(val_image_ids) == len(result_ids)
+    frame_indices = list(range(shard_index, len(val_image_ids), num_shards))
+    dt_annos = kitti.get_label_annos(result_path, [result_ids[i] for i in frame_indices])
+    if score_thresh > 0:
+        dt_annos = kitti.filter_annos_low_score(dt_annos, score_thresh)
+    gt_annos = kitti.get_label_annos(label_path, [val_image_ids[i] for i in frame_indices])
+    stats = compute_frame_statistics(gt_annos, dt_annos, current_classes, difficultys, min_overlaps,
+                                     sparse_overlap=sparse_overlap,
+                                     image_ids=[val_image_ids[i] for i in frame_indices])
+    stats['frame_indices'] = np.array(frame_indices, dtype=np.int64)
+    save_frame_statistics(shard_file, stats)
+
+
+def merge_shards(*shard_files):
+    """merge the files of evaluate_shard() and print the APs of all their samples"""
+    stats = merge_frame_statistics([load_frame_statistics(shard_file) for shard_file in shard_files])
+    current_classes = stats['current_classes'].tolist()
+    mAPs, compute_aos = get_frame_statistics_mAP(stats)
+    ap_result_str = format_official_result(current_classes, stats['min_overlaps'], mAPs, compute_aos)
     print(ap_result_str)
 
     log_file = 'results/log_eval_%s.txt' % datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
@@ -29,5 +225,275 @@ def evaluate(result_path,
         f.write(ap_result_str)
 
 
+def quick_evaluate(result_path,
+                   label_path='kitti/training/label_2',
+                   label_split_file='kitti/training/ImageSets/val.txt',
+                   current_classes=0,
+                   score_thresh=-1,
+                   max_frames=500,
+                   time_budget=-1,
+                   chunk_size=100,
+                   num_bootstrap=20,
+                   seed=0,
+                   sparse_overlap=False,
+                   num_threads=None):
+    """
+    evaluate a deterministic subset of the split, stratified by the farthest distance bin of each sample, and
+    estimate the standard errors of the APs by a stratified bootstrap. the samples are evaluated in chunks until
+    max_frames samples are done or time_budget seconds have passed, -1: no limit.
+    """
+    _set_num_threads(num_threads)
+    start_time = time.time()
+    current_classes = get_class_ints(current_classes)
+    min_overlaps = get_official_min_overlaps(current_classes)
+    difficultys = [0, 1, 2, 3, 4, 5, 6, 7]
+
+    val_image_ids = _read_imageset_file(label_split_file)
+    result_ids = _get_result_ids(result_path)
+    assert len(val_image_ids) == len(result_ids)
+    gt_annos = kitti.get_label_annos(label_path, val_image_ids)
+    strata = get_frame_strata(gt_annos, current_classes)
+    order = stratified_frame_order(strata, seed)
+    if max_frames > 0:
+        order = order[:max_frames]
+
+    stats_list = []
+    for chunk_start in range(0, len(order), chunk_size):
+        if time_budget > 0 and len(stats_list) > 0 and time.time() - start_time > time_budget:
+            break
+        frames = order[chunk_start:chunk_start + chunk_size]
+        dt_annos = kitti.get_label_annos(result_path, [result_ids[i] for i in frames])
+        if score_thresh > 0:
+            dt_annos = kitti.filter_annos_low_score(dt_annos, score_thresh)
+        stats_list.append(compute_frame_statistics([gt_annos[i] for i in frames], dt_annos, current_classes,
+                                                   difficultys, min_overlaps, sparse_overlap=sparse_overlap))
+    stats = concat_frame_statistics(stats_list)
+    frames = order[:len(stats['tp_nums'])]
+
+    mAPs, compute_aos = get_frame_statistics_mAP(stats)
+    errors = bootstrap_mAP_errors(stats, strata[frames], len(val_image_ids), num_bootstrap, seed)
+    ap_result_str = 'Quick evaluation of {:d} / {:d} samples in {:.1f} s\n'.format(
+        len(frames), len(val_image_ids), time.time() - start_time)
+    ap_result_str += format_official_result(current_classes, min_overlaps, mAPs, compute_aos)
+    ap_result_str += 'Estimated standard errors:\n'
+    ap_result_str += format_official_result(current_classes, min_overlaps, errors,
+                                            compute_aos and errors[3] is not None)
+    print(ap_result_str)
+
+    log_file = 'results/log_eval_quick_%s.txt' % datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    with open(log_file, 'a') as f:
+        f.write(ap_result_str)
+
+
+def _load_chunk(result_path, label_path, result_ids, image_ids, score_thresh):
+    dt_annos = kitti.get_label_annos(result_path, result_ids)
+    if score_thresh > 0:
+        dt_annos = kitti.filter_annos_low_score(dt_annos, score_thresh)
+    gt_annos = kitti.get_label_annos(label_path, image_ids)
+    return gt_annos, dt_annos
+
+
+def evaluate_pipelined(result_path,
+                       label_path='kitti/training/label_2',
+                       label_split_file='kitti/training/ImageSets/val.txt',
+                       current_classes=0,
+                       score_thresh=-1,
+                       chunk_size=200,
+                       queue_depth=4,
+                       num_workers=2,
+                       sparse_overlap=False,
+                       num_threads=None):
+    """
+    the same as evaluate(), but the samples are parsed in chunks by a pool of processes while the chunks parsed before
+    are overlapped and matched into frame statistics, at most queue_depth chunks are parsed and waiting at any time.
+    """
+    _set_num_threads(num_threads)
+    current_classes = get_class_ints(current_classes)
+    min_overlaps = get_official_min_overlaps(current_classes)
+    difficultys = [0, 1, 2, 3, 4, 5, 6, 7]
+
+    val_image_ids = _read_imageset_file(label_split_file)
+    result_ids = _get_result_ids(result_path)
+    assert len(val_image_ids) == len(result_ids)
+    chunk_starts = list(range(0, len(val_image_ids), chunk_size))
+
+    stats_list = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = collections.deque()
+        next_chunk = 0
+        while next_chunk < len(chunk_starts) or len(pending) > 0:
+            # keep queue_depth chunks parsing or parsed ahead of the matching
+            while next_chunk < len(chunk_starts) and len(pending) < queue_depth:
+                chunk = slice(chunk_starts[next_chunk], chunk_starts[next_chunk] + chunk_size)
+                pending.append(executor.submit(_load_chunk, result_path, label_path, result_ids[chunk],
+                                               val_image_ids[chunk], score_thresh))
+                next_chunk += 1
+            gt_annos, dt_annos = pending.popleft().result()
+            stats_list.append(compute_frame_statistics(gt_annos, dt_annos, current_classes, difficultys,
+                                                       min_overlaps, sparse_overlap=sparse_overlap))
+    stats = concat_frame_statistics(stats_list)
+
+    mAPs, compute_aos = get_frame_statistics_mAP(stats)
+    ap_result_str = format_official_result(current_classes, min_overlaps, mAPs, compute_aos)
+    print(ap_result_str)
+
+    log_file = 'results/log_eval_%s.txt' % datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    with open(log_file, 'a') as f:
+        f.write(ap_result_str)
+
+
+def evaluate_splits(result_path,
+                    split_files,
+                    label_path='kitti/training/label_2',
+                    current_classes=0,
+                    score_thresh=-1,
+                    sparse_overlap=False,
+                    num_threads=None):
+    """
+    evaluate several splits or subsets, e.g. val, night and highway, in one run. the union of their samples is parsed,
+    overlapped and matched once, and the APs of each split are reduced from the statistics of its samples, the same
+    as evaluate() of each split. the result files are named by the image ids of the samples.
+    """
+    _set_num_threads(num_threads)
+    current_classes = get_class_ints(current_classes)
+    min_overlaps = get_official_min_overlaps(current_classes)
+    difficultys = [0, 1, 2, 3, 4, 5, 6, 7]
+
+    if isinstance(split_files, str):
+        split_files = [split_files]
+    split_ids = [_read_imageset_file(split_file) for split_file in split_files]
+    union_ids = sorted(set(idx for image_ids in split_ids for idx in image_ids))
+    missing = set(union_ids) - set(_get_result_ids(result_path))
+    if len(missing) > 0:
+        raise ValueError('no results of {:d} samples, e.g. {}'.format(
+            len(missing), kitti.get_image_index_str(min(missing))))
+    gt_annos = kitti.get_label_annos(label_path, union_ids)
+    dt_annos = kitti.get_label_annos(result_path, union_ids)
+    if score_thresh > 0:
+        dt_annos = kitti.filter_annos_low_score(dt_annos, score_thresh)
+    print('Evaluating {:d} splits over {:d} samples'.format(len(split_files), len(union_ids)))
+    stats = compute_frame_statistics(gt_annos, dt_annos, current_classes, difficultys, min_overlaps,
+                                     sparse_overlap=sparse_overlap, image_ids=union_ids)
+
+    positions = {idx: i for i, idx in enumerate(union_ids)}
+    ap_result_str = ''
+    for split_file, image_ids in zip(split_files, split_ids):
+        # in the order of the split file, so that the alphas are checked on the same sample as evaluate()
+        split_stats = select_frame_statistics(stats, [positions[idx] for idx in image_ids])
+        mAPs, compute_aos = get_frame_statistics_mAP(split_stats)
+        ap_result_str += 'Split {} ({:d} samples):\n'.format(split_file, len(image_ids))
+        ap_result_str += format_official_result(current_classes, min_overlaps, mAPs, compute_aos)
+    print(ap_result_str)
+
+    log_file = 'results/log_eval_splits_%s.txt' % datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    with open(log_file, 'a') as f:
+        f.write(ap_result_str)
+
+
+def _result_folder_mtime(result_folder):
+    # the last change of the folder or any of its files
+    return max([entry.stat().st_mtime for entry in os.scandir(result_folder)] + [os.stat(result_folder).st_mtime])
+
+
+def _result_folder_ready(result_folder, num_sample, marker_file, settle_time):
+    if marker_file is not None:
+        return os.path.exists(os.path.join(result_folder, marker_file))
+    # the last result file may still be written, so the folder must also be unchanged for a while
+    return (len(_get_result_ids(result_folder)) >= num_sample
+            and time.time() - _result_folder_mtime(result_folder) >= settle_time)
+
+
+def watch(watch_dir,
+          label_path='kitti/training/label_2',
+          label_split_file='kitti/training/ImageSets/val.txt',
+          current_classes=0,
+          score_thresh=-1,
+          sparse_overlap=False,
+          marker_file=None,
+          history_file=None,
+          error_file=None,
+          poll_interval=10.0,
+          settle_time=30.0,
+          max_evals=-1,
+          num_threads=None):
+    """
+    keep running and evaluate every sub folder of watch_dir, e.g. the results of each checkpoint, once it is complete.
+    the ground truth is parsed and the kernels are compiled only once for all of them.
+
+    Args:
+        watch_dir: str, the folder containing result folders
+        marker_file: str, a result folder is complete when it contains this file, None: when it contains a result
+            file for every sample in label_split_file and none of its files changed for settle_time seconds
+        history_file: str, a json line is appended for each evaluated folder, and folders in it are not evaluated again,
+            None: watch_dir/eval_history.jsonl
+        error_file: str, a json line is appended for each failed evaluation, the folder is evaluated again once it
+            changes, None: watch_dir/eval_errors.jsonl
+        poll_interval: float, seconds between two scans of watch_dir
+        settle_time: float, seconds without changes before a folder without marker_file is complete
+        max_evals: int, stop after evaluating so many folders, failed ones included, -1: never stop
+        num_threads: int, the threads of the parallel kernels, None: all of numba.config.NUMBA_NUM_THREADS
+
+    """
+    _set_num_threads(num_threads)
+    if history_file is None:
+        history_file = os.path.join(watch_dir, 'eval_history.jsonl')
+    if error_file is None:
+        error_file = os.path.join(watch_dir, 'eval_errors.jsonl')
+    evaluated = set()
+    if os.path.exists(history_file):
+        with open(history_file, 'r') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        evaluated = {record['result_path'] for record in records if 'error' not in record}
+    # result folder -> its last change when it failed
+    failed = {}
+
+    val_image_ids = _read_imageset_file(label_split_file)
+    gt_annos = kitti.get_label_annos(label_path, val_image_ids)
+    num_eval = 0
+    while max_evals < 0 or num_eval < max_evals:
+        result_folders = sorted(entry.path for entry in os.scandir(watch_dir) if entry.is_dir())
+        pending = []
+        for folder in result_folders:
+            if folder in evaluated:
+                continue
+            try:
+                if (failed.get(folder) != _result_folder_mtime(folder)
+                        and _result_folder_ready(folder, len(val_image_ids), marker_file, settle_time)):
+                    pending.append(folder)
+            except OSError:
+                # the folder was removed or renamed during the scan
+                continue
+        if len(pending) == 0:
+            time.sleep(poll_interval)
+            continue
+        for result_folder in pending[:max_evals - num_eval if max_evals >= 0 else None]:
+            start_time = time.time()
+            folder_mtime = None
+            record = {'result_path': result_folder}
+            try:
+                folder_mtime = _result_folder_mtime(result_folder)
+                dt_annos = kitti.get_label_annos(result_folder)
+                if score_thresh > 0:
+                    dt_annos = kitti.filter_annos_low_score(dt_annos, score_thresh)
+                ap_result_str, record['results'] = get_official_eval_result(
+                    gt_annos, dt_annos, current_classes, sparse_overlap, return_dict=True)
+                print(result_folder)
+                print(ap_result_str)
+            except Exception as e:
+                # a broken result folder must not stop the watch, it is recorded and retried once it changes
+                print('Failed to evaluate {}: {!r}'.format(result_folder, e))
+                record['error'] = repr(e)
+            record['time'] = datetime.datetime.now().isoformat(timespec='seconds')
+            record['elapsed'] = time.time() - start_time
+            with open(history_file if 'error' not in record else error_file, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+            if 'error' in record:
+                failed[result_folder] = folder_mtime
+            else:
+                evaluated.add(result_folder)
+                failed.pop(result_folder, None)
+            num_eval += 1
+
+
 if __name__ == '__main__':
     fire.Fire()
@@ -0,0 +1,621 @@
+import os
+
+import numba
+import numpy as np
+
+from eval import (get_split_parts, get_thresholds, compute_statistics_jit, sparse_frame_overlap, _sample_offsets,
+                  _dontcare_block,
+                  _compact_thresholds, calculate_iou_partly, calculate_iou_sparse, prepare_data, compute_pr_curves,
+                  get_mAP, get_mAP_R40, _get_distance_bins, CLASS_NAMES)
+
+# statistics with one entry per frame, the others are shared by all frames or indexed by the per-frame counts
+FRAME_KEYS = ['num_valid_gts', 'tp_nums', 'step_nums', 'alpha_flags', 'image_ids', 'frame_indices', 'frame_keys']
+CONFIG_KEYS = ['current_classes', 'difficultys', 'min_overlaps', 'metrics']
+
+
+@numba.jit(nopython=True)
+def frame_step_statistics(overlap, gt_data, dt_data, ignored_gt, ignored_dt, dc_overlap, metric, min_overlap,
+                          step_scores, step_deltas, compute_aos=False):
+    """
+    the statistics of one sample at every score threshold, as the changes at the scores of its detections.
+    compute_statistics_jit(score_thresh=t, compute_fp=True) of the sample is equal to
+    (0, 0, num_valid_gt, 0) + the sum of step_deltas with step_scores >= t, with similarity -1 as 0.
+
+    a detection without an overlap above min_overlap to any ground truth object is never assigned, so it only adds
+    a false positive at its score, unless it is ignored or in a DontCare region. only the other detections are
+    matched again, at their own scores, so the cost is O(num_gt * num_dt) to find them plus
+    O(num_gt * num_match_dt ** 2) for the matching, where num_match_dt is the number of detections overlapping some
+    ground truth object, instead of O(num_gt * num_dt ** 2).
+
+    Args:
+        overlap: ndarray of float, [num_gt, num_dt]
+        gt_data: ndarray of float, [num_gt, 5], bboxes, alphas
+        dt_data: ndarray of float, [num_dt, 6], bboxes, alphas, scores
+        ignored_gt: ndarray of int, [num_gt], 0: not ignored, 1: ignored, -1: unknown
+        ignored_dt: ndarray of int, [num_dt], 0: not ignored, 1: ignored, -1: unknown
+        dc_overlap: ndarray of float, [num_dt, num_dc], from dontcare_overlaps()
+        metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
+        min_overlap: float
+        step_scores: ndarray of float, [num_dt], output scores in descending order
+        step_deltas: ndarray of float, [num_dt, 4], output changes of tp, fp, fn, similarity
+        compute_aos: bool
+
+    Returns:
+        num_step: int, the number of filled rows of step_scores and step_deltas
+
+    """
+    num_gt, num_dt = overlap.shape
+    dt_scores = dt_data[:, -1]
+    matchable = np.zeros((num_dt, ), dtype=np.bool_)
+    num_fp_only = 0
+    fp_only_scores = np.zeros((num_dt, ), dtype=np.float64)
+    for j in range(num_dt):
+        if ignored_dt[j] == -1:
+            continue
+        for i in range(num_gt):
+            if ignored_gt[i] != -1 and overlap[i, j] > min_overlap:
+                matchable[j] = True
+                break
+        if matchable[j] or ignored_dt[j] == 1:
+            continue
+        in_dontcare = False
+        if metric == 0:
+            for k in range(dc_overlap.shape[1]):
+                if dc_overlap[j, k] > min_overlap:
+                    in_dontcare = True
+        if not in_dontcare:
+            fp_only_scores[num_fp_only] = dt_scores[j]
+            num_fp_only += 1
+    fp_only_scores = np.sort(fp_only_scores[:num_fp_only])[::-1]
+
+    # the matchable detections alone, the others are left out of compute_statistics_jit()
+    matched = np.nonzero(matchable)[0]
+    match_overlap = np.zeros((num_gt, matched.shape[0]), dtype=overlap.dtype)
+    for k in range(matched.shape[0]):
+        match_overlap[:, k] = overlap[:, matched[k]]
+    match_dt_data = dt_data[matched]
+    match_ignored_dt = ignored_dt[matched]
+    match_dc_overlap = dc_overlap[matched]
+    match_scores = np.sort(dt_scores[matched])[::-1]
+
+    scores = np.sort(dt_scores[ignored_dt != -1])[::-1]
+    prev = np.zeros((4, ), dtype=np.float64)
+    prev[2] = np.sum(ignored_gt == 0)
+    # the statistics of the matchable detections, the same as prev before any of them
+    match_stats = prev.copy()
+    cur = np.zeros((4, ), dtype=np.float64)
+    fp_only_idx, match_idx = 0, 0
+    num_step = 0
+    for s in range(scores.shape[0]):
+        if s > 0 and scores[s] == scores[s - 1]:
+            continue
+        while fp_only_idx < fp_only_scores.shape[0] and fp_only_scores[fp_only_idx] >= scores[s]:
+            fp_only_idx += 1
+        if match_idx < match_scores.shape[0] and match_scores[match_idx] >= scores[s]:
+            while match_idx < match_scores.shape[0] and match_scores[match_idx] >= scores[s]:
+                match_idx += 1
+            tp, fp, fn, similarity, _ = compute_statistics_jit(
+                match_overlap,
+                gt_data,
+                match_dt_data,
+                ignored_gt,
+                match_ignored_dt,
+                match_dc_overlap,
+                metric,
+                min_overlap=min_overlap,
+                score_thresh=scores[s],
+                compute_fp=True,
+                compute_aos=compute_aos)
+            match_stats[0], match_stats[1], match_stats[2] = tp, fp, fn
+            match_stats[3] = similarity if similarity != -1 else 0.0
+        cur[:] = match_stats
+        cur[1] += fp_only_idx
+        if np.any(cur != prev):
+            step_scores[num_step] = scores[s]
+            step_deltas[num_step] = cur - prev
+            num_step += 1
+            prev[:] = cur
+    return num_step
+
+
+@numba.jit(nopython=True)
+def _compact_rows(rows, offsets, nums):
+    compacted = np.zeros((np.sum(nums), rows.shape[1]), dtype=rows.dtype)
+    row_idx = 0
+    for i in range(nums.shape[0]):
+        compacted[row_idx:row_idx + nums[i]] = rows[offsets[i]:offsets[i] + nums[i]]
+        row_idx += nums[i]
+    return compacted
+
+
+@numba.jit(nopython=True, parallel=True)
+def fused_frame_statistics(overlaps, gt_nums, dt_nums, dc_nums, gt_datas, dt_datas, dc_overlaps, ignored_gts,
+                           ignored_dts, metric, min_overlap, compute_aos=False):
+    """
+    the scores of true positive detections and the step statistics of every sample of a part.
+
+    Args:
+        overlaps: ndarray of float, [num_gt_per_part, num_dt_per_part]
+        gt_nums: ndarray of int, [parted_num]
+        dt_nums: ndarray of int, [parted_num]
+        dc_nums: ndarray of int, [parted_num]
+        gt_datas: ndarray of float, [num_gt_per_part, 5], bboxes, alphas
+        dt_datas: ndarray of float, [num_dt_per_part, 6], bboxes, alphas, scores
+        dc_overlaps: ndarray of float, [num_dc_overlap_per_part], from dontcare_overlaps(), a [dt_num, dc_num]
+            block for each sample
+        ignored_gts: ndarray of int, [num_gt_per_part], 0: not ignored, 1: ignored, -1: unknown
+        ignored_dts: ndarray of int, [num_dt_per_part], 0: not ignored, 1: ignored, -1: unknown
+        metric: int, the evaluation type, 0: bbox, 1: bev, 2: 3d
+        min_overlap: float
+        compute_aos: bool
+
+    Returns:
+        tp_nums: ndarray of int, [parted_num]
+        tp_scores: ndarray of float, [num_tp_per_part], scores of true positive detections in the order of samples
+        step_nums: ndarray of int, [parted_num]
+        step_scores: ndarray of float, [num_step_per_part], see frame_step_statistics()
+        step_deltas: ndarray of float, [num_step_per_part, 4]
+
+    """
+    gt_offsets = _sample_offsets(gt_nums)
+    dt_offsets = _sample_offsets(dt_nums)
+    dc_offsets = _sample_offsets(dt_nums * dc_nums)
+    tp_nums = np.zeros((gt_nums.shape[0], ), dtype=np.int64)
+    tp_scores = np.zeros((gt_offsets[-1], ), dtype=np.float64)
+    step_nums = np.zeros((gt_nums.shape[0], ), dtype=np.int64)
+    step_scores = np.zeros((dt_offsets[-1], ), dtype=np.float64)
+    step_deltas = np.zeros((dt_offsets[-1], 4), dtype=np.float64)
+    for i in numba.prange(gt_nums.shape[0]):
+        gt_start, gt_end = gt_offsets[i], gt_offsets[i + 1]
+        dt_start, dt_end = dt_offsets[i], dt_offsets[i + 1]
+        overlap = overlaps[gt_start:gt_end, dt_start:dt_end]
+        dontcare = _dontcare_block(dc_overlaps, dc_offsets[i], dt_nums[i], dc_nums[i])
+        _, _, _, _, thresholds = compute_statistics_jit(
+            overlap, gt_datas[gt_start:gt_end], dt_datas[dt_start:dt_end], ignored_gts[gt_start:gt_end],
+            ignored_dts[dt_start:dt_end], dontcare, metric, min_overlap=min_overlap, score_thresh=0.0,
+            compute_fp=False)
+        tp_nums[i] = thresholds.shape[0]
+        tp_scores[gt_start:gt_start + tp_nums[i]] = thresholds
+        step_nums[i] = frame_step_statistics(
+            overlap, gt_datas[gt_start:gt_end], dt_datas[dt_start:dt_end], ignored_gts[gt_start:gt_end],
+            ignored_dts[dt_start:dt_end], dontcare, metric, min_overlap, step_scores[dt_start:dt_end],
+            step_deltas[dt_start:dt_end], compute_aos)
+    return (tp_nums, _compact_thresholds(tp_scores, gt_offsets, tp_nums), step_nums,
+            _compact_thresholds(step_scores, dt_offsets, step_nums), _compact_rows(step_deltas, dt_offsets, step_nums))
+
+
+@numba.jit(nopython=True, parallel=True)
+def fused_frame_statistics_sparse(pair_nums, rows, cols, vals, gt_nums, dt_nums, dc_nums, gt_datas, dt_datas,
+                                  dc_overlaps, ignored_gts, ignored_dts, metric, min_overlap, compute_aos=False):
+    """
+    the same as fused_frame_statistics, but the overlaps of the part are in the sparse (COO) format.
+
+    Args:
+        pair_nums: ndarray of int, [parted_num], the number of overlap pairs per sample
+        rows: ndarray of int, [num_pair_per_part], indices of ground truth objects, sorted by rows then cols
+        cols: ndarray of int, [num_pair_per_part], indices of detected objects
+        vals: ndarray of float, [num_pair_per_part], overlaps
+        others: the same as fused_frame_statistics
+
+    Returns:
+        the same as fused_frame_statistics
+
+    """
+    gt_offsets = _sample_offsets(gt_nums)
+    dt_offsets = _sample_offsets(dt_nums)
+    dc_offsets = _sample_offsets(dt_nums * dc_nums)
+    pair_offsets = _sample_offsets(pair_nums)
+    tp_nums = np.zeros((gt_nums.shape[0], ), dtype=np.int64)
+    tp_scores = np.zeros((gt_offsets[-1], ), dtype=np.float64)
+    step_nums = np.zeros((gt_nums.shape[0], ), dtype=np.int64)
+    step_scores = np.zeros((dt_offsets[-1], ), dtype=np.float64)
+    step_deltas = np.zeros((dt_offsets[-1], 4), dtype=np.float64)
+    for i in numba.prange(gt_nums.shape[0]):
+        gt_start, gt_end = gt_offsets[i], gt_offsets[i + 1]
+        dt_start, dt_end = dt_offsets[i], dt_offsets[i + 1]
+        overlap = sparse_frame_overlap(rows, cols, vals, pair_offsets[i], pair_nums[i], gt_start, dt_start,
+                                       gt_nums[i], dt_nums[i])
+        dontcare = _dontcare_block(dc_overlaps, dc_offsets[i], dt_nums[i], dc_nums[i])
+        _, _, _, _, thresholds = compute_statistics_jit(
+            overlap, gt_datas[gt_start:gt_end], dt_datas[dt_start:dt_end], ignored_gts[gt_start:gt_end],
+            ignored_dts[dt_start:dt_end], dontcare, metric, min_overlap=min_overlap, score_thresh=0.0,
+            compute_fp=False)
+        tp_nums[i] = thresholds.shape[0]
+        tp_scores[gt_start:gt_start + tp_nums[i]] = thresholds
+        step_nums[i] = frame_step_statistics(
+            overlap, gt_datas[gt_start:gt_end], dt_datas[dt_start:dt_end], ignored_gts[gt_start:gt_end],
+            ignored_dts[dt_start:dt_end], dontcare, metric, min_overlap, step_scores[dt_start:dt_end],
+            step_deltas[dt_start:dt_end], compute_aos)
+    return (tp_nums, _compact_thresholds(tp_scores, gt_offsets, tp_nums), step_nums,
+            _compact_thresholds(step_scores, dt_offsets, step_nums), _compact_rows(step_deltas, dt_offsets, step_nums))
+
+
+def _job_major_to_frame_major(values, nums):
+    """
+
+    Args:
+        values: ndarray, [num_entry, ...], entries sorted by jobs then frames
+        nums: ndarray of int, [num_job, num_frame], the number of entries of each job and frame
+
+    Returns:
+        values: ndarray, [num_entry, ...], entries sorted by frames then jobs
+
+    """
+    num_job, num_frame = nums.shape
+    frames = np.repeat(np.tile(np.arange(num_frame), num_job), nums.ravel())
+    return values[np.argsort(frames, kind='stable')]
+
+
+def compute_frame_statistics(gt_annos, dt_annos, current_classes, difficultys, min_overlaps, metrics=(0, 1, 2),
+                             num_part=100, sparse_overlap=False, overlap_cache=None, image_ids=None):
+    """
+    match every sample once and keep its statistics apart, so that the statistics of any set of samples can be
+    merged later by reduce_frame_statistics() with the same results as eval_class().
+    a job is one (metric, class, difficulty, min_overlap), job = ((metric_idx * C + m) * B + l) * O + k.
+
+    Args:
+        gt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        dt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        current_classes: list of int, 0: car, 1: pedestrian, 2: cyclist
+        difficultys: list of int, the evaluation difficulty, i.e. the distance bin
+        min_overlaps: ndarray of float, [num_minoverlap, num_metric, num_class]
+        metrics: tuple of int, the evaluation types, 0: bbox, 1: bev, 2: 3d
+        num_part: int, a parameter for fast calculate algorithm
+        sparse_overlap: bool, whether to calculate overlaps only for candidate pairs from a grid index
+        overlap_cache: DiskCache, persistent overlaps of each sample, None: no cache, unused with sparse_overlap
+        image_ids: list of int, the image index of each sample, None: the positions
+
+    Returns:
+        stats: dict, frames are F, jobs are J
+            'current_classes', 'difficultys', 'min_overlaps', 'metrics': the configuration
+            'num_valid_gts': ndarray of int, [F, num_class, num_difficulty]
+            'tp_nums': ndarray of int, [F, J]
+            'tp_scores': ndarray of float, [num_tp], scores of true positive detections, sorted by frames then jobs
+            'step_nums': ndarray of int, [F, J]
+            'step_scores': ndarray of float, [num_step], see frame_step_statistics(), sorted by frames then jobs
+            'step_deltas': ndarray of float, [num_step, 4], tp, fp, fn, similarity
+            'alpha_flags': ndarray of int, [F], -1: no detections, 0: no alphas, 1: alphas given
+            'image_ids': ndarray of int, [F]
+
+    """
+    assert len(gt_annos) == len(dt_annos)
+    num_example = len(gt_annos)
+    split_parts = get_split_parts(num_example, num_part)
+    prepared = prepare_data(gt_annos, dt_annos, current_classes, difficultys)
+    gt_datas = prepared["gt_datas"]
+    dt_datas = prepared["dt_datas"]
+    dc_overlaps = prepared["dc_overlaps"]
+    gt_offsets = prepared["gt_offsets"]
+    dt_offsets = prepared["dt_offsets"]
+    dc_offsets = prepared["dc_offsets"]
+    dc_overlap_offsets = prepared["dc_overlap_offsets"]
+    total_gt_num = np.diff(gt_offsets)  # [num_example]
+    total_dt_num = np.diff(dt_offsets)  # [num_example]
+    total_dc_num = np.diff(dc_offsets)  # [num_example]
+
+    tp_nums, tp_scores, step_nums, step_scores, step_deltas = [], [], [], [], []
+    for metric in metrics:
+        if sparse_overlap:
+            parted_pairs, _, _ = calculate_iou_sparse(gt_annos, dt_annos, metric, num_part)
+        else:
+            _, parted_overlaps, _, _ = calculate_iou_partly(gt_annos, dt_annos, metric, num_part, overlap_cache)
+        for m, current_class in enumerate(current_classes):
+            ignored_dts = prepared["ignored_dts"][current_class]
+            for difficulty in difficultys:
+                ignored_gts = prepared["ignored_gts"][(current_class, difficulty)]
+                for min_overlap in min_overlaps[:, metric, m]:
+                    job_stats = []
+                    idx = 0
+                    for j, parted_num in enumerate(split_parts):
+                        gt_slice = slice(gt_offsets[idx], gt_offsets[idx + parted_num])
+                        dt_slice = slice(dt_offsets[idx], dt_offsets[idx + parted_num])
+                        dc_slice = slice(dc_overlap_offsets[idx], dc_overlap_offsets[idx + parted_num])
+                        if sparse_overlap:
+                            frame_statistics, overlap_part = fused_frame_statistics_sparse, parted_pairs[j]
+                        else:
+                            frame_statistics, overlap_part = fused_frame_statistics, (parted_overlaps[j], )
+                        job_stats.append(frame_statistics(
+                            *overlap_part,
+                            total_gt_num[idx:idx + parted_num],  # [parted_num]
+                            total_dt_num[idx:idx + parted_num],  # [parted_num]
+                            total_dc_num[idx:idx + parted_num],  # [parted_num]
+                            gt_datas[gt_slice],  # [num_gt_per_part, 5]
+                            dt_datas[dt_slice],  # [num_dt_per_part, 6]
+                            dc_overlaps[dc_slice],  # [num_dc_overlap_per_part]
+                            ignored_gts[gt_slice],  # [num_gt_per_part]
+                            ignored_dts[dt_slice],  # [num_dt_per_part]
+                            metric,  # int
+                            min_overlap,  # float
+                            metric == 0,  # the similarity is only used by bbox
+                        ))
+                        idx += parted_num
+                    for values, part_values in zip([tp_nums, tp_scores, step_nums, step_scores, step_deltas],
+                                                   zip(*job_stats)):
+                        values.append(np.concatenate(part_values, 0))
+
+    tp_nums = np.stack(tp_nums, 0)  # [J, F]
+    step_nums = np.stack(step_nums, 0)  # [J, F]
+
+    # valid ground truth objects per sample, class and difficulty
+    gt_frames = np.repeat(np.arange(num_example), total_gt_num)
+    num_valid_gts = np.zeros((num_example, len(current_classes), len(difficultys)), dtype=np.int64)
+    for m, current_class in enumerate(current_classes):
+        for l, difficulty in enumerate(difficultys):
+            valid = prepared["ignored_gts"][(current_class, difficulty)] == 0
+            num_valid_gts[:, m, l] = np.bincount(gt_frames[valid], minlength=num_example)
+
+    # the same check of alphas as get_official_eval_result(), applied to the first sample with detections later
+    alpha_flags = np.array([-1 if len(a["alpha"]) == 0 else int(a["alpha"][0] != -10) for a in dt_annos],
+                           dtype=np.int64)
+
+    stats = {
+        "current_classes": np.array(current_classes, dtype=np.int64),
+        "difficultys": np.array(difficultys, dtype=np.int64),
+        "min_overlaps": np.asarray(min_overlaps, dtype=np.float64),
+        "metrics": np.array(metrics, dtype=np.int64),
+        "num_valid_gts": num_valid_gts,
+        "tp_nums": tp_nums.T.copy(),
+        "tp_scores": _job_major_to_frame_major(np.concatenate(tp_scores, 0), tp_nums),
+        "step_nums": step_nums.T.copy(),
+        "step_scores": _job_major_to_frame_major(np.concatenate(step_scores, 0), step_nums),
+        "step_deltas": _job_major_to_frame_major(np.concatenate(step_deltas, 0), step_nums),
+        "alpha_flags": alpha_flags,
+        "image_ids": np.arange(num_example) if image_ids is None else np.asarray(image_ids),
+    }
+    return stats
+
+
+def _entry_frames(nums):
+    return np.repeat(np.arange(nums.shape[0]), nums.sum(axis=1))
+
+
+def select_frame_statistics(stats, indices):
+    """
+
+    Args:
+        stats: dict, from compute_frame_statistics()
+        indices: ndarray of int, [num_selected], the frames to keep in order, repeats are allowed
+
+    Returns:
+        stats: dict, the statistics of the selected frames
+
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    selected = {key: stats[key] for key in CONFIG_KEYS}
+    for key in FRAME_KEYS:
+        if key in stats:
+            selected[key] = stats[key][indices]
+    for nums_key, keys in [("tp_nums", ["tp_scores"]), ("step_nums", ["step_scores", "step_deltas"])]:
+        frame_nums = stats[nums_key].sum(axis=1)
+        offsets = np.concatenate([[0], np.cumsum(frame_nums)]).astype(np.int64)
+        entries = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in indices] + [np.zeros(0, np.int64)])
+        for key in keys:
+            selected[key] = stats[key][entries]
+    return selected
+
+
+def concat_frame_statistics(stats_list):
+    """
+
+    Args:
+        stats_list: list of dict, from compute_frame_statistics() with the same configuration
+
+    Returns:
+        stats: dict, the statistics of all frames in order
+
+    """
+    for stats in stats_list[1:]:
+        for key in CONFIG_KEYS:
+            assert np.array_equal(stats[key], stats_list[0][key]), "different configuration: {}".format(key)
+    concatenated = {key: stats_list[0][key] for key in CONFIG_KEYS}
+    for key in FRAME_KEYS + ["tp_scores", "step_scores", "step_deltas"]:
+        if all(key in stats for stats in stats_list):
+            concatenated[key] = np.concatenate([stats[key] for stats in stats_list], 0)
+    return concatenated
+
+
+def merge_frame_statistics(stats_list):
+    """
+    merge the statistics of disjoint shards of a split, e.g. from several nodes, in the order of the split.
+
+    Args:
+        stats_list: list of dict, from compute_frame_statistics() with the same configuration and 'frame_indices',
+            the position of each frame in the split
+
+    Returns:
+        stats: dict, the statistics of all frames sorted by 'frame_indices'
+
+    """
+    stats = concat_frame_statistics(stats_list)
+    frame_indices = stats["frame_indices"]
+    if len(np.unique(frame_indices)) != len(frame_indices):
+        raise ValueError("the shards overlap")
+    return select_frame_statistics(stats, np.argsort(frame_indices, kind='stable'))
+
+
+def reduce_frame_statistics(stats, frame_weights=None):
+    """
+    rebuild the precision recall curves of eval_class() from the statistics of frames.
+
+    Args:
+        stats: dict, from compute_frame_statistics()
+        frame_weights: ndarray of int, [F], how many times each frame is counted, e.g. for bootstrap, None: once
+
+    Returns:
+        rets: dict, metric -> dict with 'recall', 'precision', 'orientation', the same as eval_class()
+        compute_aos: bool, whether the alphas are valid, the same check as get_official_eval_result()
+
+    """
+    N_SAMPLE_PTS = 41
+    current_classes, difficultys = stats["current_classes"], stats["difficultys"]
+    min_overlaps, metrics = stats["min_overlaps"], stats["metrics"]
+    num_class, num_difficulty, num_minoverlap = len(current_classes), len(difficultys), len(min_overlaps)
+    num_frame, num_job = stats["tp_nums"].shape
+    if frame_weights is None:
+        frame_weights = np.ones((num_frame, ), dtype=np.int64)
+    frame_weights = np.asarray(frame_weights, dtype=np.int64)
+
+    flags = stats["alpha_flags"][(stats["alpha_flags"] != -1) & (frame_weights > 0)]
+    compute_aos = len(flags) > 0 and flags[0] == 1
+
+    # [num_class, num_difficulty]
+    num_valid_gts = np.tensordot(frame_weights, stats["num_valid_gts"], axes=1)
+
+    # entries of each job, sorted by jobs then frames
+    job_entries = []
+    for nums_key, keys in [("tp_nums", ["tp_scores"]), ("step_nums", ["step_scores", "step_deltas"])]:
+        nums = stats[nums_key]  # [F, J]
+        jobs = np.repeat(np.tile(np.arange(num_job), num_frame), nums.ravel())
+        weights = np.repeat(np.repeat(frame_weights, num_job), nums.ravel())
+        order = np.argsort(jobs, kind='stable')
+        job_offsets = np.concatenate([[0], np.cumsum(nums.sum(axis=0))])
+        job_entries.append((job_offsets, weights[order], [stats[key][order] for key in keys]))
+    (tp_offsets, tp_weights, (tp_scores, )), (step_offsets, step_weights, (step_scores, step_deltas)) = job_entries
+
+    rets = {}
+    job = 0
+    for metric in metrics:
+        pr = np.zeros([num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS, 4])
+        num_thresholds = np.zeros([num_class, num_difficulty, num_minoverlap], dtype=np.int64)
+        for m in range(num_class):
+            for l in range(num_difficulty):
+                for k in range(num_minoverlap):
+                    tp_slice = slice(tp_offsets[job], tp_offsets[job + 1])
+                    step_slice = slice(step_offsets[job], step_offsets[job + 1])
+                    job += 1
+                    thresholds = get_thresholds(np.repeat(tp_scores[tp_slice], tp_weights[tp_slice]),
+                                                num_valid_gts[m, l])
+                    num_thresholds[m, l, k] = len(thresholds)
+
+                    # statistics at a threshold are the base plus the changes at scores not below it
+                    order = np.argsort(-step_scores[step_slice], kind='stable')
+                    scores = step_scores[step_slice][order]
+                    deltas = np.cumsum(step_deltas[step_slice][order] * step_weights[step_slice][order, np.newaxis],
+                                       axis=0)
+                    num_steps = np.searchsorted(-scores, -thresholds, side='right')
+                    pr[m, l, k, :len(thresholds), 2] = num_valid_gts[m, l]
+                    has_steps = num_steps > 0
+                    pr[m, l, k, :len(thresholds)][has_steps] += deltas[num_steps[has_steps] - 1]
+
+        recall, precision, aos = compute_pr_curves(pr, num_thresholds, compute_aos and metric == 0)
+        rets[int(metric)] = {
+            "recall": recall,
+            "precision": precision,
+            "orientation": aos,
+        }
+    return rets, compute_aos
+
+
+def get_frame_statistics_mAP(stats, frame_weights=None):
+    """
+
+    Args:
+        stats: dict, from compute_frame_statistics() with metrics (0, 1, 2)
+        frame_weights: ndarray of int, [F], how many times each frame is counted, None: once
+
+    Returns:
+        mAPs: tuple, the same as do_eval()
+        compute_aos: bool
+
+    """
+    rets, compute_aos = reduce_frame_statistics(stats, frame_weights)
+    mAP_aos, mAP_aos_R40 = None, None
+    if compute_aos:
+        mAP_aos = get_mAP(rets[0]["orientation"])
+        mAP_aos_R40 = get_mAP_R40(rets[0]["orientation"])
+    mAPs = (get_mAP(rets[0]["precision"]), get_mAP(rets[1]["precision"]), get_mAP(rets[2]["precision"]), mAP_aos,
+            get_mAP_R40(rets[0]["precision"]), get_mAP_R40(rets[1]["precision"]), get_mAP_R40(rets[2]["precision"]),
+            mAP_aos_R40)
+    return mAPs, compute_aos
+
+
+def get_frame_strata(gt_annos, current_classes):
+    """
+
+    Args:
+        gt_annos: list of dict, must from get_label_annos() in kitti_common.py
+        current_classes: list of int, 0: car, 1: pedestrian, 2: cyclist
+
+    Returns:
+        strata: ndarray of int, [num_sample], the farthest distance bin with an object of the classes, -1: none
+
+    """
+    gt_bins = _get_distance_bins(gt_annos)
+    gt_names = np.char.lower(np.concatenate([np.asarray(a["name"], dtype=str) for a in gt_annos], 0))
+    gt_frames = np.repeat(np.arange(len(gt_annos)), [len(a["name"]) for a in gt_annos])
+    valid = np.isin(gt_names, [CLASS_NAMES[c] for c in current_classes])
+    strata = np.full((len(gt_annos), ), -1, dtype=np.int64)
+    np.maximum.at(strata, gt_frames[valid], gt_bins[valid])
+    return strata
+
+
+def stratified_frame_order(strata, seed=0):
+    """
+    a deterministic order of frames in which every prefix takes about the same share of each stratum.
+
+    Args:
+        strata: ndarray of int, [num_sample]
+        seed: int
+
+    Returns:
+        order: ndarray of int, [num_sample]
+
+    """
+    rng = np.random.RandomState(seed)
+    keys = np.zeros((len(strata), ), dtype=np.float64)
+    for stratum in np.unique(strata):
+        frames = rng.permutation(np.nonzero(strata == stratum)[0])
+        # systematic allocation, the i-th frame of a stratum of size n comes at (i + 0.5) / n
+        keys[frames] = (np.arange(len(frames)) + 0.5) / len(frames)
+    return np.lexsort((strata, keys))
+
+
+def bootstrap_mAP_errors(stats, strata, num_population, num_bootstrap=20, seed=0):
+    """
+    the standard errors of the APs from a stratified subset, by resampling the frames within each stratum.
+
+    Args:
+        stats: dict, from compute_frame_statistics() of the subset
+        strata: ndarray of int, [F], the stratum of each frame of the subset
+        num_population: int, the number of frames of the whole split, for the finite population correction
+        num_bootstrap: int
+        seed: int
+
+    Returns:
+        errors: tuple, the same structure as the mAPs of get_frame_statistics_mAP(), standard errors
+
+    """
+    rng = np.random.RandomState(seed)
+    samples = []
+    for _ in range(num_bootstrap):
+        frame_weights = np.zeros((len(strata), ), dtype=np.int64)
+        for stratum in np.unique(strata):
+            frames = np.nonzero(strata == stratum)[0]
+            np.add.at(frame_weights, rng.choice(frames, len(frames)), 1)
+        samples.append(get_frame_statistics_mAP(stats, frame_weights)[0])
+    correction = np.sqrt(max(0.0, 1.0 - len(strata) / num_population))
+    errors = []
+    for values in zip(*samples):
+        errors.append(None if any(value is None for value in values) else np.std(np.stack(values, 0), axis=0) * correction)
+    return tuple(errors)
+
+
+def save_frame_statistics(path, stats):
+    """save the statistics to an npz file, written to a temporary file first so that a crash keeps the old one"""
+    tmp_path = str(path) + '.tmp.npz'
+    np.savez(tmp_path, **stats)
+    os.replace(tmp_path, path)
+
+
+def load_frame_statistics(path):
+    """
+
+    Args:
+        path: str, an npz file from save_frame_statistics()
+
+    Returns:
+        stats: dict
+
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
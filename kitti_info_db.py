@@ -0,0 +1,283 @@
+import fire
+import json
+import os
+import pathlib
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from skimage import io
+
+import kitti_common as kitti
+
+# the fields of a calib file in order, with the number of values of each
+CALIB_FIELDS = [('P0', 12), ('P1', 12), ('P2', 12), ('P3', 12), ('R0_rect', 9), ('Tr_velo_to_cam', 12),
+                ('Tr_imu_to_velo', 12)]
+# the fields of annotations with their dtypes, an empty label file gives float arrays otherwise
+ANNO_DTYPES = {
+    'name': str,
+    'truncated': np.float64,
+    'occluded': np.int64,
+    'alpha': np.float64,
+    'bbox': np.float64,
+    'dimensions': np.float64,
+    'location': np.float64,
+    'rotation_y': np.float64,
+    'score': np.float64,
+    'difficulty': np.int32,
+}
+
+
+def _list_ids(folder, file_tail):
+    """
+
+    Args:
+        folder: str, listed once instead of checking the existence of every file
+        file_tail: str, e.g. '.png'
+
+    Returns:
+        image_ids: set of int, the samples which have a file in folder, empty when folder does not exist
+
+    """
+    if not os.path.isdir(folder):
+        return set()
+    image_ids = set()
+    for entry in os.scandir(folder):
+        stem = entry.name[:-len(file_tail)]
+        if entry.name.endswith(file_tail) and len(stem) == 6 and stem.isdigit():
+            image_ids.add(int(stem))
+    return image_ids
+
+
+def _png_shape(path):
+    """the [height, width] of a png image from its header, without decoding it"""
+    with open(path, 'rb') as f:
+        header = f.read(24)
+    if header[:8] != b'\x89PNG\r\n\x1a\n':
+        return np.array(io.imread(path).shape[:2], dtype=np.int32)
+    width, height = struct.unpack('>II', header[16:24])
+    return np.array([height, width], dtype=np.int32)
+
+
+def parse_calib_files(calib_paths, extend_matrix=True):
+    """
+    parse the numbers of all calib files with one conversion instead of one float() per number.
+
+    Args:
+        calib_paths: list of str
+        extend_matrix: bool, whether to extend the matrices to 4x4 homogeneous ones
+
+    Returns:
+        calibs: dict, 'calib/<field>' -> ndarray of float, [num_sample, 4, 4], or [num_sample, 3, 4] and
+            [num_sample, 3, 3] for R0_rect without extend_matrix
+
+    """
+    num_value = sum(num for _, num in CALIB_FIELDS)
+    tokens = []
+    for calib_path in calib_paths:
+        with open(calib_path, 'r') as f:
+            lines = f.read().split('\n')
+        values = [value for line in lines[:len(CALIB_FIELDS)] for value in line.split()[1:]]
+        if len(values) != num_value:
+            raise ValueError('invalid calib file: {}'.format(calib_path))
+        tokens += values
+    values = np.array(tokens, dtype=np.float64).reshape(len(calib_paths), num_value)
+
+    calibs = {}
+    start = 0
+    for name, num in CALIB_FIELDS:
+        mat = values[:, start:start + num].reshape(len(calib_paths), -1 if num == 9 else 3, 3 if num == 9 else 4)
+        start += num
+        if extend_matrix:
+            extended = np.zeros((len(calib_paths), 4, 4), dtype=np.float64)
+            extended[:, :mat.shape[1], :mat.shape[2]] = mat
+            extended[:, 3, 3] = 1.
+            mat = extended
+        calibs['calib/' + name] = mat
+    return calibs
+
+
+def get_difficulty(annos):
+    """
+    the same as add_difficulty_to_annos() in kitti_common.py, vectorized.
+
+    Args:
+        annos: dict, from get_label_anno() in kitti_common.py
+
+    Returns:
+        difficulty: ndarray of int32, [num_obj], 0: easy, 1: moderate, 2: hard, -1: none
+
+    """
+    min_height = np.array([40, 25, 25])
+    max_occlusion = np.array([0, 1, 2])
+    max_trunc = np.array([0.15, 0.3, 0.5])
+    height = annos['bbox'][:, 3] - annos['bbox'][:, 1]
+    # masks: ndarray of bool, [3, num_obj], easy, moderate, hard
+    masks = ~((annos['occluded'][np.newaxis] > max_occlusion[:, np.newaxis]) |
+              (height[np.newaxis] <= min_height[:, np.newaxis]) |
+              (annos['truncated'][np.newaxis] > max_trunc[:, np.newaxis]))
+    is_moderate = np.logical_xor(masks[0], masks[1])
+    is_hard = np.logical_xor(masks[2], masks[1])
+    return np.where(masks[0], 0, np.where(is_moderate, 1, np.where(is_hard, 2, -1))).astype(np.int32)
+
+
+def _build_chunk(root_path, split, image_ids, label_info, calib, extend_matrix, with_imageshape):
+    """
+
+    Returns:
+        chunk: dict, name -> ndarray, the fields of the samples in image_ids, stacked or concatenated
+
+    """
+    chunk = {}
+    if with_imageshape:
+        chunk['img_shape'] = np.stack([
+            _png_shape(os.path.join(root_path, split, 'image_2', kitti.get_image_index_str(idx) + '.png'))
+            for idx in image_ids]).reshape(-1, 2)
+    if label_info:
+        annos_list = []
+        for idx in image_ids:
+            annos = kitti.get_label_anno(
+                os.path.join(root_path, split, 'label_2', kitti.get_image_index_str(idx) + '.txt'))
+            annos['difficulty'] = get_difficulty(annos)
+            annos_list.append(annos)
+        chunk['annos/num'] = np.array([annos['name'].shape[0] for annos in annos_list], dtype=np.int64)
+        for key, dtype in ANNO_DTYPES.items():
+            chunk['annos/' + key] = np.concatenate([annos[key].astype(dtype) for annos in annos_list])
+    if calib:
+        chunk.update(parse_calib_files(
+            [os.path.join(root_path, split, 'calib', kitti.get_image_index_str(idx) + '.txt') for idx in image_ids],
+            extend_matrix))
+    return chunk
+
+
+def build_kitti_info_db(path,
+                        db_dir,
+                        training=True,
+                        label_info=True,
+                        velodyne=False,
+                        calib=False,
+                        image_ids=7481,
+                        extend_matrix=True,
+                        num_worker=8,
+                        relative_path=True,
+                        with_imageshape=True,
+                        chunk_size=256):
+    """
+    the same infos as get_kitti_image_info() in kitti_common.py, saved as one .npy file per field which
+    load_kitti_info_db() maps into memory. each folder is listed once to check the files of all samples, the image
+    shapes are read from the png headers, and the samples are parsed in chunks by a pool of processes.
+
+    Args:
+        path: str, the root of the KITTI dataset
+        db_dir: str, the folder to save the database
+        training, label_info, velodyne, calib, image_ids, extend_matrix, relative_path, with_imageshape:
+            the same as get_kitti_image_info()
+        num_worker: int, the number of processes
+        chunk_size: int, the number of samples parsed by a process at a time
+
+    Returns:
+        num_sample: int
+
+    """
+    split = 'training' if training else 'testing'
+    if not isinstance(image_ids, list):
+        image_ids = list(range(image_ids))
+    folders = [('image_2', '.png')]
+    if label_info:
+        folders.append(('label_2', '.txt'))
+    if velodyne:
+        folders.append(('velodyne', '.bin'))
+    if calib:
+        folders.append(('calib', '.txt'))
+    for info_type, file_tail in folders:
+        missing = set(image_ids) - _list_ids(os.path.join(path, split, info_type), file_tail)
+        if len(missing) > 0:
+            raise ValueError('file not exist: {}'.format(
+                pathlib.Path(split) / info_type / (kitti.get_image_index_str(min(missing)) + file_tail)))
+
+    chunks = []
+    with ProcessPoolExecutor(num_worker) as executor:
+        futures = [executor.submit(_build_chunk, path, split, image_ids[i:i + chunk_size], label_info, calib,
+                                   extend_matrix, with_imageshape)
+                   for i in range(0, len(image_ids), chunk_size)]
+        for future in futures:
+            chunks.append(future.result())
+
+    db_dir = pathlib.Path(db_dir)
+    db_dir.mkdir(parents=True, exist_ok=True)
+    fields = {'image_idx': np.array(image_ids, dtype=np.int64)}
+    for key in (chunks[0] if len(chunks) > 0 else {}):
+        fields[key] = np.concatenate([chunk[key] for chunk in chunks])
+    if label_info:
+        num_obj = fields.pop('annos/num')
+        fields['annos/offsets'] = np.concatenate([[0], np.cumsum(num_obj)]).astype(np.int64)
+    for key, value in fields.items():
+        np.save(db_dir / (key.replace('/', '.') + '.npy'), value)
+    meta = {
+        'root_path': os.path.abspath(path),
+        'training': training,
+        'velodyne': velodyne,
+        'relative_path': relative_path,
+        'fields': sorted(fields),
+    }
+    with open(db_dir / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+    return len(image_ids)
+
+
+class KittiInfoDB(object):
+    """
+    the infos saved by build_kitti_info_db(), mapped into memory, the info of a sample is the same dict as from
+    get_kitti_image_info() and is only assembled when indexed.
+    """
+
+    def __init__(self, db_dir):
+        db_dir = pathlib.Path(db_dir)
+        with open(db_dir / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        self.fields = {key: np.load(db_dir / (key.replace('/', '.') + '.npy'), mmap_mode='r')
+                       for key in self.meta['fields']}
+        self.split = 'training' if self.meta['training'] else 'testing'
+
+    def __len__(self):
+        return self.fields['image_idx'].shape[0]
+
+    def _path(self, idx, info_type, file_tail):
+        file_path = pathlib.Path(self.split) / info_type / (kitti.get_image_index_str(idx) + file_tail)
+        if self.meta['relative_path']:
+            return str(file_path)
+        return str(pathlib.Path(self.meta['root_path']) / file_path)
+
+    def __getitem__(self, i):
+        idx = int(self.fields['image_idx'][i])
+        image_info = {'image_idx': idx}
+        if self.meta['velodyne']:
+            image_info['velodyne_path'] = self._path(idx, 'velodyne', '.bin')
+        image_info['img_path'] = self._path(idx, 'image_2', '.png')
+        for key, value in self.fields.items():
+            if key == 'img_shape' or key.startswith('calib/'):
+                image_info[key] = np.array(value[i])
+        if 'annos/offsets' in self.fields:
+            start, end = self.fields['annos/offsets'][i:i + 2]
+            image_info['annos'] = {key: np.array(self.fields['annos/' + key][start:end]) for key in ANNO_DTYPES}
+        return image_info
+
+    def image_infos(self):
+        return [self[i] for i in range(len(self))]
+
+
+def load_kitti_info_db(db_dir):
+    """
+
+    Args:
+        db_dir: str, from build_kitti_info_db()
+
+    Returns:
+        db: KittiInfoDB, db[i] is the same as get_kitti_image_info()[i]
+
+    """
+    return KittiInfoDB(db_dir)
+
+
+if __name__ == '__main__':
+    fire.Fire()
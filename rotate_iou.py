@@ -328,3 +328,203 @@ def rotate_iou_gpu_eval(boxes, query_boxes, criterion=-1, device_id=0):
             N, K, boxes_dev, query_boxes_dev, iou_dev, criterion)
         iou_dev.copy_to_host(iou.reshape([-1]), stream=stream)
     return iou.astype(boxes.dtype)
+
+
+@numba.jit(nopython=True)
+def trangle_area_cpu(a0, a1, b0, b1, c0, c1):
+    return ((a0 - c0) * (b1 - c1) - (a1 - c1) * (b0 - c0)) / 2.0
+
+
+@numba.jit(nopython=True)
+def area_cpu(int_pts, num_of_inter):
+    area_val = 0.0
+    for i in range(num_of_inter - 2):
+        area_val += abs(
+            trangle_area_cpu(int_pts[0], int_pts[1],
+                             int_pts[2 * i + 2], int_pts[2 * i + 3],
+                             int_pts[2 * i + 4], int_pts[2 * i + 5]))
+    return area_val
+
+
+@numba.jit(nopython=True)
+def sort_vertex_in_convex_polygon_cpu(int_pts, num_of_inter):
+    if num_of_inter > 0:
+        center_x = 0.0
+        center_y = 0.0
+        for i in range(num_of_inter):
+            center_x += int_pts[2 * i]
+            center_y += int_pts[2 * i + 1]
+        center_x /= num_of_inter
+        center_y /= num_of_inter
+        vs = np.zeros((num_of_inter, ), dtype=np.float64)
+        for i in range(num_of_inter):
+            v0 = int_pts[2 * i] - center_x
+            v1 = int_pts[2 * i + 1] - center_y
+            d = math.sqrt(v0 * v0 + v1 * v1)
+            if d > 0:
+                v0 = v0 / d
+                v1 = v1 / d
+            if v1 < 0:
+                v0 = -2 - v0
+            vs[i] = v0
+        for i in range(1, num_of_inter):
+            if vs[i - 1] > vs[i]:
+                temp = vs[i]
+                tx = int_pts[2 * i]
+                ty = int_pts[2 * i + 1]
+                j = i
+                while j > 0 and vs[j - 1] > temp:
+                    vs[j] = vs[j - 1]
+                    int_pts[j * 2] = int_pts[j * 2 - 2]
+                    int_pts[j * 2 + 1] = int_pts[j * 2 - 1]
+                    j -= 1
+                vs[j] = temp
+                int_pts[j * 2] = tx
+                int_pts[j * 2 + 1] = ty
+
+
+@numba.jit(nopython=True)
+def line_segment_intersection_cpu(pts1, pts2, i, j, temp_pts):
+    A0 = pts1[2 * i]
+    A1 = pts1[2 * i + 1]
+    B0 = pts1[2 * ((i + 1) % 4)]
+    B1 = pts1[2 * ((i + 1) % 4) + 1]
+    C0 = pts2[2 * j]
+    C1 = pts2[2 * j + 1]
+    D0 = pts2[2 * ((j + 1) % 4)]
+    D1 = pts2[2 * ((j + 1) % 4) + 1]
+    BA0 = B0 - A0
+    BA1 = B1 - A1
+    DA0 = D0 - A0
+    CA0 = C0 - A0
+    DA1 = D1 - A1
+    CA1 = C1 - A1
+    acd = DA1 * CA0 > CA1 * DA0
+    bcd = (D1 - B1) * (C0 - B0) > (C1 - B1) * (D0 - B0)
+    if acd != bcd:
+        abc = CA1 * BA0 > BA1 * CA0
+        abd = DA1 * BA0 > BA1 * DA0
+        if abc != abd:
+            DC0 = D0 - C0
+            DC1 = D1 - C1
+            ABBA = A0 * B1 - B0 * A1
+            CDDC = C0 * D1 - D0 * C1
+            DH = BA1 * DC0 - BA0 * DC1
+            if DH == 0:
+                return False
+            Dx = ABBA * DC0 - BA0 * CDDC
+            Dy = ABBA * DC1 - BA1 * CDDC
+            temp_pts[0] = Dx / DH
+            temp_pts[1] = Dy / DH
+            return True
+    return False
+
+
+@numba.jit(nopython=True)
+def point_in_quadrilateral_cpu(pt_x, pt_y, corners):
+    ab0 = corners[2] - corners[0]
+    ab1 = corners[3] - corners[1]
+
+    ad0 = corners[6] - corners[0]
+    ad1 = corners[7] - corners[1]
+
+    ap0 = pt_x - corners[0]
+    ap1 = pt_y - corners[1]
+
+    abab = ab0 * ab0 + ab1 * ab1
+    abap = ab0 * ap0 + ab1 * ap1
+    adad = ad0 * ad0 + ad1 * ad1
+    adap = ad0 * ap0 + ad1 * ap1
+
+    return abab >= abap and abap >= 0 and adad >= adap and adap >= 0
+
+
+@numba.jit(nopython=True)
+def quadrilateral_intersection_cpu(pts1, pts2, int_pts):
+    num_of_inter = 0
+    for i in range(4):
+        if point_in_quadrilateral_cpu(pts1[2 * i], pts1[2 * i + 1], pts2):
+            int_pts[num_of_inter * 2] = pts1[2 * i]
+            int_pts[num_of_inter * 2 + 1] = pts1[2 * i + 1]
+            num_of_inter += 1
+        if point_in_quadrilateral_cpu(pts2[2 * i], pts2[2 * i + 1], pts1):
+            int_pts[num_of_inter * 2] = pts2[2 * i]
+            int_pts[num_of_inter * 2 + 1] = pts2[2 * i + 1]
+            num_of_inter += 1
+    temp_pts = np.zeros((2, ), dtype=np.float64)
+    for i in range(4):
+        for j in range(4):
+            has_pts = line_segment_intersection_cpu(pts1, pts2, i, j, temp_pts)
+            if has_pts:
+                int_pts[num_of_inter * 2] = temp_pts[0]
+                int_pts[num_of_inter * 2 + 1] = temp_pts[1]
+                num_of_inter += 1
+
+    return num_of_inter
+
+
+@numba.jit(nopython=True)
+def rbbox_to_corners_cpu(corners, rbbox):
+    # generate clockwise corners and rotate it clockwise, same as rbbox_to_corners
+    angle = rbbox[4]
+    a_cos = math.cos(angle)
+    a_sin = math.sin(angle)
+    center_x = rbbox[0]
+    center_y = rbbox[1]
+    x_d = rbbox[2]
+    y_d = rbbox[3]
+    corners_x = (-x_d / 2, -x_d / 2, x_d / 2, x_d / 2)
+    corners_y = (-y_d / 2, y_d / 2, y_d / 2, -y_d / 2)
+    for i in range(4):
+        corners[2 * i] = a_cos * corners_x[i] + a_sin * corners_y[i] + center_x
+        corners[2 * i + 1] = -a_sin * corners_x[i] + a_cos * corners_y[i] + center_y
+
+
+@numba.jit(nopython=True)
+def inter_cpu(corners1, corners2):
+    # 4 + 4 inner corners and 16 edge crossings at most
+    intersection_corners = np.zeros((48, ), dtype=np.float64)
+    num_intersection = quadrilateral_intersection_cpu(corners1, corners2,
+                                                      intersection_corners)
+    sort_vertex_in_convex_polygon_cpu(intersection_corners, num_intersection)
+    return area_cpu(intersection_corners, num_intersection)
+
+
+@numba.jit(nopython=True)
+def rotate_iou_cpu_eval_pairs(boxes, query_boxes, rows, cols, criterion=-1):
+    """rotated box iou of the given (box, query box) pairs only, running in cpu.
+    the result of pair p is the same as rotate_iou_gpu_eval(boxes, query_boxes)[rows[p], cols[p]].
+
+    Args:
+        boxes: ndarray of float, [N, 5], centers, dims, angles (clockwise when positive)
+        query_boxes: ndarray of float, [K, 5], centers, dims, angles (clockwise when positive)
+        rows: ndarray of int, [num_pair], indices of boxes
+        cols: ndarray of int, [num_pair], indices of query_boxes
+        criterion: int, -1: iou, 0: divided by the area of query box, 1: divided by the area of box,
+            others: intersection area
+
+    Returns:
+        iou: ndarray of float, [num_pair]
+    """
+    num_pair = rows.shape[0]
+    iou = np.zeros((num_pair, ), dtype=np.float64)
+    corners1 = np.zeros((8, ), dtype=np.float64)
+    corners2 = np.zeros((8, ), dtype=np.float64)
+    for p in range(num_pair):
+        # keep the argument order of rotate_iou_kernel_eval: query box first
+        rbox1 = query_boxes[cols[p]]
+        rbox2 = boxes[rows[p]]
+        rbbox_to_corners_cpu(corners1, rbox1)
+        rbbox_to_corners_cpu(corners2, rbox2)
+        area1 = rbox1[2] * rbox1[3]
+        area2 = rbox2[2] * rbox2[3]
+        area_inter = inter_cpu(corners1, corners2)
+        if criterion == -1:
+            iou[p] = area_inter / (area1 + area2 - area_inter)
+        elif criterion == 0:
+            iou[p] = area_inter / area1
+        elif criterion == 1:
+            iou[p] = area_inter / area2
+        else:
+            iou[p] = area_inter
+    return iou
@@ -0,0 +1,163 @@
+import numba
+import numpy as np
+
+# the maximum number of grid cells along each axis of a frame
+MAX_GRID_CELLS = 64
+
+
+def bev_box_aabbs(boxes):
+    """
+
+    Args:
+        boxes: ndarray of float, [N, 5], centers, dims, angles (clockwise when positive)
+
+    Returns:
+        aabbs: ndarray of float, [N, 4], xyxy format, axis aligned extents of the rotated footprints
+
+    """
+    a_cos = np.abs(np.cos(boxes[:, 4]))
+    a_sin = np.abs(np.sin(boxes[:, 4]))
+    half_x = (a_cos * boxes[:, 2] + a_sin * boxes[:, 3]) / 2
+    half_y = (a_sin * boxes[:, 2] + a_cos * boxes[:, 3]) / 2
+    aabbs = np.stack([boxes[:, 0] - half_x, boxes[:, 1] - half_y,
+                      boxes[:, 0] + half_x, boxes[:, 1] + half_y], axis=1)
+    return aabbs
+
+
+@numba.jit(nopython=True)
+def _frame_candidate_pairs(gt_aabbs, dt_aabbs, cell_size, rows, cols, fill):
+    """
+    hash the detections of one frame into a uniform grid and query it with every ground truth box.
+
+    Args:
+        gt_aabbs: ndarray of float, [num_gt_per_sample, 4], xyxy format
+        dt_aabbs: ndarray of float, [num_dt_per_sample, 4], xyxy format
+        cell_size: float, the side length of grid cells, <= 0: decided by the mean box size
+        rows: ndarray of int, [num_pair_per_sample], output indices of gt_aabbs, used only when fill
+        cols: ndarray of int, [num_pair_per_sample], output indices of dt_aabbs, used only when fill
+        fill: bool, False: only count the candidate pairs
+
+    Returns:
+        num_pair: int, the number of candidate pairs, sorted by rows then cols
+
+    """
+    gt_size = gt_aabbs.shape[0]
+    dt_size = dt_aabbs.shape[0]
+    if gt_size == 0 or dt_size == 0:
+        return 0
+
+    x_min, y_min = dt_aabbs[0, 0], dt_aabbs[0, 1]
+    x_max, y_max = dt_aabbs[0, 2], dt_aabbs[0, 3]
+    mean_size = 0.0
+    for j in range(dt_size):
+        x_min = min(x_min, dt_aabbs[j, 0])
+        y_min = min(y_min, dt_aabbs[j, 1])
+        x_max = max(x_max, dt_aabbs[j, 2])
+        y_max = max(y_max, dt_aabbs[j, 3])
+        mean_size += max(dt_aabbs[j, 2] - dt_aabbs[j, 0], dt_aabbs[j, 3] - dt_aabbs[j, 1])
+    if cell_size <= 0:
+        cell_size = mean_size / dt_size
+    cell_x = max(cell_size, (x_max - x_min) / MAX_GRID_CELLS, 1e-6)
+    cell_y = max(cell_size, (y_max - y_min) / MAX_GRID_CELLS, 1e-6)
+    nx = min(int((x_max - x_min) / cell_x) + 1, MAX_GRID_CELLS)
+    ny = min(int((y_max - y_min) / cell_y) + 1, MAX_GRID_CELLS)
+
+    # counting sort of the detections into all cells they cover
+    cell_ranges = np.zeros((dt_size, 4), dtype=np.int64)
+    cell_offsets = np.zeros((nx * ny + 1, ), dtype=np.int64)
+    for j in range(dt_size):
+        cell_ranges[j, 0] = min(int((dt_aabbs[j, 0] - x_min) / cell_x), nx - 1)
+        cell_ranges[j, 1] = min(int((dt_aabbs[j, 1] - y_min) / cell_y), ny - 1)
+        cell_ranges[j, 2] = min(int((dt_aabbs[j, 2] - x_min) / cell_x), nx - 1)
+        cell_ranges[j, 3] = min(int((dt_aabbs[j, 3] - y_min) / cell_y), ny - 1)
+        for cx in range(cell_ranges[j, 0], cell_ranges[j, 2] + 1):
+            for cy in range(cell_ranges[j, 1], cell_ranges[j, 3] + 1):
+                cell_offsets[cx * ny + cy + 1] += 1
+    for c in range(nx * ny):
+        cell_offsets[c + 1] += cell_offsets[c]
+    cell_items = np.zeros((cell_offsets[nx * ny], ), dtype=np.int64)
+    cell_fill = cell_offsets[:-1].copy()
+    for j in range(dt_size):
+        for cx in range(cell_ranges[j, 0], cell_ranges[j, 2] + 1):
+            for cy in range(cell_ranges[j, 1], cell_ranges[j, 3] + 1):
+                cell_items[cell_fill[cx * ny + cy]] = j
+                cell_fill[cx * ny + cy] += 1
+
+    num_pair = 0
+    visited = np.full((dt_size, ), -1, dtype=np.int64)
+    for i in range(gt_size):
+        if gt_aabbs[i, 2] < x_min or gt_aabbs[i, 0] > x_max or gt_aabbs[i, 3] < y_min or gt_aabbs[i, 1] > y_max:
+            continue
+        cx0 = min(max(int((gt_aabbs[i, 0] - x_min) / cell_x), 0), nx - 1)
+        cy0 = min(max(int((gt_aabbs[i, 1] - y_min) / cell_y), 0), ny - 1)
+        cx1 = min(max(int((gt_aabbs[i, 2] - x_min) / cell_x), 0), nx - 1)
+        cy1 = min(max(int((gt_aabbs[i, 3] - y_min) / cell_y), 0), ny - 1)
+        row_start = num_pair
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for c in range(cell_offsets[cx * ny + cy], cell_offsets[cx * ny + cy + 1]):
+                    j = cell_items[c]
+                    if visited[j] == i:
+                        continue
+                    visited[j] = i
+                    # touching boxes are kept, their overlap is left to the iou kernels
+                    if min(gt_aabbs[i, 2], dt_aabbs[j, 2]) < max(gt_aabbs[i, 0], dt_aabbs[j, 0]):
+                        continue
+                    if min(gt_aabbs[i, 3], dt_aabbs[j, 3]) < max(gt_aabbs[i, 1], dt_aabbs[j, 1]):
+                        continue
+                    if fill:
+                        rows[num_pair] = i
+                        cols[num_pair] = j
+                    num_pair += 1
+        if fill:
+            cols[row_start:num_pair].sort()
+    return num_pair
+
+
+@numba.jit(nopython=True, parallel=True)
+def grid_candidate_pairs(gt_aabbs, dt_aabbs, gt_nums, dt_nums, cell_size=0.0):
+    """
+    generate the candidate overlapping (gt, dt) pairs of every sample with a uniform grid index,
+    pairs whose axis aligned extents are disjoint can never overlap and are skipped.
+
+    Args:
+        gt_aabbs: ndarray of float, [num_gt_per_part, 4], xyxy format
+        dt_aabbs: ndarray of float, [num_dt_per_part, 4], xyxy format
+        gt_nums: ndarray of int, [parted_num]
+        dt_nums: ndarray of int, [parted_num]
+        cell_size: float, the side length of grid cells, <= 0: decided by the mean box size per sample
+
+    Returns:
+        pair_nums: ndarray of int, [parted_num], the number of candidate pairs per sample
+        rows: ndarray of int, [num_pair_per_part], indices of gt_aabbs, sorted by sample, rows then cols
+        cols: ndarray of int, [num_pair_per_part], indices of dt_aabbs
+
+    """
+    num_sample = gt_nums.shape[0]
+    gt_offsets = np.zeros((num_sample + 1, ), dtype=np.int64)
+    dt_offsets = np.zeros((num_sample + 1, ), dtype=np.int64)
+    for i in range(num_sample):
+        gt_offsets[i + 1] = gt_offsets[i] + gt_nums[i]
+        dt_offsets[i + 1] = dt_offsets[i] + dt_nums[i]
+
+    empty = np.zeros((0, ), dtype=np.int64)
+    pair_nums = np.zeros((num_sample, ), dtype=np.int64)
+    for i in numba.prange(num_sample):
+        pair_nums[i] = _frame_candidate_pairs(gt_aabbs[gt_offsets[i]:gt_offsets[i + 1]],
+                                              dt_aabbs[dt_offsets[i]:dt_offsets[i + 1]],
+                                              cell_size, empty, empty, False)
+    pair_offsets = np.zeros((num_sample + 1, ), dtype=np.int64)
+    for i in range(num_sample):
+        pair_offsets[i + 1] = pair_offsets[i] + pair_nums[i]
+
+    rows = np.zeros((pair_offsets[num_sample], ), dtype=np.int64)
+    cols = np.zeros((pair_offsets[num_sample], ), dtype=np.int64)
+    for i in numba.prange(num_sample):
+        p0, p1 = pair_offsets[i], pair_offsets[i + 1]
+        _frame_candidate_pairs(gt_aabbs[gt_offsets[i]:gt_offsets[i + 1]],
+                               dt_aabbs[dt_offsets[i]:dt_offsets[i + 1]],
+                               cell_size, rows[p0:p1], cols[p0:p1], True)
+        # indices inside the sample to indices inside the part
+        rows[p0:p1] += gt_offsets[i]
+        cols[p0:p1] += dt_offsets[i]
+    return pair_nums, rows, cols
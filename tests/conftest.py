@@ -0,0 +1,197 @@
+import glob
+import os
+import sys
+
+# the dense overlaps run on the simulator of numba when there is no GPU, it must be set before numba is imported
+if not glob.glob('/dev/nvidia[0-9]*'):
+    os.environ.setdefault('NUMBA_ENABLE_CUDASIM', '1')
+# the server tests run the kernels off the main thread, which may hang the exit with tbb
+os.environ.setdefault('NUMBA_THREADING_LAYER', 'omp')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+import kitti_common as kitti
+
+# the class of each synthetic object, and its dimensions in the hwl order of the label files
+NAMES = ['Car', 'Pedestrian', 'Cyclist', 'Van', 'Person_sitting', 'Truck', 'DontCare', 'Misc']
+NAME_PROBS = [0.4, 0.15, 0.1, 0.1, 0.05, 0.05, 0.1, 0.05]
+DIMS = {
+    'Car': (1.5, 1.6, 3.9),
+    'Pedestrian': (1.7, 0.6, 0.8),
+    'Cyclist': (1.7, 0.6, 1.8),
+    'Van': (2.2, 1.9, 5.0),
+    'Person_sitting': (1.2, 0.6, 0.8),
+    'Truck': (3.0, 2.5, 10.0),
+    'DontCare': (-1.0, -1.0, -1.0),
+    'Misc': (1.5, 1.5, 3.0),
+}
+
+
+# the calibration of a KITTI sample, R0_rect and Tr_velo_to_cam are jittered per synthetic sample
+CALIB = {
+    'P0': [7.215377e+02, 0.0, 6.095593e+02, 0.0, 0.0, 7.215377e+02, 1.728540e+02, 0.0, 0.0, 0.0, 1.0, 0.0],
+    'P1': [7.215377e+02, 0.0, 6.095593e+02, -3.875744e+02, 0.0, 7.215377e+02, 1.728540e+02, 0.0, 0.0, 0.0, 1.0, 0.0],
+    'P2': [7.215377e+02, 0.0, 6.095593e+02, 4.485728e+01, 0.0, 7.215377e+02, 1.728540e+02, 2.163791e-01, 0.0, 0.0,
+           1.0, 2.745884e-03],
+    'P3': [7.215377e+02, 0.0, 6.095593e+02, -3.395242e+02, 0.0, 7.215377e+02, 1.728540e+02, 2.199936e+00, 0.0, 0.0,
+           1.0, 2.729905e-03],
+    'R0_rect': [9.999239e-01, 9.837760e-03, -7.445048e-03, -9.869795e-03, 9.999421e-01, -4.278459e-03, 7.402527e-03,
+                4.351614e-03, 9.999631e-01],
+    'Tr_velo_to_cam': [7.533745e-03, -9.999714e-01, -6.166020e-04, -4.069766e-03, 1.480249e-02, 7.280733e-04,
+                       -9.998902e-01, -7.631618e-02, 9.998621e-01, 7.523790e-03, 1.480755e-02, -2.717806e-01],
+    'Tr_imu_to_velo': [9.999976e-01, 7.553071e-04, -2.035826e-03, -8.086759e-01, -7.854027e-04, 9.998898e-01,
+                       -1.482298e-02, 3.195559e-01, 2.024406e-03, 1.482454e-02, 9.998881e-01, -7.997231e-01],
+}
+
+
+def _label_line(name, bbox, dims, location, rotation_y, alpha, score=None, truncated=0.0, occluded=0):
+    line = '{} {:.2f} {:d} {:.2f} {} {} {} {:.2f}'.format(
+        name, truncated, occluded, alpha, ' '.join('{:.2f}'.format(v) for v in bbox),
+        ' '.join('{:.2f}'.format(v) for v in dims),
+        ' '.join('{:.2f}'.format(v) for v in location), rotation_y)
+    if score is not None:
+        line += ' {:.4f}'.format(score)
+    return line
+
+
+def write_synthetic_labels(root, num_frames=30, seed=0):
+    """
+    write a synthetic split, the detections are jittered copies of the ground truth, some with another class, plus
+    low scoring boxes at random places.
+
+    Args:
+        root: str, the 'label' and 'result' folders are written under it
+        num_frames: int
+        seed: int
+
+    Returns:
+        label_path: str
+        result_path: str
+        image_ids: list of int
+
+    """
+    rng = np.random.RandomState(seed)
+    label_path, result_path = os.path.join(root, 'label'), os.path.join(root, 'result')
+    os.makedirs(label_path, exist_ok=True)
+    os.makedirs(result_path, exist_ok=True)
+    for frame in range(num_frames):
+        gt_lines, dt_lines = [], []
+        for _ in range(rng.randint(0, 12)):
+            name = NAMES[rng.choice(len(NAMES), p=NAME_PROBS)]
+            x, z = rng.uniform(-30, 30), rng.uniform(2, 85)
+            dims = np.array(DIMS[name]) * rng.uniform(0.9, 1.1)
+            rotation_y = rng.uniform(-np.pi, np.pi)
+            u, v = rng.uniform(0, 1200), rng.uniform(100, 300)
+            bbox = np.array([u, v, u + 4000 / z, v + 3000 / z])
+            gt_lines.append(_label_line(name, bbox, dims, (x, 1.6, z), rotation_y, rotation_y - np.arctan2(x, z)))
+            if name != 'DontCare' and rng.rand() < 0.8:
+                for _ in range(rng.randint(1, 3)):
+                    jitter = rng.normal(0, 0.15, 3)
+                    dt_name = name if rng.rand() < 0.9 else NAMES[rng.randint(3)]
+                    dt_lines.append(_label_line(
+                        dt_name, bbox + rng.normal(0, 4, 4), dims * rng.uniform(0.9, 1.1),
+                        (x + jitter[0], 1.6 + jitter[1] * 0.3, z + jitter[2]), rotation_y + rng.normal(0, 0.2),
+                        rotation_y - np.arctan2(x, z) + rng.normal(0, 0.3), 0.3 + 0.7 * rng.rand()))
+        for _ in range(rng.randint(0, 8)):
+            name = NAMES[rng.randint(3)]
+            x, z = rng.uniform(-30, 30), rng.uniform(2, 85)
+            rotation_y = rng.uniform(-3, 3)
+            u, v = rng.uniform(0, 1200), rng.uniform(100, 300)
+            dt_lines.append(_label_line(name, (u, v, u + 4000 / z, v + 3000 / z), DIMS[name], (x, 1.6, z),
+                                        rotation_y, rotation_y, rng.rand() * 0.6))
+        for folder, lines in [(label_path, gt_lines), (result_path, dt_lines)]:
+            with open(os.path.join(folder, kitti.get_image_index_str(frame) + '.txt'), 'w') as f:
+                f.write(''.join(line + '\n' for line in lines))
+    return label_path, result_path, list(range(num_frames))
+
+
+@pytest.fixture(scope='session')
+def synthetic_annos(tmp_path_factory):
+    """the (gt_annos, dt_annos) of a synthetic split"""
+    label_path, result_path, image_ids = write_synthetic_labels(str(tmp_path_factory.mktemp('kitti')))
+    return kitti.get_label_annos(label_path, image_ids), kitti.get_label_annos(result_path, image_ids)
+
+
+def write_synthetic_kitti(root, num_frames=8, seed=0):
+    """
+    write a synthetic KITTI training split with images, calibrations, labels and LiDAR scans. the objects are apart
+    from each other, and each one except DontCare has a known number of points inside its box, the other points are
+    on the ground.
+
+    Args:
+        root: str, the 'training' folder is written under it
+        num_frames: int
+        seed: int
+
+    Returns:
+        image_ids: list of int
+        num_points: list of ndarray of int, [[num_obj], ...], the number of points in each labeled box
+
+    """
+    from skimage import io
+
+    rng = np.random.RandomState(seed)
+    folders = {name: os.path.join(root, 'training', name) for name in ['image_2', 'calib', 'label_2', 'velodyne']}
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+    num_points = []
+    for frame in range(num_frames):
+        stem = kitti.get_image_index_str(frame)
+        io.imsave(os.path.join(folders['image_2'], stem + '.png'),
+                  np.zeros((rng.randint(360, 380), rng.randint(1230, 1250), 3), dtype=np.uint8), check_contrast=False)
+
+        calib = {key: np.array(value) for key, value in CALIB.items()}
+        calib['Tr_velo_to_cam'][[3, 7, 11]] += rng.normal(0, 0.05, 3)
+        with open(os.path.join(folders['calib'], stem + '.txt'), 'w') as f:
+            for key, value in calib.items():
+                f.write('{}: {}\n'.format(key, ' '.join('{:.12e}'.format(v) for v in value)))
+        velo_to_rect = np.eye(4)
+        velo_to_rect[:3, :3] = calib['R0_rect'].reshape(3, 3)
+        tr_velo_to_cam = np.eye(4)
+        tr_velo_to_cam[:3] = calib['Tr_velo_to_cam'].reshape(3, 4)
+        rect_to_velo = np.linalg.inv(velo_to_rect @ tr_velo_to_cam)
+
+        lines, frame_num_points = [], []
+        # the ground below all boxes
+        points = [np.stack([rng.uniform(-30, 30, 300), np.full(300, 1.9), rng.uniform(1, 80, 300)], 1)]
+        # one object in each column of 8 meters, so that the boxes never overlap
+        for column in rng.permutation(7)[:rng.randint(0, 8)]:
+            name = ['Car', 'Pedestrian', 'Cyclist', 'Van', 'Person_sitting', 'DontCare', 'Misc'][rng.randint(7)]
+            # the points are placed in the boxes as they are written to the label files
+            dims = np.round(np.array(DIMS[name]) * (1 if name == 'DontCare' else rng.uniform(0.9, 1.1)), 2)
+            h, w, l = dims
+            location = np.round([-24 + 8 * column + rng.uniform(-1, 1), 1.6, rng.uniform(3, 78)], 2)
+            rotation_y = np.round(rng.uniform(-np.pi, np.pi), 2)
+            u, v = rng.uniform(0, 1150), rng.uniform(100, 250)
+            bbox = np.array([u, v, u + rng.uniform(10, 60), v + rng.uniform(15, 60)])
+            count = 0
+            if name == 'DontCare':
+                location = np.full(3, -1000.0)
+            else:
+                # strictly inside the box, the locations are the bottom centers
+                count = rng.randint(0, 150)
+                local = rng.uniform(-0.45, 0.45, (count, 3)) * [l, h, w] - [0, h / 2, 0]
+                cos, sin = np.cos(rotation_y), np.sin(rotation_y)
+                points.append(location + np.stack([cos * local[:, 0] + sin * local[:, 2], local[:, 1],
+                                                   -sin * local[:, 0] + cos * local[:, 2]], 1))
+            lines.append(_label_line(name, bbox, dims, location, rotation_y, rotation_y, truncated=rng.rand() * 0.6,
+                                     occluded=rng.randint(4)))
+            frame_num_points.append(count)
+        with open(os.path.join(folders['label_2'], stem + '.txt'), 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        points = np.concatenate(points, 0)
+        velo_points = points @ rect_to_velo[:3, :3].T + rect_to_velo[:3, 3]
+        scan = np.concatenate([velo_points, rng.rand(velo_points.shape[0], 1)], 1).astype(np.float32)
+        scan.tofile(os.path.join(folders['velodyne'], stem + '.bin'))
+        num_points.append(np.array(frame_num_points, dtype=np.int64))
+    return list(range(num_frames)), num_points
+
+
+@pytest.fixture(scope='session')
+def synthetic_kitti(tmp_path_factory):
+    """the (root, image_ids, num_points) of a synthetic KITTI training split"""
+    root = str(tmp_path_factory.mktemp('kitti_root'))
+    image_ids, num_points = write_synthetic_kitti(root)
+    return root, image_ids, num_points
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pytest
+
+import eval as kitti_eval
+from disk_cache import DiskCache, content_hash
+
+
+def test_content_hash_changes_with_contents():
+    a = np.arange(6, dtype=np.float32)
+    assert content_hash(a, 'x') == content_hash(a.copy(), 'x')
+    assert content_hash(a, 'x') != content_hash(a.reshape(2, 3), 'x')
+    assert content_hash(a, 'x') != content_hash(a.astype(np.float64), 'x')
+    assert content_hash(a, 'x') != content_hash(a, 'y')
+
+
+def test_hits_and_misses(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    assert cache.load_array('a') is None
+    cache.save_array('a', np.arange(4))
+    np.testing.assert_array_equal(cache.load_array('a'), np.arange(4))
+    assert cache.load_bytes('b') is None
+    cache.save_bytes('b', b'data')
+    assert cache.load_bytes('b') == b'data'
+    assert (cache.hits, cache.misses) == (2, 2)
+    # another instance on the same directory sees the files
+    assert DiskCache(str(tmp_path)).load_bytes('b') == b'data'
+
+
+def test_writes_are_atomic(tmp_path):
+    cache = DiskCache(str(tmp_path), suffix='.json')
+    cache.save_bytes('a', b'old')
+    cache.save_bytes('a', b'new')
+    assert cache.load_bytes('a') == b'new'
+    # no temporary file is left behind
+    assert os.listdir(str(tmp_path)) == ['a.json']
+
+
+def test_overwrite_counts_once(tmp_path):
+    cache = DiskCache(str(tmp_path), suffix='.json')
+    for _ in range(5):
+        cache.save_bytes('a', b'x' * 100)
+    assert cache.total_bytes == 100
+    cache.save_bytes('a', b'x' * 10)
+    assert cache.total_bytes == 10
+    assert cache.total_bytes == DiskCache(str(tmp_path), suffix='.json').total_bytes
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=350, suffix='.json')
+    for i, key in enumerate('abc'):
+        cache.save_bytes(key, b'x' * 100)
+        os.utime(str(tmp_path / (key + '.json')), (i, i))
+    # reading 'a' makes 'b' the least recently used one
+    assert cache.load_bytes('a') is not None
+    cache.save_bytes('d', b'x' * 100)
+    assert sorted(os.listdir(str(tmp_path))) == ['a.json', 'c.json', 'd.json']
+    assert cache.total_bytes == 300
+    # repeated overwrites alone never evict anything
+    for _ in range(10):
+        cache.save_bytes('d', b'x' * 100)
+    assert sorted(os.listdir(str(tmp_path))) == ['a.json', 'c.json', 'd.json']
+
+
+@pytest.mark.parametrize('num_part', [1, 4])
+def test_cached_box_overlap(synthetic_annos, tmp_path, num_part):
+    gt_annos, dt_annos = synthetic_annos
+    expected = kitti_eval.calculate_iou_partly(gt_annos, dt_annos, 0, num_part)[0]
+    cache = DiskCache(str(tmp_path))
+    for misses in [True, False]:
+        cache.hits, cache.misses = 0, 0
+        overlaps = kitti_eval.calculate_iou_partly(gt_annos, dt_annos, 0, num_part, overlap_cache=cache)[0]
+        for overlap, expected_overlap in zip(overlaps, expected):
+            np.testing.assert_array_equal(overlap, expected_overlap)
+        num_cached = sum(len(gt['name']) > 0 and len(dt['name']) > 0 for gt, dt in zip(gt_annos, dt_annos))
+        assert (cache.misses, cache.hits) == ((num_cached, 0) if misses else (0, num_cached))
@@ -0,0 +1,72 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+import eval_server
+import kitti_common as kitti
+from conftest import write_synthetic_labels
+from eval import get_official_eval_result
+
+
+@pytest.fixture(scope='module')
+def client():
+    service = eval_server.EvalService(num_workers=2, num_threads=1)
+    handler = type('Handler', (eval_server.EvalRequestHandler, ), {'service': service})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield eval_server.EvalClient(port=server.server_address[1], poll_interval=0.05)
+    server.shutdown()
+    server.server_close()
+    service.executor.shutdown()
+
+
+def test_annos_json_round_trip(synthetic_annos):
+    gt_annos, dt_annos = synthetic_annos
+    for annos in [gt_annos, dt_annos]:
+        round_trip = eval_server.annos_from_json(eval_server.annos_to_json(annos))
+        assert len(round_trip) == len(annos)
+        for anno, expected in zip(round_trip, annos):
+            assert anno.keys() == expected.keys()
+            for key in expected:
+                assert anno[key].shape == expected[key].shape
+                np.testing.assert_array_equal(anno[key], expected[key])
+
+
+def test_concurrent_jobs_equal_direct_results(client, tmp_path):
+    label_path, result_path, image_ids = write_synthetic_labels(str(tmp_path))
+    _, other_result_path, _ = write_synthetic_labels(str(tmp_path / 'other'), seed=1)
+    label_split_file = str(tmp_path / 'val.txt')
+    with open(label_split_file, 'w') as f:
+        f.write(''.join('{}\n'.format(idx) for idx in image_ids))
+    gt_annos = kitti.get_label_annos(label_path, image_ids)
+    other_dt_annos = kitti.get_label_annos(other_result_path)
+    options = dict(sparse_overlap=True, difficultys=[0, 1, 2, 3], min_score=0.1)
+    expected = [get_official_eval_result(gt_annos, kitti.get_label_annos(result_path), [0, 1, 2], return_dict=True,
+                                         **options),
+                get_official_eval_result(gt_annos, other_dt_annos, [0, 1, 2], return_dict=True, **options)]
+
+    # one job by its result folder and one by its annotations, both running at the same time
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(client.get_official_eval_result, dt_annos, [0, 1, 2], label_path,
+                                   label_split_file, return_dict=True, **options)
+                   for dt_annos in [result_path, other_dt_annos]]
+        results = [future.result(timeout=600) for future in futures]
+    for (result, ret_dict), (expected_result, expected_dict) in zip(results, expected):
+        assert result == expected_result
+        assert ret_dict == expected_dict
+
+
+def test_failed_job(client, tmp_path):
+    label_path, result_path, image_ids = write_synthetic_labels(str(tmp_path), num_frames=3)
+    label_split_file = str(tmp_path / 'val.txt')
+    with open(label_split_file, 'w') as f:
+        f.write(''.join('{}\n'.format(idx) for idx in image_ids))
+    with open(os.path.join(result_path, kitti.get_image_index_str(0) + '.txt'), 'w') as f:
+        f.write('Car broken line\n')
+    with pytest.raises(RuntimeError, match='ValueError'):
+        client.get_official_eval_result(result_path, [0], label_path, label_split_file)
@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import shutil
+import time
+
+import pytest
+
+import evaluate
+import kitti_common as kitti
+from conftest import write_synthetic_labels
+from eval import get_official_eval_result
+
+AP_LINE = re.compile(r'^(\w+ AP(_R40)?:|bbox \(|bev  \(|3d   \(|aos  )')
+
+
+def _ap_lines(output):
+    """the lines of the AP tables in the printed output"""
+    return [line for line in output.splitlines() if AP_LINE.match(line)]
+
+
+@pytest.fixture
+def kitti_split(tmp_path, monkeypatch):
+    """the (label_path, result_path, label_split_file) of a synthetic split, in a fresh working directory"""
+    label_path, result_path, image_ids = write_synthetic_labels(str(tmp_path))
+    label_split_file = str(tmp_path / 'val.txt')
+    with open(label_split_file, 'w') as f:
+        f.write(''.join('{}\n'.format(idx) for idx in image_ids))
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('results')
+    return label_path, result_path, label_split_file
+
+
+def _evaluate_lines(capsys, result_path, label_path, label_split_file):
+    capsys.readouterr()
+    evaluate.evaluate(result_path, label_path, label_split_file, current_classes=[0, 1, 2], sparse_overlap=True)
+    return _ap_lines(capsys.readouterr().out)
+
+
+def test_incremental_equals_evaluate(kitti_split, capsys, monkeypatch):
+    label_path, result_path, label_split_file = kitti_split
+    expected = _evaluate_lines(capsys, result_path, label_path, label_split_file)
+    assert len(expected) > 0
+    evaluate.evaluate_incremental(result_path, label_path, label_split_file, current_classes=[0, 1, 2],
+                                  sparse_overlap=True)
+    out = capsys.readouterr().out
+    assert 'Reused samples: 0, re-evaluated samples: 30' in out
+    assert _ap_lines(out) == expected
+
+    # drop the last detection of some samples and change a label
+    for idx in [3, 7, 11]:
+        path = os.path.join(result_path, kitti.get_image_index_str(idx) + '.txt')
+        with open(path) as f:
+            lines = f.readlines()
+        with open(path, 'w') as f:
+            f.write(''.join(lines[:-1]))
+    path = os.path.join(label_path, kitti.get_image_index_str(20) + '.txt')
+    with open(path) as f:
+        lines = f.readlines()
+    with open(path, 'w') as f:
+        f.write(''.join(lines[1:]))
+
+    expected_changed = _evaluate_lines(capsys, result_path, label_path, label_split_file)
+    assert expected_changed != expected
+    evaluate.evaluate_incremental(result_path, label_path, label_split_file, current_classes=[0, 1, 2],
+                                  sparse_overlap=True)
+    out = capsys.readouterr().out
+    assert 'Reused samples: 26, re-evaluated samples: 4' in out
+    assert _ap_lines(out) == expected_changed
+
+    # another overlap method does not reuse the statistics, the dense overlaps themselves are not run here
+    class Recomputed(Exception):
+        pass
+
+    def compute_frame_statistics(gt_annos, *args, **kwargs):
+        raise Recomputed(len(gt_annos))
+
+    monkeypatch.setattr(evaluate, 'compute_frame_statistics', compute_frame_statistics)
+    with pytest.raises(Recomputed, match='30'):
+        evaluate.evaluate_incremental(result_path, label_path, label_split_file, current_classes=[0, 1, 2],
+                                      sparse_overlap=False)
+
+
+@pytest.fixture
+def watch_dir(tmp_path):
+    """the (watch_dir, label_path, label_split_file) of a small synthetic split, its results are copied to the sub
+    folders of watch_dir by the tests"""
+    label_path, result_path, image_ids = write_synthetic_labels(str(tmp_path), num_frames=6)
+    label_split_file = str(tmp_path / 'val.txt')
+    with open(label_split_file, 'w') as f:
+        f.write(''.join('{}\n'.format(idx) for idx in image_ids))
+    watch_dir = tmp_path / 'watch'
+    watch_dir.mkdir()
+    return str(watch_dir), result_path, label_path, label_split_file
+
+
+def _copy_results(result_path, folder, marker_file=None):
+    os.makedirs(folder)
+    for name in os.listdir(result_path):
+        shutil.copy(os.path.join(result_path, name), folder)
+    if marker_file is not None:
+        open(os.path.join(folder, marker_file), 'w').close()
+
+
+def _read_jsonl(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_result_folder_ready(tmp_path):
+    folder = str(tmp_path / 'a')
+    os.makedirs(folder)
+    for idx in range(3):
+        open(os.path.join(folder, kitti.get_image_index_str(idx) + '.txt'), 'w').close()
+    assert not evaluate._result_folder_ready(folder, 4, None, 0)
+    assert evaluate._result_folder_ready(folder, 3, None, 0)
+    # a folder changed recently is not settled
+    assert not evaluate._result_folder_ready(folder, 3, None, 60)
+    past = time.time() - 120
+    for entry in os.scandir(folder):
+        os.utime(entry.path, (past, past))
+    os.utime(folder, (past, past))
+    assert evaluate._result_folder_ready(folder, 3, None, 60)
+    # with a marker file only the marker counts
+    assert not evaluate._result_folder_ready(folder, 3, 'done', 0)
+    open(os.path.join(folder, 'done'), 'w').close()
+    assert evaluate._result_folder_ready(folder, 100, 'done', 60)
+
+
+def test_watch_marker_file(watch_dir):
+    watch_dir, result_path, label_path, label_split_file = watch_dir
+    _copy_results(result_path, os.path.join(watch_dir, 'a'))
+    _copy_results(result_path, os.path.join(watch_dir, 'b'), marker_file='done')
+    evaluate.watch(watch_dir, label_path, label_split_file, current_classes=[0, 1, 2], sparse_overlap=True,
+                   marker_file='done', poll_interval=0, settle_time=0, max_evals=1)
+    history = _read_jsonl(os.path.join(watch_dir, 'eval_history.jsonl'))
+    assert [record['result_path'] for record in history] == [os.path.join(watch_dir, 'b')]
+    assert 'Car' in history[0]['results']
+
+
+def test_watch_retries_changed_folders(watch_dir, monkeypatch):
+    watch_dir, result_path, label_path, label_split_file = watch_dir
+    for name in ['a', 'b', 'c']:
+        _copy_results(result_path, os.path.join(watch_dir, name))
+    broken_file = os.path.join(watch_dir, 'b', kitti.get_image_index_str(0) + '.txt')
+    with open(broken_file, 'w') as f:
+        f.write('Car broken line\n')
+    # the folder 'c' is removed while it is scanned, which must not stop the watch
+    result_folder_mtime = evaluate._result_folder_mtime
+
+    def removed_folder_mtime(folder):
+        if folder.endswith('c'):
+            raise FileNotFoundError(folder)
+        return result_folder_mtime(folder)
+
+    monkeypatch.setattr(evaluate, '_result_folder_mtime', removed_folder_mtime)
+    # the broken folder is fixed while the watch is waiting
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        # the watch would wait forever if the fixed folder was not evaluated again
+        assert len(sleeps) < 5
+        shutil.copy(os.path.join(result_path, kitti.get_image_index_str(0) + '.txt'), broken_file)
+
+    monkeypatch.setattr(evaluate.time, 'sleep', sleep)
+    evaluate.watch(watch_dir, label_path, label_split_file, current_classes=[0, 1, 2], sparse_overlap=True,
+                   poll_interval=0, settle_time=0, max_evals=3)
+    history = _read_jsonl(os.path.join(watch_dir, 'eval_history.jsonl'))
+    errors = _read_jsonl(os.path.join(watch_dir, 'eval_errors.jsonl'))
+    assert [record['result_path'] for record in errors] == [os.path.join(watch_dir, 'b')]
+    assert [record['result_path'] for record in history] == [os.path.join(watch_dir, 'a'), os.path.join(watch_dir, 'b')]
+    assert history[0]['results'] == history[1]['results']
+    assert len(sleeps) == 1
+
+
+def _sections(output, header):
+    """the AP lines after each header line in the printed output, by the header"""
+    sections = {}
+    for line in output.splitlines():
+        match = header.match(line)
+        if match:
+            lines = sections[match.group(1)] = []
+        elif AP_LINE.match(line):
+            lines.append(line)
+    return sections
+
+
+def _official_lines(label_path, result_path, image_ids):
+    gt_annos = kitti.get_label_annos(label_path, image_ids)
+    dt_annos = kitti.get_label_annos(result_path, image_ids)
+    return _ap_lines(get_official_eval_result(gt_annos, dt_annos, [0, 1, 2], sparse_overlap=True))
+
+
+def test_splits_equal_official(kitti_split, capsys):
+    label_path, result_path, _ = kitti_split
+    splits = {'first.txt': list(range(0, 15)), 'odd.txt': list(range(1, 30, 2)), 'shuffled.txt': [7, 3, 22, 9, 18]}
+    for split_file, image_ids in splits.items():
+        with open(split_file, 'w') as f:
+            f.write(''.join('{}\n'.format(idx) for idx in image_ids))
+    capsys.readouterr()
+    evaluate.evaluate_splits(result_path, list(splits), label_path, current_classes=[0, 1, 2], sparse_overlap=True)
+    sections = _sections(capsys.readouterr().out, re.compile(r'^Split (\S+) \(\d+ samples\):$'))
+    assert sorted(sections) == sorted(splits)
+    for split_file, image_ids in splits.items():
+        assert len(sections[split_file]) > 0
+        assert sections[split_file] == _official_lines(label_path, result_path, image_ids)
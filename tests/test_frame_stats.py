@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from eval import (CLASS_TO_NAME, get_class_ints, get_official_eval_result, get_official_min_overlaps,
+                  official_result_dict)
+from frame_stats import (compute_frame_statistics, get_frame_statistics_mAP, load_frame_statistics,
+                         merge_frame_statistics, save_frame_statistics)
+
+CURRENT_CLASSES = get_class_ints([0, 1, 2])
+DIFFICULTYS = [0, 1, 2, 3, 4, 5, 6, 7]
+
+
+def _result_dict(stats):
+    mAPs, compute_aos = get_frame_statistics_mAP(stats)
+    return official_result_dict(CURRENT_CLASSES, stats['min_overlaps'], mAPs, compute_aos)
+
+
+def _assert_same_results(results, expected):
+    # the official results also have the numbers of dropped detections
+    class_names = [CLASS_TO_NAME[curcls] for curcls in CURRENT_CLASSES]
+    assert set(results.keys()) == set(class_names)
+    for class_name in class_names:
+        assert len(results[class_name]) == len(expected[class_name])
+        for setting, expected_setting in zip(results[class_name], expected[class_name]):
+            assert setting.keys() == expected_setting.keys()
+            assert setting['min_overlaps'] == expected_setting['min_overlaps']
+            for ap_type in ['AP', 'AP_R40']:
+                assert setting[ap_type].keys() == expected_setting[ap_type].keys()
+                for metric_name, aps in setting[ap_type].items():
+                    if metric_name == 'aos':
+                        # the similarities are summed in another order
+                        assert aps == pytest.approx(expected_setting[ap_type][metric_name], rel=1e-12, abs=1e-12)
+                    else:
+                        assert aps == expected_setting[ap_type][metric_name]
+
+
+@pytest.fixture(scope='module')
+def official_results(synthetic_annos):
+    gt_annos, dt_annos = synthetic_annos
+    return get_official_eval_result(gt_annos, dt_annos, CURRENT_CLASSES, return_dict=True)[1]
+
+
+@pytest.mark.parametrize('sparse_overlap', [False, True])
+def test_frame_statistics_equal_official(synthetic_annos, official_results, sparse_overlap):
+    gt_annos, dt_annos = synthetic_annos
+    stats = compute_frame_statistics(gt_annos, dt_annos, CURRENT_CLASSES, DIFFICULTYS,
+                                     get_official_min_overlaps(CURRENT_CLASSES), sparse_overlap=sparse_overlap)
+    _assert_same_results(_result_dict(stats), official_results)
+
+
+@pytest.mark.parametrize('num_shards', [2, 3])
+def test_merged_shards_equal_official(synthetic_annos, official_results, tmp_path, num_shards):
+    gt_annos, dt_annos = synthetic_annos
+    shard_files = []
+    # the shards of evaluate_shard() in evaluate.py, saved and loaded in reverse order
+    for shard_index in reversed(range(num_shards)):
+        frame_indices = list(range(shard_index, len(gt_annos), num_shards))
+        stats = compute_frame_statistics([gt_annos[i] for i in frame_indices], [dt_annos[i] for i in frame_indices],
+                                         CURRENT_CLASSES, DIFFICULTYS, get_official_min_overlaps(CURRENT_CLASSES))
+        stats['frame_indices'] = np.array(frame_indices, dtype=np.int64)
+        shard_files.append(str(tmp_path / 'shard_{:d}.npz'.format(shard_index)))
+        save_frame_statistics(shard_files[-1], stats)
+    stats = merge_frame_statistics([load_frame_statistics(shard_file) for shard_file in shard_files])
+    assert stats['frame_indices'].tolist() == list(range(len(gt_annos)))
+    _assert_same_results(_result_dict(stats), official_results)
+
+
+def test_overlapping_shards_are_rejected(synthetic_annos):
+    gt_annos, dt_annos = synthetic_annos
+    stats = compute_frame_statistics(gt_annos[:4], dt_annos[:4], CURRENT_CLASSES, DIFFICULTYS,
+                                     get_official_min_overlaps(CURRENT_CLASSES), sparse_overlap=True)
+    stats['frame_indices'] = np.arange(4)
+    with pytest.raises(ValueError):
+        merge_frame_statistics([stats, stats])
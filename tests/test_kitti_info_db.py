@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+
+import kitti_common as kitti
+from kitti_info_db import build_kitti_info_db, load_kitti_info_db
+
+
+def _assert_same_info(info, expected):
+    assert info.keys() == expected.keys()
+    for key, value in expected.items():
+        if key == 'annos':
+            assert info[key].keys() == value.keys()
+            for anno_key, anno_value in value.items():
+                np.testing.assert_array_equal(info[key][anno_key], anno_value)
+        elif isinstance(value, np.ndarray):
+            assert info[key].dtype == value.dtype
+            np.testing.assert_array_equal(info[key], value)
+        else:
+            assert info[key] == value
+
+
+@pytest.mark.parametrize('relative_path', [True, False])
+def test_info_db_equals_image_info(synthetic_kitti, tmp_path, relative_path):
+    root, image_ids, _ = synthetic_kitti
+    expected = kitti.get_kitti_image_info(root, velodyne=True, calib=True, image_ids=image_ids,
+                                          relative_path=relative_path)
+    assert build_kitti_info_db(root, str(tmp_path), velodyne=True, calib=True, image_ids=image_ids, num_worker=2,
+                               relative_path=relative_path, chunk_size=3) == len(image_ids)
+    db = load_kitti_info_db(str(tmp_path))
+    assert len(db) == len(expected)
+    # the synthetic objects cover every difficulty
+    difficulties = np.concatenate([info['annos']['difficulty'] for info in expected])
+    assert set(difficulties.tolist()) == {-1, 0, 1, 2}
+    for info, expected_info in zip(db.image_infos(), expected):
+        _assert_same_info(info, expected_info)
+
+
+def test_info_db_without_matrices_extended(synthetic_kitti, tmp_path):
+    root, image_ids, _ = synthetic_kitti
+    expected = kitti.get_kitti_image_info(root, calib=True, image_ids=image_ids[:4], extend_matrix=False,
+                                          with_imageshape=False, label_info=False)
+    build_kitti_info_db(root, str(tmp_path), calib=True, image_ids=image_ids[:4], num_worker=1,
+                        extend_matrix=False, with_imageshape=False, label_info=False)
+    for info, expected_info in zip(load_kitti_info_db(str(tmp_path)).image_infos(), expected):
+        _assert_same_info(info, expected_info)
+
+
+def test_missing_files_are_reported(synthetic_kitti, tmp_path):
+    root, image_ids, _ = synthetic_kitti
+    with pytest.raises(ValueError, match=os.path.join('image_2', '000099.png')):
+        build_kitti_info_db(root, str(tmp_path), calib=True, image_ids=image_ids + [99], num_worker=1)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+import eval as kitti_eval
+
+CURRENT_CLASSES = [0, 1, 2]
+DIFFICULTYS = [0, 1, 2, 3, 4, 5, 6, 7]
+# the ground truth classes which are ignored rather than unknown when evaluating a class
+NEIGHBOR_CLASSES = {'car': ['van'], 'pedestrian': ['person_sitting']}
+
+
+@pytest.fixture(scope='module')
+def match_records(synthetic_annos, tmp_path_factory):
+    gt_annos, dt_annos = synthetic_annos
+    path = str(tmp_path_factory.mktemp('records') / 'matches.npz')
+    kitti_eval.get_official_eval_result(gt_annos, dt_annos, CURRENT_CLASSES, sparse_overlap=True,
+                                        match_records_file=path)
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def test_records_count_valid_ground_truth(synthetic_annos, match_records):
+    gt_annos, dt_annos = synthetic_annos
+    prepared = kitti_eval.prepare_data(gt_annos, dt_annos, CURRENT_CLASSES, DIFFICULTYS)
+    status_names = list(match_records['status_names'])
+    tp, fn = status_names.index('tp'), status_names.index('fn')
+    gt_records = ~match_records['is_dt']
+    for metric in range(3):
+        for m, current_class in enumerate(CURRENT_CLASSES):
+            for l, difficulty in enumerate(DIFFICULTYS):
+                for k in range(match_records['min_overlaps'].shape[0]):
+                    mask = (gt_records & (match_records['metric'] == metric) & (match_records['class'] == m)
+                            & (match_records['difficulty'] == l) & (match_records['overlap'] == k))
+                    status = match_records['status'][mask]
+                    assert np.sum((status == tp) | (status == fn)) == \
+                        prepared['num_valid_gts'][(current_class, difficulty)]
+                    # every detection of the class has a record too
+                    dt_mask = (match_records['is_dt'] & (match_records['metric'] == metric)
+                               & (match_records['class'] == m) & (match_records['difficulty'] == l)
+                               & (match_records['overlap'] == k))
+                    assert np.sum(dt_mask) == np.sum(prepared['ignored_dts'][current_class] == 0)
+
+
+def test_ignored_reasons(synthetic_annos, match_records):
+    gt_annos, _ = synthetic_annos
+    status_names = list(match_records['status_names'])
+    reason_names = list(match_records['reason_names'])
+    ignored = match_records['status'] == status_names.index('ignored')
+    assert np.all((match_records['reason'] == reason_names.index('none')) == ~ignored)
+
+    gt_records = np.nonzero(~match_records['is_dt'])[0]
+    gt_bins = kitti_eval._get_distance_bins(gt_annos)
+    gt_offsets = np.cumsum([0] + [len(a['name']) for a in gt_annos])
+    reasons_seen = set()
+    for i in gt_records:
+        name = gt_annos[match_records['frame'][i]]['name'][match_records['object'][i]].lower()
+        class_name = kitti_eval.CLASS_NAMES[CURRENT_CLASSES[match_records['class'][i]]]
+        reason = reason_names[match_records['reason'][i]]
+        reasons_seen.add(reason)
+        if reason == 'neighbor_class':
+            assert name in NEIGHBOR_CLASSES[class_name]
+        elif reason == 'other_bin':
+            assert name == class_name
+            gt_bin = gt_bins[gt_offsets[match_records['frame'][i]] + match_records['object'][i]]
+            assert gt_bin != DIFFICULTYS[match_records['difficulty'][i]]
+        else:
+            assert name == class_name
+    assert {'none', 'neighbor_class', 'other_bin'} <= reasons_seen
+
+    # the detections assigned to an ignored ground truth object share its reason
+    dt_ignored = np.nonzero(match_records['is_dt'] & ignored & (match_records['matched'] >= 0))[0]
+    assert len(dt_ignored) > 0
+    keys = ['metric', 'class', 'difficulty', 'overlap', 'frame']
+    gt_reasons = {tuple(match_records[key][i] for key in keys) + (match_records['object'][i], ):
+                  match_records['reason'][i] for i in gt_records}
+    for i in dt_ignored:
+        key = tuple(match_records[key][i] for key in keys) + (match_records['matched'][i], )
+        assert match_records['reason'][i] == gt_reasons[key]
+
+
+def test_npz_round_trip(synthetic_annos, tmp_path):
+    gt_annos, dt_annos = synthetic_annos
+    min_overlaps = kitti_eval.get_official_min_overlaps(CURRENT_CLASSES)
+    records_list = []
+    kitti_eval.do_eval(gt_annos, dt_annos, CURRENT_CLASSES, DIFFICULTYS, min_overlaps, sparse_overlap=True,
+                       match_records=records_list, metrics=(1, ))
+    records = kitti_eval.concat_match_records(records_list)
+    path = str(tmp_path / 'matches.npz')
+    kitti_eval.save_match_records(path, records, CURRENT_CLASSES, DIFFICULTYS, min_overlaps)
+    with np.load(path) as data:
+        for key, value in records.items():
+            assert data[key].dtype == value.dtype
+            np.testing.assert_array_equal(data[key], value)
+        np.testing.assert_array_equal(data['current_classes'], CURRENT_CLASSES)
+        np.testing.assert_array_equal(data['difficultys'], DIFFICULTYS)
+        np.testing.assert_array_equal(data['min_overlaps'], min_overlaps)
+        assert list(data['status_names']) == kitti_eval.MATCH_STATUS
+        assert list(data['reason_names']) == kitti_eval.IGNORED_REASONS
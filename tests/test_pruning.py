@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import eval as kitti_eval
+
+CURRENT_CLASSES = [0, 1]
+OPTIONS = dict(sparse_overlap=True, difficultys=[0, 1, 2, 3], return_dict=True)
+
+
+def _filter_detections(dt_annos, min_score, top_k):
+    """min_score and top_k of prune_detections(), applied to the detections of every class"""
+    filtered_annos = []
+    for anno in dt_annos:
+        keep = anno['score'] >= min_score if min_score > 0 else np.ones_like(anno['score'], dtype=bool)
+        if top_k >= 0:
+            for name in np.unique(anno['name']):
+                indices = np.flatnonzero(keep & (anno['name'] == name))
+                order = np.argsort(-anno['score'][indices], kind='stable')
+                keep[indices[order[top_k:]]] = False
+        filtered_annos.append({key: value[keep] for key, value in anno.items()})
+    return filtered_annos
+
+
+def _without_dropped(results):
+    return {key: value for key, value in results.items() if key != 'num_dropped'}
+
+
+@pytest.mark.parametrize('min_score, top_k', [(-1, -1), (0.35, -1), (-1, 2), (0.2, 3)])
+def test_pruned_results_equal_unpruned(synthetic_annos, monkeypatch, min_score, top_k):
+    gt_annos, dt_annos = synthetic_annos
+    result, results = kitti_eval.get_official_eval_result(gt_annos, dt_annos, CURRENT_CLASSES, min_score=min_score,
+                                                          top_k=top_k, **OPTIONS)
+    num_dropped = results['num_dropped']
+    assert num_dropped['class'] > 0 and num_dropped['unmatchable'] > 0
+    assert (num_dropped['min_score'] > 0) == (min_score > 0)
+    assert (num_dropped['top_k'] > 0) == (top_k >= 0)
+
+    # the detections filtered beforehand, without dropping the other classes and the unmatchable ones
+    filtered_annos = _filter_detections(dt_annos, min_score, top_k)
+    monkeypatch.setattr(kitti_eval, 'prune_detections', lambda dt_annos, *args: (
+        dt_annos, [np.arange(len(anno['name'])) for anno in dt_annos], {'class': 0, 'min_score': 0, 'top_k': 0}))
+    monkeypatch.setattr(kitti_eval, 'prune_unmatchable_detections', lambda gt_annos, dt_annos, *args: (
+        dt_annos, [np.arange(len(anno['name'])) for anno in dt_annos], 0))
+    unpruned_result, unpruned_results = kitti_eval.get_official_eval_result(gt_annos, filtered_annos,
+                                                                            CURRENT_CLASSES, **OPTIONS)
+    assert sum(unpruned_results['num_dropped'].values()) == 0
+    assert result == unpruned_result
+    assert _without_dropped(results) == _without_dropped(unpruned_results)
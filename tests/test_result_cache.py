@@ -0,0 +1,95 @@
+import copy
+import os
+
+import pytest
+
+import eval as kitti_eval
+
+OPTIONS = dict(sparse_overlap=True, metrics=[1], difficultys=[0, 1, 2])
+
+
+@pytest.fixture
+def count_evals(monkeypatch):
+    """the number of evaluations which were not loaded from the cache"""
+    calls = []
+    do_eval = kitti_eval.do_eval
+
+    def counting_do_eval(*args, **kwargs):
+        calls.append(1)
+        return do_eval(*args, **kwargs)
+
+    monkeypatch.setattr(kitti_eval, 'do_eval', counting_do_eval)
+    return lambda: len(calls)
+
+
+def _evaluate(gt_annos, dt_annos, cache_dir, **options):
+    return kitti_eval.get_official_eval_result(gt_annos, dt_annos, [0, 1], return_dict=True,
+                                               result_cache_dir=cache_dir, **dict(OPTIONS, **options))
+
+
+def test_hit_and_miss(synthetic_annos, tmp_path, count_evals):
+    gt_annos, dt_annos = synthetic_annos
+    cache_dir = str(tmp_path)
+    expected = _evaluate(gt_annos, dt_annos, None)
+    assert count_evals() == 1
+    assert _evaluate(gt_annos, dt_annos, cache_dir) == expected
+    assert count_evals() == 2
+    # the same inputs again only load the results, the dropped counts included
+    assert _evaluate(gt_annos, dt_annos, cache_dir) == expected
+    assert _evaluate(copy.deepcopy(gt_annos), copy.deepcopy(dt_annos), cache_dir) == expected
+    assert count_evals() == 2
+    # the text result alone is cached as well
+    assert kitti_eval.get_official_eval_result(gt_annos, dt_annos, [0, 1], result_cache_dir=cache_dir,
+                                               **OPTIONS) == expected[0]
+    assert count_evals() == 2
+
+
+@pytest.mark.parametrize('options', [
+    dict(sparse_overlap=False, compact_overlap=True),
+    dict(min_score=0.2),
+    dict(top_k=2),
+    dict(difficultys=[0, 1]),
+    dict(overlap_sets=[0]),
+    dict(ap_types=['AP_R40']),
+    dict(metrics=[0]),
+])
+def test_config_changes_miss(synthetic_annos, tmp_path, count_evals, options):
+    gt_annos, dt_annos = synthetic_annos
+    cache_dir = str(tmp_path)
+    _evaluate(gt_annos, dt_annos, cache_dir)
+    assert count_evals() == 1
+    changed = _evaluate(gt_annos, dt_annos, cache_dir, **options)
+    assert count_evals() == 2
+    assert changed == _evaluate(gt_annos, dt_annos, None, **options)
+    assert _evaluate(gt_annos, dt_annos, cache_dir, **options) == changed
+    assert count_evals() == 3
+
+
+def test_annotation_changes_miss(synthetic_annos, tmp_path, count_evals):
+    gt_annos, dt_annos = synthetic_annos
+    cache_dir = str(tmp_path)
+    _evaluate(gt_annos, dt_annos, cache_dir)
+    changed_dt_annos = copy.deepcopy(dt_annos)
+    changed_dt_annos[0]['score'] = changed_dt_annos[0]['score'] * 0.5
+    _evaluate(gt_annos, changed_dt_annos, cache_dir)
+    changed_gt_annos = copy.deepcopy(gt_annos)
+    changed_gt_annos[0]['occluded'] = changed_gt_annos[0]['occluded'] + 1
+    _evaluate(changed_gt_annos, dt_annos, cache_dir)
+    assert count_evals() == 3
+
+
+def test_eviction(synthetic_annos, tmp_path, count_evals):
+    gt_annos, dt_annos = synthetic_annos
+    cache_dir = str(tmp_path)
+    _evaluate(gt_annos, dt_annos, cache_dir)
+    # room for a single result
+    result_size = os.path.getsize(os.path.join(cache_dir, os.listdir(cache_dir)[0]))
+    cache_size = 1.5 * result_size / (1024 * 1024)
+    _evaluate(gt_annos, dt_annos, cache_dir, result_cache_size=cache_size, min_score=0.1)
+    assert len(os.listdir(cache_dir)) == 1
+    assert count_evals() == 2
+    # the first result was evicted, the second one is still there
+    _evaluate(gt_annos, dt_annos, cache_dir, result_cache_size=cache_size, min_score=0.1)
+    assert count_evals() == 2
+    _evaluate(gt_annos, dt_annos, cache_dir, result_cache_size=cache_size)
+    assert count_evals() == 3
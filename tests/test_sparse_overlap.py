@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from eval import (calculate_iou_compact, calculate_iou_partly, calculate_iou_sparse, get_official_eval_result,
+                  get_split_parts, sparse_frame_overlap, _sample_offsets)
+
+
+def _sample_overlaps(parted_pairs, gt_nums, dt_nums, num_part):
+    """scatter the pairs of each sample back into a dense matrix"""
+    overlaps = []
+    idx = 0
+    for parted_num, (pair_nums, rows, cols, vals) in zip(get_split_parts(len(gt_nums), num_part), parted_pairs):
+        gt_offsets = _sample_offsets(gt_nums[idx:idx + parted_num])
+        dt_offsets = _sample_offsets(dt_nums[idx:idx + parted_num])
+        pair_offsets = _sample_offsets(pair_nums)
+        for i in range(parted_num):
+            overlaps.append(sparse_frame_overlap(rows, cols, vals, pair_offsets[i], pair_nums[i], gt_offsets[i],
+                                                 dt_offsets[i], gt_nums[idx + i], dt_nums[idx + i]))
+        idx += parted_num
+    return overlaps
+
+
+@pytest.fixture(scope='module')
+def dense_results(synthetic_annos):
+    gt_annos, dt_annos = synthetic_annos
+    return get_official_eval_result(gt_annos, dt_annos, [0, 1, 2], return_dict=True)[1]
+
+
+@pytest.mark.parametrize('metric', [0, 1, 2])
+def test_sparse_overlaps_equal_dense(synthetic_annos, metric):
+    gt_annos, dt_annos = synthetic_annos
+    # the DontCare regions have no 3d boxes
+    gt_annos = [{key: value[anno['name'] != 'DontCare'] for key, value in anno.items()} for anno in gt_annos]
+    overlaps, _, gt_nums, dt_nums = calculate_iou_partly(gt_annos, dt_annos, metric, num_part=4)
+    parted_pairs, _, _ = calculate_iou_sparse(gt_annos, dt_annos, metric, num_part=4)
+    for sparse, dense in zip(_sample_overlaps(parted_pairs, gt_nums, dt_nums, 4), overlaps):
+        # the dense rotated overlaps are float32 on the GPU, the sparse ones float64 on the CPU
+        np.testing.assert_allclose(sparse, dense, rtol=0, atol=1e-3)
+
+
+@pytest.mark.parametrize('metric', [0, 1, 2])
+def test_compact_overlaps_equal_dense(synthetic_annos, metric):
+    gt_annos, dt_annos = synthetic_annos
+    gt_annos = [{key: value[anno['name'] != 'DontCare'] for key, value in anno.items()} for anno in gt_annos]
+    overlaps, _, gt_nums, dt_nums = calculate_iou_partly(gt_annos, dt_annos, metric, num_part=4)
+    parted_pairs, compact_gt_nums, compact_dt_nums = calculate_iou_compact(gt_annos, dt_annos, metric, num_part=4)
+    np.testing.assert_array_equal(compact_gt_nums, gt_nums)
+    np.testing.assert_array_equal(compact_dt_nums, dt_nums)
+    for pair_nums, rows, cols, vals in parted_pairs:
+        assert pair_nums.dtype == np.int64 and rows.dtype == np.int32 and cols.dtype == np.int32
+        assert vals.dtype == (np.float64 if metric == 0 else np.float32)
+        assert np.all(vals != 0)
+    # the same kernels, so the overlaps are exactly the same
+    for compact, dense in zip(_sample_overlaps(parted_pairs, gt_nums, dt_nums, 4), overlaps):
+        np.testing.assert_array_equal(compact, dense)
+
+
+def test_sparse_results_equal_dense(synthetic_annos, dense_results):
+    gt_annos, dt_annos = synthetic_annos
+    _, sparse = get_official_eval_result(gt_annos, dt_annos, [0, 1, 2], sparse_overlap=True, return_dict=True)
+    assert sparse == dense_results
+
+
+def test_compact_results_equal_dense(synthetic_annos, dense_results):
+    gt_annos, dt_annos = synthetic_annos
+    _, compact = get_official_eval_result(gt_annos, dt_annos, [0, 1, 2], compact_overlap=True, return_dict=True)
+    assert compact == dense_results